@@ -0,0 +1,226 @@
+# Benchmarks for proposal_generator.py
+#
+# Generates synthetic csv files with valid account addresses and measures how the stages
+# of the proposal generator scale with the number of rows and the number of releases.
+# For every stage the time, the throughput and the peak RSS are reported. Each measurement
+# runs in a fresh process, so that the peak RSS belongs to that stage (including its input).
+#
+# Results can be saved as a baseline and later runs compared against it, e.g.:
+# "python benchmark_proposal_generator.py --save-baseline baseline.json"
+# "python benchmark_proposal_generator.py --compare baseline.json"
+#
+# This script requires the same packages as proposal_generator.py
+import sys
+import os
+import json
+import random
+import argparse
+import platform
+import tempfile
+from time import perf_counter
+from datetime import datetime,date,time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dateutil.relativedelta import relativedelta
+from base58 import b58encode_check
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from proposal_generator import *
+
+# Number of distinct sender accounts in the synthetic files
+NUM_SENDERS:int = 5
+
+# Returns a random valid account address
+def random_address(rng:random.Random) -> str:
+	return b58encode_check(bytes([AddressValidator.version_byte]) + bytes(rng.getrandbits(8) for _ in range(AddressValidator.address_length))).decode()
+
+# Returns a random amount string in GTU with thousands separators
+def random_amount(rng:random.Random) -> str:
+	return f"{rng.randrange(1, 10**7):,}.{rng.randrange(0, 10**6):06}"
+
+# Write a synthetic csv file with num_rows transfers. Few senders send to many receivers, as in real distributions.
+def write_synthetic_csv(filename:str, num_rows:int, seed:int = 0):
+	rng = random.Random(seed)
+	senders = [random_address(rng) for _ in range(NUM_SENDERS)]
+	with open(filename, 'w', encoding='utf-8') as csvfile:
+		for _ in range(num_rows):
+			csvfile.write(f'{rng.choice(senders)},{random_address(rng)},"{random_amount(rng)}","{random_amount(rng)}"\n')
+
+# Returns the peak RSS of the current process in kilobytes. The resource module only exists on POSIX systems,
+# elsewhere the peak working set is taken from psutil if it is installed, and None is returned if neither is available.
+def peak_rss_kb() -> Optional[int]:
+	try:
+		import resource
+	except ImportError:
+		try:
+			import psutil
+		except ImportError:
+			return None
+		memory = psutil.Process().memory_info()
+		# peak_wset is the peak working set on Windows, other platforms only report the current RSS
+		return getattr(memory, "peak_wset", memory.rss) // 1024
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is in bytes on macOS and in kilobytes on Linux
+	return peak // 1024 if sys.platform == "darwin" else peak
+
+# Format a peak RSS in kilobytes as MiB, or as "n/a" if it could not be measured
+def format_rss(peak_kb:Optional[int]) -> str:
+	return "n/a" if peak_kb is None else f"{peak_kb / 1024:.1f} MiB"
+
+# Returns a release schedule with num_releases releases, none of which are skipped
+def benchmark_schedule(num_releases:int) -> Tuple[List[datetime], int]:
+	earliest_release_time = datetime.combine(date.today(), time.fromisoformat("14:00:00+01:00"))
+	return build_release_schedule(
+		earliest_release_time + relativedelta(days = +1),
+		earliest_release_time + relativedelta(days = +2),
+		earliest_release_time,
+		num_releases)
+
+# The stages are run in a worker process. Each stage prepares its input, which is not timed, and returns
+# a function that runs the stage and returns the number of items processed.
+
+def stage_csv_to_list(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+	return lambda: len(csv_to_list(csv_file, False, '.', ',', ','))
+
+# Same as csv_to_list, reading the file through a memory map as with --mmap
+def stage_csv_to_list_mmap(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+	return lambda: len(csv_to_list(csv_file, False, '.', ',', ',', True))
+
+def stage_from_string(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+	amounts = [amount for row_number, row_data in read_csv_rows(csv_file, ',') for amount in row_data[2:]]
+	def run():
+		for amount in amounts:
+			TransferAmount.from_string(amount, '.', ',')
+		return len(amounts)
+	return run
+
+def stage_build_release_schedule(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+	# the schedule is built once per run, so it is measured per call
+	repetitions = 1000
+	def run():
+		for _ in range(repetitions):
+			benchmark_schedule(num_releases)
+		return repetitions
+	return run
+
+def stage_amounts_to_scheduled_list(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+	transfers = csv_to_list(csv_file, False, '.', ',', ',')
+	(_, skipped_releases) = benchmark_schedule(num_releases)
+	def run():
+		for transfer in transfers:
+			amounts_to_scheduled_list(transfer["initial_amount"], transfer["remaining_amount"], num_releases, skipped_releases)
+		return len(transfers)
+	return run
+
+# Writing is limited to max_files pre-proposals, since writing millions of files mostly measures the file system
+def write_stage(serializer:str) -> Callable[..., Callable[[], int]]:
+	def stage(csv_file:str, num_releases:int, max_files:int, out_dir:str) -> Callable[[], int]:
+		transfers = csv_to_list(csv_file, False, '.', ',', ',')[:max_files]
+		(release_times, skipped_releases) = benchmark_schedule(num_releases)
+		scheduled = list(schedule_transfers(transfers, False, num_releases, skipped_releases))
+		expiry = datetime.now() + relativedelta(hours = +2)
+		json_output_prefix = os.path.join(out_dir, "pre-proposal_benchmark_")
+		def run():
+			pre_proposals = build_pre_proposals(scheduled, release_timestamps(release_times), expiry, serializer == "template")
+			write_pre_proposals(pre_proposals, json_output_prefix, file_number_width(len(scheduled)), False)
+			return len(scheduled)
+		return run
+	return stage
+
+# All stages, in the order of the generator pipeline
+STAGES:Dict[str, Callable[..., Callable[[], int]]] = {
+	"csv_to_list" : stage_csv_to_list,
+	"csv_to_list_mmap" : stage_csv_to_list_mmap,
+	"from_string" : stage_from_string,
+	"build_release_schedule" : stage_build_release_schedule,
+	"amounts_to_scheduled_list" : stage_amounts_to_scheduled_list,
+	"write_json" : write_stage("json"),
+	"write_template" : write_stage("template")
+}
+
+# Run a single stage and return its measurement. This is run in a fresh worker process.
+def measure(stage:str, csv_file:str, num_rows:int, num_releases:int, max_files:int) -> Dict[str, Any]:
+	with tempfile.TemporaryDirectory() as out_dir:
+		run = STAGES[stage](csv_file, num_releases, max_files, out_dir)
+		start = perf_counter()
+		items = run()
+		seconds = perf_counter() - start
+	return {
+		"stage" : stage,
+		"rows" : num_rows,
+		"num_releases" : num_releases,
+		"items" : items,
+		"seconds" : seconds,
+		"items_per_second" : items / seconds if seconds > 0 else float("inf"),
+		"peak_rss_kb" : peak_rss_kb()
+	}
+
+# Run all selected stages for all row counts and numbers of releases
+def run_benchmarks(row_counts:List[int], release_counts:List[int], stages:List[str], max_files:int) -> List[Dict[str, Any]]:
+	results = []
+	with tempfile.TemporaryDirectory() as csv_dir:
+		for num_rows in row_counts:
+			csv_file = os.path.join(csv_dir, f"benchmark_{num_rows}.csv")
+			write_synthetic_csv(csv_file, num_rows)
+			for num_releases in release_counts:
+				for stage in stages:
+					# a new process per measurement, so that the peak RSS is not inherited from earlier stages
+					with ProcessPoolExecutor(max_workers=1) as executor:
+						result = executor.submit(measure, stage, csv_file, num_rows, num_releases, max_files).result()
+					print(f"{stage:<28}{num_rows:>10} rows{num_releases:>5} releases{result['items_per_second']:>16,.0f} items/s"\
+						f"{result['seconds']:>10.3f} s{format_rss(result['peak_rss_kb']):>14}")
+					results.append(result)
+	return results
+
+# Compare results with a baseline. Returns the list of regressions, i.e., measurements whose
+# throughput is lower than tolerance allows.
+def compare_with_baseline(results:List[Dict[str, Any]], baseline:List[Dict[str, Any]], tolerance:float) -> List[str]:
+	baseline_by_key = {(result["stage"], result["rows"], result["num_releases"]) : result for result in baseline}
+	regressions = []
+	for result in results:
+		key = (result["stage"], result["rows"], result["num_releases"])
+		if key not in baseline_by_key:
+			continue
+		old = baseline_by_key[key]
+		ratio = result["items_per_second"] / old["items_per_second"]
+		rss_ratio = "n/a" if result["peak_rss_kb"] is None or not old["peak_rss_kb"] else f"x{result['peak_rss_kb'] / old['peak_rss_kb']:.2f}"
+		print(f"{key[0]:<28}{key[1]:>10} rows{key[2]:>5} releases   throughput x{ratio:.2f}   peak RSS {rss_ratio}")
+		if ratio < 1 - tolerance:
+			regressions.append(f"{key[0]} with {key[1]} rows and {key[2]} releases: {ratio:.2f} times the baseline throughput")
+	return regressions
+
+# Main function
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the stages of proposal_generator.py on synthetic csv files.")
+	parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000], help="Numbers of rows to benchmark (default: 1000 100000 1000000).")
+	parser.add_argument("--num-releases", type=int, nargs="+", default=[10], help="Numbers of releases to benchmark (default: 10).")
+	parser.add_argument("--stages", choices=list(STAGES), nargs="+", default=list(STAGES), help="Stages to benchmark (default: all).")
+	parser.add_argument("--max-files", type=int, default=10000, help="Maximal number of files written by the write stages (default: 10000).")
+	parser.add_argument("--save-baseline", metavar="FILE", help="Save the results as json to FILE.")
+	parser.add_argument("--compare", metavar="FILE", help="Compare the results with a baseline saved with --save-baseline.")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative throughput loss compared to the baseline (default: 0.2).")
+	args = parser.parse_args()
+
+	results = run_benchmarks(args.rows, args.num_releases, args.stages, args.max_files)
+
+	if args.save_baseline:
+		with open(args.save_baseline, 'w') as baseline_file:
+			json.dump({
+				"created" : datetime.now().isoformat(),
+				"python" : platform.python_version(),
+				"platform" : platform.platform(),
+				"results" : results
+			}, baseline_file, indent=4)
+
+	if args.compare:
+		with open(args.compare) as baseline_file:
+			baseline = json.load(baseline_file)["results"]
+		regressions = compare_with_baseline(results, baseline, args.tolerance)
+		if regressions:
+			print("Regressions:")
+			for regression in regressions:
+				print(f"  {regression}")
+			sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -1,4 +1,5 @@
 # This script allows to generate proposals from a csv file exported from Excel.
+# Excel workbooks (.xlsx) can also be read directly, which avoids the locale-dependent formatting of the export.
 #
 # This script requires python 3.6 or above
 #
@@ -6,18 +7,28 @@
 # "pip install python-dateutil"
 # "pip install base58"
 #
+# Only light modules are imported when the script starts, so that --help, argument errors and small runs are fast.
+# Modules like json, csv, decimal, dateutil and base58 are imported by the functions that use them.
+#
+# The script can also be imported as a library, see generate_pre_proposals. It then never prints or exits, and
+# caches like the address cache stay warm between calls.
+#
 # Version 0.2.0
 import sys
-import json
-import csv
+import io
 import os
-import re
 import argparse
-from decimal import *
-from datetime import datetime,date,time
-from typing import Any, Dict, List, Tuple
-from dateutil.relativedelta import relativedelta
-from base58 import b58decode_check
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime,date,time,timedelta
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from time import perf_counter, process_time, sleep
+from functools import lru_cache, partial
+from typing import IO, TYPE_CHECKING, Any, Callable, Container, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+if TYPE_CHECKING:
+	from concurrent.futures import Executor
+	from decimal import Decimal
 
 def get_config() -> Dict[str, Any]:
 	return {
@@ -31,13 +42,77 @@ def get_config() -> Dict[str, Any]:
 	}
 
 
+# Number of csv rows handed to a worker process at a time when generating in parallel
+PARALLEL_CHUNK_SIZE:int = 1000
+
+# Maximal number of addresses for which the validation result is cached
+ADDRESS_CACHE_SIZE:int = 4096
+
+# Size in bytes of the parts of a memory-mapped csv file that are decoded at a time (see --mmap)
+MMAP_CHUNK_SIZE:int = 1 << 22
+
+# Maximal number of duplicate transfers listed in the error message of --duplicates reject
+MAX_REPORTED_DUPLICATES:int = 10
+
+# Maximal number of releases of a scheduled transfer, since the length of the schedule is a single byte in the payload.
+# Longer schedules are split into several pre-proposals (see --max-releases).
+MAX_SCHEDULE_LENGTH:int = 255
+
+# Maximal number of serialized pre-proposals waiting for a writer thread (see --writer-threads)
+WRITER_QUEUE_SIZE:int = 256
+
+# Number of files a writer thread keeps open before syncing them to disk together (see --fsync)
+FSYNC_BATCH_SIZE:int = 64
+
+# Default maximal number of row errors kept in the report of --validate-only (see --max-errors)
+DEFAULT_MAX_ERRORS:int = 100
+
+# Seconds between two scans of the folder watched by --watch (see --poll-interval)
+WATCH_POLL_INTERVAL:float = 2.0
+
+# Number of recently processed files listed, and whose latency is averaged, in the status file of --watch
+WATCH_RECENT_FILES:int = 20
+
+# Subfolder of the folder watched by --watch into which files that could not be processed are moved
+WATCH_FAILED_FOLDER:str = "failed"
+
+# Pre-proposals of a previous run are only reused by --resume if they are valid for at least this many more minutes
+RESUME_MIN_VALIDITY_MINUTES:int = 30
+
+# Raised when a pre-proposal file could not be written
+class WriteError(IOError):
+	def __init__(self, path: str):
+		super().__init__(f"Error writing file \"{path}\".")
+		# not stored as filename, which would make str() format the error like an OSError with an errno
+		self.path = path
+
+# Raised when a csv file could not be read
+class ReadError(IOError):
+	def __init__(self, path: str, reason: str):
+		super().__init__(f"Error reading file \"{path}\": {reason}")
+		self.path = path
+
+# Raised by generate_pre_proposals if rows are invalid. report is the ValidationReport of all rows.
+class InvalidRowsError(ValueError):
+	def __init__(self, report: 'ValidationReport'):
+		message = f"{report.invalid_rows} of {report.rows} rows are invalid."
+		if report.errors:
+			message += f" {report.errors[0]}"
+		super().__init__(message)
+		self.report = report
+
 # Class for storing transfer amounts. The amounts are internally stored in microGTU
 class TransferAmount:
+	# Only the amount is stored per instance, without a __dict__
+	__slots__ = ("amount",)
 	#max amount in microGTU
 	max_amount:int = 18446744073709551615
-	#regex for valid amount strings using '.' as decimal separator and ',' as thousands separator
-	amount_regex:str = r"^[0-9]+([.][0-9]{1,6})?$"
-	amount_regex_with_1000_sep:str = r"^[0-9]{1,3}([,][0-9]{3})*([.][0-9]{1,6})?$"
+	# Number of microGTU in one GTU
+	micro_gtu_per_gtu:int = 1000000
+	# Maximal number of digits after the decimal separator
+	max_decimals:int = 6
+	# Number of digits of max_amount in GTU; longer integer parts are always out of range
+	max_integer_digits:int = len(str(max_amount // micro_gtu_per_gtu))
 
 	# Creates a TransferAmount with amount microGTU
 	def __init__(self, amount: int) -> None:
@@ -45,24 +120,55 @@ class TransferAmount:
 			raise ValueError(f"Amount {amount} not in valid range (0,{self.max_amount}]")
 		self.amount = amount
 
+	# Converts an amount string that represents an amount in GTU into microGTU, validating it in the same pass.
+	# Valid strings, after stripping whitespace, consist of an integer part of ASCII digits, optionally
+	# grouped by thousands_sep into groups of three digits after the first group of one to three digits,
+	# optionally followed by decimal_sep and one to six digits.
+	# This only checks the format; the range is checked when creating a TransferAmount.
+	@classmethod
+	def parse_micro_gtu(cls, amount_string:str, decimal_sep:str, thousands_sep:str) -> int:
+		amount_string = amount_string.strip()
+		(integer_part, has_fraction, fraction) = amount_string.partition(decimal_sep)
+		if thousands_sep in integer_part:
+			groups = integer_part.split(thousands_sep)
+			valid = 1 <= len(groups[0]) <= 3 and all(len(group) == 3 for group in groups[1:])
+			integer_part = "".join(groups)
+		else:
+			valid = len(integer_part) > 0
+		if has_fraction:
+			valid = valid and 1 <= len(fraction) <= cls.max_decimals and fraction.isdigit() and fraction.isascii()
+		# isdigit also accepts non-ASCII digits, which are not allowed
+		if not valid or not integer_part.isdigit() or not integer_part.isascii():
+			raise ValueError(f"\"{amount_string}\" is not a valid amount string.")
+
+		if len(integer_part.lstrip('0')) > cls.max_integer_digits:
+			raise ValueError(f"Amount \"{amount_string}\" not in valid range (0,{cls.max_amount}] microGTU")
+		amount = int(integer_part) * cls.micro_gtu_per_gtu
+		if fraction:
+			amount += int(fraction.ljust(cls.max_decimals, '0'))
+		return amount
+
 	# Creates a TransferAmount from an amount string that represents an amount in GTU. 
-	# The string must valid, i.e., satisfy amount_regex or amount_regex_with_1000_sep.
+	# The string must valid, see parse_micro_gtu.
 	@classmethod
 	def from_string(cls, amount_string:str, decimal_sep:str, thousands_sep: str) -> 'TransferAmount':
-		#Convert the separators
-		translation_table = {ord(thousands_sep) : ',', ord(decimal_sep): '.'}
-		amount_string = amount_string.strip()
-		amount_org_string = amount_string
-		#Check validity of amount string
-		if not bool(re.match(cls.amount_regex, amount_string)) and not bool(re.match(cls.amount_regex_with_1000_sep, amount_string)):
-			raise ValueError(f"\"{amount_org_string}\" is not a valid amount string.")
-		amount_string = amount_string.replace(',', '')
-		#Convert to microGTU
-		try: 
-			amount = int(Decimal(amount_string) * 1000000)
-		except: #this should not happen
-			raise ValueError("Amount string \"{amount_org_string}\" could not be converted.")
-		return TransferAmount(amount)
+		return TransferAmount(cls.parse_micro_gtu(amount_string, decimal_sep, thousands_sep))
+
+	# Converts a whole column of amount strings into microGTU amounts.
+	# Raises a ValueError for the first invalid or out of range amount, stating its position in the column.
+	@classmethod
+	def parse_column(cls, amount_strings:Iterable[str], decimal_sep:str, thousands_sep:str) -> List[int]:
+		parse = cls.parse_micro_gtu
+		amounts = []
+		for position, amount_string in enumerate(amount_strings):
+			try:
+				amount = parse(amount_string, decimal_sep, thousands_sep)
+			except ValueError as error:
+				raise ValueError(f"At position {position}: {error}")
+			if amount <= 0 or amount > cls.max_amount:
+				raise ValueError(f"At position {position}: Amount {amount} not in valid range (0,{cls.max_amount}]")
+			amounts.append(amount)
+		return amounts
 
 	# String representation of a TransferAmount
 	def __str__(self):
@@ -81,7 +187,8 @@ class TransferAmount:
 		return TransferAmount(self.amount + y.amount)
 	
 	#returns amount in GTU
-	def get_GTU(self) -> Decimal:
+	def get_GTU(self) -> 'Decimal':
+		from decimal import Decimal
 		return Decimal(self.amount)/Decimal(1000000)
 
 	#returns amount in microGTU
@@ -92,19 +199,74 @@ class TransferAmount:
 	# Each split is computed as floor(self.amount/n) with the exception
 	# of the last which additionally contains the remainder.
 	def split_amount(self,n:int) -> List['TransferAmount']:
-		if n <=0:
+		return AmountSchedule.split(self.amount, n).to_transfer_amounts()
+
+# Compact container for the release amounts of one transfer. The amounts are stored in microGTU,
+# contiguously as unsigned 64 bit integers, so no object is created per release.
+class AmountSchedule:
+	__slots__ = ("amounts",)
+	# array typecode for unsigned 64 bit integers
+	typecode:str = 'Q'
+
+	# Creates a schedule with the given amounts in microGTU
+	def __init__(self, amounts:Iterable[int] = ()) -> None:
+		self.amounts = array(self.typecode, amounts)
+
+	# Split amount into n releases, computed as in TransferAmount.split_amount.
+	@classmethod
+	def split(cls, amount:int, n:int) -> 'AmountSchedule':
+		if n <= 0:
 			raise AssertionError(f"Cannot split into {n} parts")
-		elif n == 1:
-			return [TransferAmount(self.amount)]
+		step_amount = amount // n
+		if n > 1 and step_amount <= 0:
+			raise AssertionError(f"Cannot split {amount} into {n} parts, amount is too small")
+		schedule = cls()
+		schedule.amounts = array(cls.typecode, [step_amount]) * (n-1)
+		schedule.amounts.append(amount - (n-1)*step_amount)
+		return schedule
+
+	# Returns the schedule of a transfer, consisting of initial_amount followed by remaining_amount split
+	# into num_releases-1 releases, where the first skipped_releases of those are added to the initial release.
+	# All amounts are in microGTU.
+	@classmethod
+	def for_transfer(cls, initial_amount:int, remaining_amount:int, num_releases:int, skipped_releases:int) -> 'AmountSchedule':
+		if skipped_releases >= num_releases:
+			raise ValueError("The number of skipped releases must be less than total number of releases.")
+		schedule = cls.split(remaining_amount, num_releases - 1)
+		# the skipped releases are the first ones, which all have the step amount, unless all releases are skipped
+		if skipped_releases == num_releases - 1:
+			initial_amount += remaining_amount
 		else:
-			step_amount = self.amount // n
-			last_amount = self.amount - (n-1)*step_amount
-			if step_amount <= 0:
-				raise AssertionError(f"Cannot split {self.amount} into {n} parts, amount is too small")
-			amount_list = [TransferAmount(step_amount) for _ in range(n-1)]
-			amount_list.append(TransferAmount(last_amount))
-			return amount_list
-		
+			initial_amount += schedule.amounts[0] * skipped_releases
+		if initial_amount > TransferAmount.max_amount:
+			raise ValueError(f"Amount {initial_amount} not in valid range (0,{TransferAmount.max_amount}]")
+		del schedule.amounts[:skipped_releases]
+		schedule.amounts.insert(0, initial_amount)
+		return schedule
+
+	# Returns the amounts as list of TransferAmounts
+	def to_transfer_amounts(self) -> List[TransferAmount]:
+		return [TransferAmount(amount) for amount in self.amounts]
+
+	# Returns the sum of all amounts in microGTU
+	def total(self) -> int:
+		return sum(self.amounts)
+
+	def __len__(self) -> int:
+		return len(self.amounts)
+
+	def __getitem__(self, index:int) -> int:
+		return self.amounts[index]
+
+	def __iter__(self) -> Iterator[int]:
+		return iter(self.amounts)
+
+	def __eq__(self, other:'AmountSchedule'):
+		return self.amounts == other.amounts
+
+	def __repr__(self):
+		return f"AmountSchedule({self.amounts.tolist()})"
+
 # Class for generating scheduled pre-proposals and saving them as json files.
 # A pre-proposal is a proposal with empty nonce, energy and fee amounts.
 # The desktop wallet can convert them to proper proposals.
@@ -130,72 +292,921 @@ class ScheduledPreProposal:
 
 	# Add a release to the schedule.
 	def add_release(self, amount: TransferAmount, release_time: datetime):
+		self.add_release_micro_gtu(amount.get_micro_GTU(), release_time)
+
+	# Replace the schedule by releases pairing amounts (in microGTU) with timestamps (in milliseconds),
+	# e.g., a table computed once by release_timestamps.
+	def set_schedule(self, amounts: Iterable[int], timestamps: Sequence[int]):
+		self.data["payload"]["schedule"] = [{"amount": amount, "timestamp": timestamp} for amount, timestamp in zip(amounts, timestamps)]
+
+	# Add a release of amount microGTU to the schedule.
+	def add_release_micro_gtu(self, amount: int, release_time: datetime):
 		release = {
-			"amount": amount.get_micro_GTU(),
+			"amount": amount,
 			"timestamp": int(release_time.timestamp()) * 1000 # multiply by 1000 since timestamps here are in milliseconds
 		} 
 		self.data["payload"]["schedule"].append(release)
 
 	# Write pre-proposal to json file with given filename.
-	def write_json(self, filename: str):
+	# If compact is set, the json is written on a single line without whitespace.
+	def write_json(self, filename: str, compact: bool = False):
+		import json
 		with open(filename, 'w') as outFile:
-			json.dump(self.data, outFile, indent=4)
+			if compact:
+				json.dump(self.data, outFile, separators=(',', ':'))
+			else:
+				json.dump(self.data, outFile, indent=4)
 
+	# Returns the pre-proposal as json string, formatted as by write_json.
+	def to_json(self, compact: bool = False) -> str:
+		import json
+		if compact:
+			return json.dumps(self.data, separators=(',', ':'))
+		return json.dumps(self.data, indent=4)
 
-# Read csv file and return a list with one entry for each row in csv.
-def csv_to_list(filename:str, is_welcome:bool, decimal_sep:str, thousands_sep:str, csv_delimiter:str) -> List[Any]:
+# Serializer for pre-proposals that share expiry and release timestamps, i.e., all pre-proposals of a run.
+# The parts that are the same for every pre-proposal, including the timestamps of the releases, are rendered
+# once by the json module. Only sender, receiver and the release amounts are spliced in per pre-proposal.
+# The output is identical to that of ScheduledPreProposal.write_json and to_json.
+class PreProposalTemplate:
+	sender_placeholder:str = "@sender@"
+	receiver_placeholder:str = "@receiver@"
+	schedule_placeholder:str = "@schedule@"
+	indent:int = 4
+
+	def __init__(self, expiry: datetime, timestamps: Sequence[int]):
+		self.num_releases = len(timestamps)
+		self.parts = {compact: self.__render_parts(expiry, timestamps, compact) for compact in (False, True)}
+
+	# Render the fixed parts of a pre-proposal as tuple (head, middle, before_schedule, tail, release_parts, schedule_end),
+	# where release_parts contains the text before and after the amount of each release.
+	def __render_parts(self, expiry: datetime, timestamps: Sequence[int], compact: bool) -> Tuple[Any, ...]:
+		import json
+		pre_proposal = ScheduledPreProposal(self.sender_placeholder, self.receiver_placeholder, expiry)
+		pre_proposal.data["payload"]["schedule"] = self.schedule_placeholder
+		rendered = pre_proposal.to_json(compact)
+		(head, _, rest) = rendered.partition(json.dumps(self.sender_placeholder))
+		(middle, _, rest) = rest.partition(json.dumps(self.receiver_placeholder))
+		(before_schedule, _, tail) = rest.partition(json.dumps(self.schedule_placeholder))
+
+		if compact:
+			release_parts = [('{"amount":', f',"timestamp":{timestamp}}}') for timestamp in timestamps]
+			schedule_end = "]"
+		else:
+			# indentation of the line containing the schedule, and of the releases and their fields
+			line = before_schedule.rpartition("\n")[2]
+			base = line[:len(line) - len(line.lstrip())]
+			release_indent = base + " " * self.indent
+			field_indent = release_indent + " " * self.indent
+			release_parts = [(f'\n{release_indent}{{\n{field_indent}"amount": ', f',\n{field_indent}"timestamp": {timestamp}\n{release_indent}}}') for timestamp in timestamps]
+			schedule_end = f"\n{base}]"
+		return (head, middle, before_schedule, tail, release_parts, schedule_end)
+
+	# Returns the parts of the pre-proposal of a single transfer, which concatenated give its json
+	def iter_parts(self, sender_address: str, receiver_address: str, amounts: Sequence[int], compact: bool = False) -> Iterator[str]:
+		import json
+		(head, middle, before_schedule, tail, release_parts, schedule_end) = self.parts[compact]
+		yield head
+		yield json.dumps(sender_address)
+		yield middle
+		yield json.dumps(receiver_address)
+		yield before_schedule
+		if len(amounts) == 0:
+			yield "[]"
+		else:
+			yield "["
+			yield ",".join([before + str(amount) + after for (before, after), amount in zip(release_parts, amounts)])
+			yield schedule_end
+		yield tail
+
+	# Returns the json of the pre-proposal of a single transfer
+	def render(self, sender_address: str, receiver_address: str, amounts: Sequence[int], compact: bool = False) -> str:
+		return "".join(self.iter_parts(sender_address, receiver_address, amounts, compact))
+
+	# Write the json of the pre-proposal of a single transfer to an open (buffered) file
+	def write(self, out_file: IO[str], sender_address: str, receiver_address: str, amounts: Sequence[int], compact: bool = False):
+		out_file.writelines(self.iter_parts(sender_address, receiver_address, amounts, compact))
+
+# Returns the template for the given expiry and timestamps. Templates are cached, so that each
+# worker process renders the template of a run only once.
+@lru_cache(maxsize=8)
+def get_pre_proposal_template(expiry: datetime, timestamps: Tuple[int, ...]) -> PreProposalTemplate:
+	return PreProposalTemplate(expiry, timestamps)
+
+# Pre-proposal that is serialized by a PreProposalTemplate. It can be written like a ScheduledPreProposal,
+# but does not build the nested dictionary.
+class TemplatePreProposal:
+	__slots__ = ("template", "sender_address", "receiver_address", "amounts")
+
+	def __init__(self, template: PreProposalTemplate, sender_address: str, receiver_address: str, amounts: Sequence[int]):
+		self.template = template
+		self.sender_address = sender_address
+		self.receiver_address = receiver_address
+		self.amounts = amounts
+
+	# Write pre-proposal to json file with given filename, as ScheduledPreProposal.write_json.
+	def write_json(self, filename: str, compact: bool = False):
+		with open(filename, 'w') as outFile:
+			self.template.write(outFile, self.sender_address, self.receiver_address, self.amounts, compact)
+
+	# Returns the pre-proposal as json string, as ScheduledPreProposal.to_json.
+	def to_json(self, compact: bool = False) -> str:
+		return self.template.render(self.sender_address, self.receiver_address, self.amounts, compact)
+
+# The pre-proposals of a transfer whose schedule was split into parts of consecutive releases (see --max-releases).
+# Each part is written to its own file, see output_parts.
+class SplitPreProposal:
+	__slots__ = ("parts",)
+
+	def __init__(self, parts: List[Union[ScheduledPreProposal, TemplatePreProposal]]):
+		self.parts = parts
+
+# Returns the size in bytes of the payload of a scheduled transfer with num_releases releases:
+# the transaction kind, the receiver address, the length of the schedule and 16 bytes per release.
+def scheduled_transfer_payload_size(num_releases:int) -> int:
+	return 1 + 32 + 1 + 16 * num_releases
+
+# Returns the maximal number of releases of a pre-proposal with at most max_releases releases and a payload of
+# at most max_bytes bytes. Raises a ValueError if not even a single release fits.
+def releases_per_pre_proposal(max_releases:int = MAX_SCHEDULE_LENGTH, max_bytes:Optional[int] = None) -> int:
+	if max_releases < 1 or max_releases > MAX_SCHEDULE_LENGTH:
+		raise ValueError(f"The maximal number of releases must be between 1 and {MAX_SCHEDULE_LENGTH}.")
+	if max_bytes is not None:
+		max_releases = min(max_releases, (max_bytes - scheduled_transfer_payload_size(0)) // 16)
+		if max_releases < 1:
+			raise ValueError(f"A payload with a single release needs {scheduled_transfer_payload_size(1)} bytes.")
+	return max_releases
+
+# Returns the number of pre-proposals for a schedule with num_releases releases, see make_pre_proposals
+def num_parts(num_releases:int, max_releases:Optional[int]) -> int:
+	if max_releases is None or num_releases <= max_releases:
+		return 1
+	return -(-num_releases // max_releases)
+
+# Base class for bundles that collect all pre-proposals of a run in a single file, written in one pass.
+# The bundle is written to a temporary file that is only renamed to its final name when the bundle
+# is closed, so an incomplete bundle is never left behind under that name.
+# Subclasses must implement add and _close_file, otherwise they cannot be instantiated.
+class PreProposalBundle(ABC):
+	extension: str = ""
+	# whether the entries must be compact json, regardless of --compact
+	requires_compact: bool = False
+
+	def __init__(self, filename: str):
+		self.filename = filename
+		self.temp_filename = filename + ".tmp"
+
+	# Add the json content of a pre-proposal under the given file name.
+	@abstractmethod
+	def add(self, name: str, content: str):
+		pass
+
+	# Close the underlying file.
+	@abstractmethod
+	def _close_file(self):
+		pass
+
+	# Finish the bundle and move it to its final name.
+	def close(self):
+		self._close_file()
+		os.replace(self.temp_filename, self.filename)
+
+	# Discard the bundle.
+	def abort(self):
+		self._close_file()
+		if os.path.exists(self.temp_filename):
+			os.remove(self.temp_filename)
+
+	def __enter__(self) -> 'PreProposalBundle':
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self.abort()
+
+# Bundle with one compact pre-proposal per line (JSON Lines). Entries are in the order of the transfers.
+class JsonLinesBundle(PreProposalBundle):
+	extension: str = ".jsonl"
+	requires_compact: bool = True
+
+	def __init__(self, filename: str):
+		super().__init__(filename)
+		self.file = open(self.temp_filename, 'w', encoding='utf-8')
+
+	def add(self, name: str, content: str):
+		self.file.write(content)
+		self.file.write("\n")
+
+	def _close_file(self):
+		self.file.close()
+
+# Zip archive with one json file per pre-proposal.
+class ZipBundle(PreProposalBundle):
+	extension: str = ".zip"
+
+	def __init__(self, filename: str):
+		import zipfile
+		super().__init__(filename)
+		self.archive = zipfile.ZipFile(self.temp_filename, 'w', compression=zipfile.ZIP_DEFLATED)
+
+	def add(self, name: str, content: str):
+		self.archive.writestr(name, content)
+
+	def _close_file(self):
+		self.archive.close()
+
+# Uncompressed tar archive with one json file per pre-proposal.
+class TarBundle(PreProposalBundle):
+	extension: str = ".tar"
+
+	def __init__(self, filename: str):
+		import tarfile
+		super().__init__(filename)
+		self.archive = tarfile.open(self.temp_filename, 'w')
+
+	def add(self, name: str, content: str):
+		import tarfile
+		data = content.encode('utf-8')
+		info = tarfile.TarInfo(name)
+		info.size = len(data)
+		info.mtime = int(datetime.now().timestamp())
+		self.archive.addfile(info, io.BytesIO(data))
+
+	def _close_file(self):
+		self.archive.close()
+
+# Supported values of --output-format, mapped to the bundle class (None for one json file per transfer)
+OUTPUT_FORMATS = {
+	"json" : None,
+	"jsonl" : JsonLinesBundle,
+	"zip" : ZipBundle,
+	"tar" : TarBundle
+}
+
+# Writes json files with a pool of threads, so that the latency of opening, writing and closing files, e.g., on a
+# network drive, overlaps with generating the next pre-proposals. Files are handed to the threads by a bounded queue,
+# so submitting blocks while the threads are behind, and at most WRITER_QUEUE_SIZE pre-proposals wait in memory.
+# If sync is set, every thread syncs its files to disk in batches of FSYNC_BATCH_SIZE, and the folders are synced
+# when the writer is closed.
+class FileWriter:
+	def __init__(self, threads:int, sync:bool = False, queue_size:int = WRITER_QUEUE_SIZE) -> None:
+		import queue
+		import threading
+		self.sync = sync
+		self.queue:'queue.Queue[Optional[Tuple[str, str]]]' = queue.Queue(maxsize=queue_size)
+		# name of the first file that could not be written
+		self.failed_file:Optional[str] = None
+		self.folders:set = set()
+		self.written = 0
+		self.lock = threading.Lock()
+		# the threads are started by the first submit, i.e., after worker processes have been forked
+		self.threads = [threading.Thread(target=self.__work, daemon=True) for _ in range(threads)]
+		self.started = False
+
+	# Queue content to be written to the file filename. Raises a WriteError if a file could not be written.
+	def submit(self, filename:str, content:str):
+		if self.failed_file is not None:
+			raise WriteError(self.failed_file)
+		if not self.started:
+			self.started = True
+			for thread in self.threads:
+				thread.start()
+		self.queue.put((filename, content))
+
+	# Write the files of the queue until None is taken from it
+	def __work(self):
+		pending:List[IO[str]] = []
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			if self.failed_file is not None:
+				# drain the queue after an error, so that submit does not block
+				continue
+			(filename, content) = item
+			try:
+				out_file = open(filename, 'w')
+				try:
+					out_file.write(content)
+				finally:
+					if self.sync:
+						pending.append(out_file)
+					else:
+						out_file.close()
+				if len(pending) >= FSYNC_BATCH_SIZE:
+					self.__sync_files(pending)
+				with self.lock:
+					self.written += 1
+					self.folders.add(os.path.dirname(os.path.abspath(filename)))
+			except Exception:
+				# any error is reported by submit or close, and the thread keeps draining the queue
+				with self.lock:
+					if self.failed_file is None:
+						self.failed_file = filename
+		try:
+			self.__sync_files(pending)
+		except IOError:
+			with self.lock:
+				if self.failed_file is None:
+					self.failed_file = pending[0].name
+
+	# Flush the files to disk and close them. All are closed, even if one cannot be synced.
+	@staticmethod
+	def __sync_files(files:List[IO[str]]):
+		try:
+			for out_file in files:
+				out_file.flush()
+				os.fsync(out_file.fileno())
+		finally:
+			for out_file in files:
+				out_file.close()
+			files.clear()
+
+	# Stop the threads after all queued files have been written
+	def __stop(self):
+		if not self.started:
+			self.threads = []
+		for _ in self.threads:
+			self.queue.put(None)
+		for thread in self.threads:
+			thread.join()
+		self.threads = []
+
+	# Wait until all files have been written, and sync their folders if sync is set.
+	# Raises a WriteError if a file could not be written.
+	def close(self):
+		self.__stop()
+		if self.failed_file is not None:
+			raise WriteError(self.failed_file)
+		if self.sync:
+			for folder in sorted(self.folders):
+				sync_folder(folder)
+
+	# Stop writing, e.g., after an error. Files that are still queued are not written.
+	def abort(self):
+		if self.failed_file is None:
+			self.failed_file = ""
+		self.__stop()
+
+# Sync a folder to disk, so that the files created in it are not lost in a crash (only on POSIX systems)
+def sync_folder(folder:str):
+	if os.name != 'posix':
+		return
+	folder_fd = os.open(folder, os.O_RDONLY)
+	try:
+		os.fsync(folder_fd)
+	finally:
+		os.close(folder_fd)
+
+# Returns the name of the marker file of a run, which is written once all files have been written (see write_complete_marker)
+def complete_marker_name(json_output_prefix:str) -> str:
+	return json_output_prefix[:-1] + ".complete"
+
+# Atomically write the marker file of a run, stating that all num_files files have been written. The marker is written
+# to a temporary file that is renamed, so readers either see no marker or a complete one. If sync is set, the marker
+# and its folder are synced to disk.
+def write_complete_marker(json_output_prefix:str, num_transfers:int, num_files:int, sync:bool = False):
+	import json
+	marker_name = complete_marker_name(json_output_prefix)
+	temp_name = marker_name + ".tmp"
+	try:
+		with open(temp_name, 'w') as marker_file:
+			json.dump({"transfers" : num_transfers, "files" : num_files, "completed" : datetime.now().isoformat()}, marker_file)
+			if sync:
+				marker_file.flush()
+				os.fsync(marker_file.fileno())
+		os.replace(temp_name, marker_name)
+		if sync:
+			sync_folder(os.path.dirname(os.path.abspath(marker_name)))
+	except IOError:
+		raise WriteError(marker_name)
+
+# Statistics of one stage of a profiled run. Times are in seconds and exclude the time of nested stages.
+class StageStats:
+	__slots__ = ("wall_time", "cpu_time", "rows", "bytes")
+
+	def __init__(self) -> None:
+		self.wall_time = 0.0
+		self.cpu_time = 0.0
+		self.rows = 0
+		self.bytes = 0
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"wall_time" : self.wall_time,
+			"cpu_time" : self.cpu_time,
+			"rows" : self.rows,
+			"bytes" : self.bytes,
+			"rows_per_second" : self.rows / self.wall_time if self.wall_time > 0 else None
+		}
+
+# Records wall time, CPU time, rows and bytes for the stages of a run (see --profile).
+# Stages can be nested, e.g., when a stage pulls its input from the previous stage of the pipeline.
+# The time of a stage then excludes the time spent in the nested stages, so the times of all stages add up.
+class StageProfiler:
+	enabled:bool = True
+
+	def __init__(self) -> None:
+		self.stages:Dict[str, StageStats] = OrderedDict()
+		# For each running stage: [name, wall start, cpu start, wall time of nested stages, cpu time of nested stages]
+		self.running:List[List[Any]] = []
+		self.start_wall_time = perf_counter()
+		self.start_cpu_time = process_time()
+
+	def start(self, name:str):
+		if name not in self.stages:
+			self.stages[name] = StageStats()
+		self.running.append([name, perf_counter(), process_time(), 0.0, 0.0])
+
+	def stop(self):
+		(name, wall_start, cpu_start, nested_wall, nested_cpu) = self.running.pop()
+		wall_time = perf_counter() - wall_start
+		cpu_time = process_time() - cpu_start
+		stats = self.stages[name]
+		stats.wall_time += wall_time - nested_wall
+		stats.cpu_time += cpu_time - nested_cpu
+		if self.running:
+			self.running[-1][3] += wall_time
+			self.running[-1][4] += cpu_time
+
+	# Context manager measuring the enclosed code as (part of) the given stage
+	def stage(self, name:str) -> 'ProfiledStage':
+		return ProfiledStage(self, name)
+
+	# Yield the items of iterable, measuring the time for producing each item as the given stage and counting the items as rows.
+	def iterate(self, name:str, iterable:Iterable[Any]) -> Iterator[Any]:
+		iterator = iter(iterable)
+		while True:
+			self.start(name)
+			try:
+				item = next(iterator)
+			except StopIteration:
+				return
+			finally:
+				self.stop()
+			self.stages[name].rows += 1
+			yield item
+
+	# Add rows and bytes processed by the given stage
+	def count(self, name:str, rows:int = 0, bytes:int = 0):
+		if name not in self.stages:
+			self.stages[name] = StageStats()
+		self.stages[name].rows += rows
+		self.stages[name].bytes += bytes
+
+	# Returns the report of all stages, with the total wall and CPU time since the profiler was created
+	def report(self) -> Dict[str, Any]:
+		return {
+			"wall_time" : perf_counter() - self.start_wall_time,
+			"cpu_time" : process_time() - self.start_cpu_time,
+			"stages" : {name : stats.to_dict() for name, stats in self.stages.items()}
+		}
+
+# Context manager returned by StageProfiler.stage
+class ProfiledStage:
+	__slots__ = ("profiler", "name")
+
+	def __init__(self, profiler:StageProfiler, name:str) -> None:
+		self.profiler = profiler
+		self.name = name
+
+	def __enter__(self):
+		self.profiler.start(self.name)
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.profiler.stop()
+
+# Profiler used when profiling is disabled. Nothing is measured, and iterables are passed on unchanged.
+class NullProfiler:
+	enabled:bool = False
+
+	def stage(self, name:str) -> ContextManager:
+		return nullcontext()
+
+	def iterate(self, name:str, iterable:Iterable[Any]) -> Iterable[Any]:
+		return iterable
+
+	def count(self, name:str, rows:int = 0, bytes:int = 0):
+		pass
+
+null_profiler = NullProfiler()
+
+
+# Class for validating Concordium account addresses. A valid address is the Base58Check encoding of
+# a version byte followed by 32 bytes. Results are kept in a bounded LRU cache, since the same
+# addresses, in particular the senders, typically appear in many rows.
+class AddressValidator:
+	version_byte:int = 1
+	address_length:int = 32
+
+	# Creates a validator that caches the results for at most cache_size addresses
+	def __init__(self, cache_size:int = ADDRESS_CACHE_SIZE) -> None:
+		if cache_size <= 0:
+			raise ValueError(f"Cache size must be positive, was {cache_size}")
+		self.cache_size = cache_size
+		self.cache:OrderedDict = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	# Decode the address and check its version byte and length, without using the cache
+	def __check(self, address:str) -> bool:
+		from base58 import b58decode_check
+		try:
+			decoded = b58decode_check(address)
+		except ValueError:
+			return False
+		return len(decoded) == 1 + self.address_length and decoded[0] == self.version_byte
+
+	# Returns whether address is a valid account address
+	def is_valid(self, address:str) -> bool:
+		try:
+			valid = self.cache[address]
+		except KeyError:
+			self.misses += 1
+			valid = self.__check(address)
+			self.cache[address] = valid
+			if len(self.cache) > self.cache_size:
+				self.cache.popitem(last=False)
+			return valid
+		self.hits += 1
+		self.cache.move_to_end(address)
+		return valid
+
+	# Validate a whole column of addresses at once. Each distinct address is only checked once.
+	# Returns the positions of the invalid addresses in the column.
+	def validate_column(self, addresses:Sequence[str]) -> List[int]:
+		results = {address: self.is_valid(address) for address in set(addresses)}
+		return [position for position, address in enumerate(addresses) if not results[address]]
+
+	# Add lookups counted by another validator, e.g., in a worker process
+	def merge_stats(self, hits:int, misses:int):
+		self.hits += hits
+		self.misses += misses
+
+	# Returns the fraction of lookups answered from the cache
+	def hit_rate(self) -> float:
+		lookups = self.hits + self.misses
+		return self.hits / lookups if lookups > 0 else 0.0
+
+	# String representation of the cache statistics
+	def __str__(self):
+		return f"{self.hits + self.misses} address lookups, {self.hits} cache hits ({self.hit_rate():.1%})"
+
+# Validator used for all addresses read from csv files
+address_validator = AddressValidator()
+
+# Raise a ValueError if the row does not have the right number of columns. row_number is only used for error messages.
+# If schedule_ids are given, rows of regular transfers can have a fifth column with the id of their release schedule,
+# which must be one of schedule_ids or empty for the default schedule.
+def check_row_format(row_number:int, row_data:List[str], is_welcome:bool, schedule_ids:Optional[Container[str]] = None):
+	if schedule_ids is not None and not is_welcome and len(row_data) == 5:
+		if row_data[4] and row_data[4] not in schedule_ids:
+			raise ValueError(f"Unknown schedule \"{row_data[4]}\" in row {row_number}.")
+	elif not is_welcome and len(row_data) != 4:
+		raise ValueError(f"Incorrect file format. Each row must contains exactly 4 entires. Row {row_number} contains {len(row_data)}.")
+	elif is_welcome and len(row_data) != 3:
+		raise ValueError(f"Incorrect file format. Each row must contains exactly 3 entires. Row {row_number} contains {len(row_data)}.")
+
+# Raise a ValueError if the sender or receiver address of the row is invalid.
+def check_row_addresses(row_number:int, row_data:List[str]):
+	sender_address = row_data[0]
+	if not address_validator.is_valid(sender_address):
+		raise ValueError(f"Invalid sender address \"{sender_address}\" in row {row_number}.")
+	receiver_address = row_data[1]
+	if not address_validator.is_valid(receiver_address):
+		raise ValueError(f"Invalid receiver address \"{receiver_address}\" in row {row_number}.")
+
+# Convert a row with the right number of columns and valid addresses into a transfer, parsing its amounts.
+def row_to_transfer(row_number:int, row_data:List[str], is_welcome:bool, decimal_sep:str, thousands_sep:str) -> Dict[str, Any]:
+	try:
+		amounts = [TransferAmount.from_string(amount_string, decimal_sep, thousands_sep) for amount_string in row_data[2:3 if is_welcome else 4]]
+	except ValueError as error:
+		raise ValueError(f"In row {row_number}: {error}")
+	return make_transfer(row_data, is_welcome, amounts)
+
+# Build the transfer of a row from its already parsed amounts, the amount of a welcome transfer
+# or the initial and remaining amount of a regular one.
+def make_transfer(row_data:List[str], is_welcome:bool, amounts:List[TransferAmount]) -> Dict[str, Any]:
+	if is_welcome:
+		return {"sender_address" : row_data[0],
+			"receiver_address" : row_data[1],
+			"amount" : amounts[0]
+		}
+	else:
+		transfer = {"sender_address" : row_data[0],
+			"receiver_address" : row_data[1],
+			"initial_amount" : amounts[0],
+			"remaining_amount" : amounts[1]
+		}
+		# the id of the release schedule, if the row has one (see check_row_format)
+		if len(row_data) == 5 and row_data[4]:
+			transfer["schedule"] = row_data[4]
+		return transfer
+
+# Validate and convert a single csv row into a transfer. row_number is only used for error messages.
+# schedule_ids are the ids of the release schedules rows can refer to, see check_row_format.
+def parse_row(row_number:int, row_data:List[str], is_welcome:bool, decimal_sep:str, thousands_sep:str, schedule_ids:Optional[Container[str]] = None) -> Dict[str, Any]:
+	check_row_format(row_number, row_data, is_welcome, schedule_ids)
+	check_row_addresses(row_number, row_data)
+	return row_to_transfer(row_number, row_data, is_welcome, decimal_sep, thousands_sep)
+
+# Check the sender and receiver columns of a chunk of csv rows with AddressValidator.validate_column, so that an address
+# occurring in several rows of the chunk is only looked up once. Returns the positions of the rows with an invalid
+# sender and of the rows with an invalid receiver. Rows with less than two columns have neither.
+def invalid_address_positions(rows:Sequence[Tuple[int, List[str]]]) -> Tuple[List[int], List[int]]:
+	with_addresses = [position for position, (_, row_data) in enumerate(rows) if len(row_data) >= 2]
+	senders = address_validator.validate_column([rows[position][1][0] for position in with_addresses])
+	receivers = address_validator.validate_column([rows[position][1][1] for position in with_addresses])
+	return ([with_addresses[i] for i in senders], [with_addresses[i] for i in receivers])
+
+# Validate and convert a chunk of csv rows into transfers, like parse_row for each row. The addresses are checked
+# column by column, see invalid_address_positions, and the amounts are parsed column by column with
+# TransferAmount.parse_column. Raises the ValueError of parse_row for the first invalid row.
+def parse_rows(rows:Sequence[Tuple[int, List[str]]], is_welcome:bool, decimal_sep:str, thousands_sep:str, schedule_ids:Optional[Container[str]] = None) -> List[Dict[str, Any]]:
+	(invalid_senders, invalid_receivers) = invalid_address_positions(rows)
+	invalid = set(invalid_senders).union(invalid_receivers)
+	try:
+		columns = [TransferAmount.parse_column([row_data[column] for _, row_data in rows], decimal_sep, thousands_sep)
+			for column in range(2, 3 if is_welcome else 4)]
+	except (ValueError, IndexError):
+		# some row is invalid; its amounts are parsed row by row below, to report the same error as parse_row
+		columns = None
+	transfers = []
+	for position, (row_number, row_data) in enumerate(rows):
+		check_row_format(row_number, row_data, is_welcome, schedule_ids)
+		if position in invalid:
+			check_row_addresses(row_number, row_data)
+		if columns is None:
+			transfers.append(row_to_transfer(row_number, row_data, is_welcome, decimal_sep, thousands_sep))
+		else:
+			transfers.append(make_transfer(row_data, is_welcome, [TransferAmount(column[position]) for column in columns]))
+	return transfers
+
+# Raise a ValueError if the configured delimiters cannot be used together.
+def check_delimiters(decimal_sep:str, thousands_sep:str, csv_delimiter:str):
 	if len(csv_delimiter) != 1 or len(thousands_sep) != 1 or len(decimal_sep) != 1 or thousands_sep == decimal_sep:
 		raise ValueError(f"Invalid delimiters. Note that all delimiters must be a single character "\
 			"and thousands_sep must be different from decimal_sep.")
-	
-	result = []
 
+# Read csv file and yield a tuple (row_number, row_data) for each row in csv, without validating the rows.
+# If use_mmap is set, the file is read by read_mapped_csv_rows, which yields the same rows.
+# Excel workbooks (see is_xlsx_file) are read by read_xlsx_rows instead, formatting numbers with decimal_sep.
+def read_csv_rows(filename:str, csv_delimiter:str, use_mmap:bool = False, decimal_sep:str = '.') -> Iterator[Tuple[int, List[str]]]:
+	if is_xlsx_file(filename):
+		yield from read_xlsx_rows(filename, decimal_sep)
+		return
+	if use_mmap:
+		yield from read_mapped_csv_rows(filename, csv_delimiter)
+		return
+	import csv
 	with open(filename, newline='', encoding='utf-8-sig') as csvfile:
 		reader = csv.reader(csvfile, delimiter=csv_delimiter)
-		for row_number,row_data in enumerate(reader, start=1): # start counting rows with 1 for error messages
-			# Ensure we have the right number of columns
-			if not is_welcome and len(row_data) != 4:
-				raise ValueError(f"Incorrect file format. Each row must contains exactly 4 entires. Row {row_number} contains {len(row_data)}.")
-			elif is_welcome and len(row_data) != 3:
-				raise ValueError(f"Incorrect file format. Each row must contains exactly 3 entires. Row {row_number} contains {len(row_data)}.")
-			
-			# Read sender and receiver address
-			sender_address = row_data[0]
-			try:
-				b58decode_check(sender_address)
-			except:
-				raise ValueError(f"Invalid sender address \"{sender_address}\" in row {row_number}.")
-			receiver_address = row_data[1]
-			try:
-				b58decode_check(receiver_address)
-			except:
-				raise ValueError(f"Invalid receiver address \"{receiver_address}\" in row {row_number}.")
-			
-			# Read amounts
-			if is_welcome:
-				try:
-					amount = TransferAmount.from_string(row_data[2], decimal_sep, thousands_sep)
-				except ValueError as error:
-					raise ValueError(f"In row {row_number}: {error}")
-
-				result.append({"sender_address" : sender_address,
-					"receiver_address" : receiver_address,
-					"amount" : amount
-				})
-			else:
-				try:
-					initial_amount = TransferAmount.from_string(row_data[2], decimal_sep, thousands_sep)
-					remaining_amount = TransferAmount.from_string(row_data[3], decimal_sep, thousands_sep)
-				except ValueError as error:
-					raise ValueError(f"In row {row_number}: {error}")
+		# start counting rows with 1 for error messages
+		yield from enumerate(reader, start=1)
 
-				result.append({"sender_address" : sender_address,
-					"receiver_address" : receiver_address,
-					"initial_amount" : initial_amount,
-					"remaining_amount" : remaining_amount
-				})
+# Yield the content of a memory-mapped UTF-8 file as decoded strings of about chunk_size bytes, each ending with a
+# complete line. A byte order mark is skipped. Only one chunk is decoded at a time, the file is never copied as a whole.
+def iter_mapped_chunks(buffer:Any, chunk_size:int) -> Iterator[str]:
+	position = 3 if buffer[:3] == b'\xef\xbb\xbf' else 0
+	end = len(buffer)
+	while position < end:
+		if position + chunk_size >= end:
+			stop = end
+		else:
+			# end the chunk after the last line break in it, or after the first one following it for very long lines.
+			# A line break byte never occurs inside a multi-byte UTF-8 character.
+			stop = buffer.rfind(b'\n', position, position + chunk_size) + 1
+			if stop == 0:
+				stop = buffer.find(b'\n', position + chunk_size) + 1 or end
+		yield buffer[position:stop].decode('utf-8')
+		position = stop
 
-	return result
+# Read csv file using a memory map and yield the same tuples (row_number, row_data) as read_csv_rows.
+# The file is decoded in chunks of MMAP_CHUNK_SIZE bytes. Chunks without quotes and carriage returns, as exported
+# without thousands separators, are split directly into lines and columns. From the first chunk containing any of them,
+# where a quoted field may continue in the next chunk, the remaining chunks are parsed by csv.reader. This is only
+# faster than read_csv_rows for files without quoted fields: splitting quoted fields in Python is slower than csv.reader.
+def read_mapped_csv_rows(filename:str, csv_delimiter:str, chunk_size:int = MMAP_CHUNK_SIZE) -> Iterator[Tuple[int, List[str]]]:
+	import csv
+	import mmap
+	from itertools import chain
+	with open(filename, 'rb') as csvfile:
+		# empty files cannot be mapped
+		if os.fstat(csvfile.fileno()).st_size == 0:
+			return
+		with mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+			# start counting rows with 1 for error messages
+			row_number = 1
+			chunks = iter_mapped_chunks(buffer, chunk_size)
+			for text in chunks:
+				if '"' in text or '\r' in text:
+					# split into lines like a file opened with newline='', as expected by csv.reader
+					lines = chain.from_iterable(io.StringIO(chunk, newline='') for chunk in chain([text], chunks))
+					yield from enumerate(csv.reader(lines, delimiter=csv_delimiter), start=row_number)
+					return
+				lines = text.split('\n')
+				if lines[-1] == '':
+					lines.pop()
+				# csv.reader returns an empty row for an empty line
+				for row_data in [line.split(csv_delimiter) if line else [] for line in lines]:
+					yield (row_number, row_data)
+					row_number += 1
+
+# Returns whether filename is an Excel workbook, which is read directly instead of a csv file exported from it
+def is_xlsx_file(filename:str) -> bool:
+	return filename.lower().endswith(".xlsx")
+
+# Returns the local name of an xml tag, without its namespace, so that both the transitional and the strict
+# namespaces of Office Open XML are accepted
+def xml_local_name(tag:str) -> str:
+	return tag.rpartition('}')[2]
+
+# Returns the value of a numeric cell of an Excel workbook as a decimal string with decimal_sep and without thousands
+# separators or exponent, as expected by TransferAmount.parse_micro_gtu. Excel stores numbers as binary floating point
+# numbers, so an amount with 6 decimals is stored as a number close to it, e.g., 1000.000001 as 1000.0000009999999,
+# which is read back as the amount it stands for: the closest amount if it is stored as the same number, or if the two
+# are the same to the 15 significant digits that Excel shows. Raises a ValueError if the stored number stands for no
+# amount, e.g., 1.0000005, or for several ones, as large numbers with decimals do, since the amount would be changed.
+def xlsx_number(value:str, decimal_sep:str) -> str:
+	from decimal import Context, Decimal, InvalidOperation
+	try:
+		number = Decimal(value)
+	except InvalidOperation:
+		# reported as invalid amount by the validation
+		return value
+	if number == number.to_integral_value():
+		rounded = number
+	else:
+		rounded = number.quantize(Decimal("0.000001"))
+		# the floating point numbers below 2^33 are less than a micro GTU apart, so each stands for at most one amount
+		if rounded != number and (abs(rounded) >= 2**33 or (float(rounded) != float(number) and Context(prec=15).plus(number) != rounded)):
+			raise ValueError(f"The number {value} cannot be read exactly with at most 6 decimals, enter it as text instead")
+	text = format(rounded, 'f')
+	if '.' in text:
+		text = text.rstrip('0').rstrip('.')
+	return text.replace('.', decimal_sep)
+
+# Yield the texts of the shared strings of an Excel workbook, which cells of type "s" refer to by their index.
+# Rich text consists of several runs, whose texts are concatenated, while phonetic hints are left out.
+def iter_xlsx_shared_strings(xml_file:IO[bytes]) -> Iterator[str]:
+	from xml.etree.ElementTree import iterparse
+	for _, element in iterparse(xml_file):
+		if xml_local_name(element.tag) == "si":
+			texts = []
+			for child in element:
+				if xml_local_name(child.tag) == "t":
+					texts.append(child.text or "")
+				elif xml_local_name(child.tag) == "r":
+					texts.extend(run.text or "" for run in child if xml_local_name(run.tag) == "t")
+			yield "".join(texts)
+			element.clear()
+
+# Returns the path in the archive of the first worksheet of an Excel workbook, in the order of the workbook
+def xlsx_first_sheet(workbook:Any) -> str:
+	from xml.etree.ElementTree import fromstring
+	sheets = [element for element in fromstring(workbook.read("xl/workbook.xml")).iter() if xml_local_name(element.tag) == "sheet"]
+	if not sheets:
+		raise ValueError("The workbook does not contain any sheet.")
+	# the relationship id of the sheet, in the namespace of relationships
+	sheet_id = next((value for key, value in sheets[0].attrib.items() if xml_local_name(key) == "id"), None)
+	for relationship in fromstring(workbook.read("xl/_rels/workbook.xml.rels")).iter():
+		if xml_local_name(relationship.tag) == "Relationship" and relationship.get("Id") == sheet_id:
+			target = relationship.get("Target", "")
+			# targets are relative to the folder of the workbook, unless they are absolute
+			return target.lstrip('/') if target.startswith('/') else "xl/" + target
+	raise ValueError("The first sheet of the workbook is missing.")
+
+# Returns the column index of a cell reference like "C7", starting with 0 for column A
+def xlsx_column(reference:str) -> int:
+	column = 0
+	for char in reference:
+		if not char.isalpha():
+			break
+		column = column * 26 + ord(char.upper()) - ord('A') + 1
+	return column - 1
+
+# Read the first sheet of an Excel workbook (.xlsx) and yield the same tuples (row_number, row_data) as read_csv_rows,
+# where row_number is the row number shown by Excel. The sheet is parsed as a stream, one row at a time, so the workbook
+# is never loaded into memory as a whole; only the table of shared strings is. Numeric cells are read as the amount
+# they stand for, see xlsx_number, instead of being formatted for the locale as in a csv export. Empty rows are skipped,
+# and empty cells at the end of a row are left out. Raises a ValueError if the file is not a valid workbook, or if a
+# numeric cell cannot be read exactly. If inexact_cells is given, such cells are yielded as stored instead, which is
+# never a valid amount, and the reason is added to inexact_cells under the row number and the 1-based column.
+def read_xlsx_rows(filename:str, decimal_sep:str = '.', inexact_cells:Optional[Dict[Tuple[int, int], str]] = None) -> Iterator[Tuple[int, List[str]]]:
+	import zipfile
+	from xml.etree.ElementTree import iterparse, ParseError
+	try:
+		with zipfile.ZipFile(filename) as workbook:
+			shared_strings = []
+			if "xl/sharedStrings.xml" in workbook.namelist():
+				with workbook.open("xl/sharedStrings.xml") as xml_file:
+					shared_strings = list(iter_xlsx_shared_strings(xml_file))
+			with workbook.open(xlsx_first_sheet(workbook)) as xml_file:
+				sheet_data = None
+				previous_row = 0
+				for event, element in iterparse(xml_file, events=("start", "end")):
+					name = xml_local_name(element.tag)
+					if event == "start":
+						if name == "sheetData":
+							sheet_data = element
+						continue
+					if name != "row":
+						continue
+					row_number = int(element.get("r", previous_row + 1))
+					previous_row = row_number
+					row_data:List[str] = []
+					for cell in element:
+						if xml_local_name(cell.tag) != "c":
+							continue
+						cell_type = cell.get("t", "n")
+						value = ""
+						for child in cell:
+							child_name = xml_local_name(child.tag)
+							if child_name == "v":
+								value = child.text or ""
+							elif child_name == "is":
+								value = "".join(text.text or "" for text in child.iter() if xml_local_name(text.tag) == "t")
+						column = xlsx_column(cell.get("r", "")) if cell.get("r") else len(row_data)
+						if cell_type == "s" and value:
+							value = shared_strings[int(value)]
+						elif cell_type == "n" and value:
+							try:
+								value = xlsx_number(value, decimal_sep)
+							except ValueError as error:
+								if inexact_cells is None:
+									raise ValueError(f"In row {row_number}, cell {cell.get('r', '')}: {error}")
+								inexact_cells[(row_number, column + 1)] = str(error)
+						elif cell_type == "b" and value:
+							value = "TRUE" if value == "1" else "FALSE"
+						row_data.extend([""] * (column - len(row_data)))
+						row_data.append(value)
+					while row_data and row_data[-1] == "":
+						row_data.pop()
+					# the rows that have been parsed are removed, so that memory use does not grow with the sheet
+					if sheet_data is not None:
+						sheet_data.clear()
+					if row_data:
+						yield (row_number, row_data)
+	except (zipfile.BadZipFile, KeyError, ParseError, IndexError) as error:
+		raise ValueError(f"\"{filename}\" is not a valid Excel workbook: {error}")
+
+# Read csv file and yield a tuple (row_number, transfer) for each row in csv.
+# Rows are converted one at a time, so memory use does not grow with the size of the file.
+def iter_csv_transfers(
+	filename:str,
+	is_welcome:bool,
+	decimal_sep:str,
+	thousands_sep:str,
+	csv_delimiter:str,
+	use_mmap:bool = False,
+	schedule_ids:Optional[Container[str]] = None
+	) -> Iterator[Tuple[int, Dict[str, Any]]]:
+	check_delimiters(decimal_sep, thousands_sep, csv_delimiter)
+	for row_number, row_data in read_csv_rows(filename, csv_delimiter, use_mmap, decimal_sep):
+		yield (row_number, parse_row(row_number, row_data, is_welcome, decimal_sep, thousands_sep, schedule_ids))
+
+# Read csv file and return a list with one entry for each row in csv.
+# If a job is given, the release amounts of every transfer are checked against its schedule in job, see check_row_amounts.
+def csv_to_list(
+	filename:str,
+	is_welcome:bool,
+	decimal_sep:str,
+	thousands_sep:str,
+	csv_delimiter:str,
+	use_mmap:bool = False,
+	schedule_ids:Optional[Container[str]] = None,
+	job:Optional[Dict[str, Any]] = None
+	) -> List[Any]:
+	transfers = iter_csv_transfers(filename, is_welcome, decimal_sep, thousands_sep, csv_delimiter, use_mmap, schedule_ids)
+	if job is not None:
+		transfers = check_row_amounts(transfers, job)
+	return [transfer for _, transfer in transfers]
+
+# Like iter_csv_transfers, but reading the csv file, checking the addresses and parsing the amounts are
+# measured as separate stages by the profiler.
+def profiled_csv_transfers(
+	filename:str,
+	is_welcome:bool,
+	decimal_sep:str,
+	thousands_sep:str,
+	csv_delimiter:str,
+	profiler:StageProfiler,
+	use_mmap:bool = False,
+	schedule_ids:Optional[Container[str]] = None
+	) -> Iterator[Tuple[int, Dict[str, Any]]]:
+	check_delimiters(decimal_sep, thousands_sep, csv_delimiter)
+	profiler.count("read_csv", bytes=os.path.getsize(filename))
+	for row_number, row_data in profiler.iterate("read_csv", read_csv_rows(filename, csv_delimiter, use_mmap, decimal_sep)):
+		with profiler.stage("check_addresses"):
+			check_row_format(row_number, row_data, is_welcome, schedule_ids)
+			check_row_addresses(row_number, row_data)
+		with profiler.stage("parse_amounts"):
+			transfer = row_to_transfer(row_number, row_data, is_welcome, decimal_sep, thousands_sep)
+		profiler.count("check_addresses", rows=1)
+		profiler.count("parse_amounts", rows=1)
+		yield (row_number, transfer)
 
 # Build the release schedule
 # Normal schedule consists of num_releases, with first one at initial_release_time,
@@ -215,20 +1226,211 @@ def build_release_schedule(
 	) -> Tuple[List[datetime],int]:
 	if initial_release_time > first_rem_release_time:
 		raise ValueError("Initial release must be before the remaining ones")
+	from dateutil.relativedelta import relativedelta
 	
+	# remaining realeses are i month after first remaining release
+	remaining_release_times = [first_rem_release_time + relativedelta(months = +i) for i in range(num_releases - 1)]
+	return combine_past_releases(initial_release_time, remaining_release_times, earliest_release_time)
+
+# Combine all releases before earliest_release_time into the initial release, which is moved to earliest_release_time
+# if it is earlier. remaining_release_times must be sorted.
+# Returns a tuple with the list of times of all releases and the number of skipped releases, as build_release_schedule.
+def combine_past_releases(
+	initial_release_time:datetime,
+	remaining_release_times:Sequence[datetime],
+	earliest_release_time:datetime
+	) -> Tuple[List[datetime],int]:
 	# first release at initial_release_time, but not before earliest_release_time
 	release_times = [max(initial_release_time, earliest_release_time)]
+	# Only add release if after earliest_release_time.
+	release_times.extend(release_time for release_time in remaining_release_times if release_time > earliest_release_time)
+	skipped_releases = len(remaining_release_times) + 1 - len(release_times)
+	return (release_times, skipped_releases)
 
-	for i in range(num_releases - 1):
-		# remaining realeses are i month after first remaining release
-		planned_release_time = first_rem_release_time + relativedelta(months = +i)
+# Converts the release times into an immutable table of timestamps in milliseconds, as used in pre-proposals.
+# All transfers of a run share the release times, so this is computed once per run.
+def release_timestamps(release_times:Sequence[datetime]) -> Tuple[int, ...]:
+	# multiply by 1000 since timestamps in pre-proposals are in milliseconds
+	return tuple(int(release_time.timestamp()) * 1000 for release_time in release_times)
 
-		# Only add release if after earliest_release_time.
-		if planned_release_time > earliest_release_time:
-			release_times.append(planned_release_time)
+# The release schedule of transfers as used to generate their pre-proposals: the number of releases, the number
+# of skipped releases that are combined into the initial release (see build_release_schedule) and the release timestamps.
+class ReleaseSchedule:
+	__slots__ = ("num_releases", "skipped_releases", "timestamps")
 
-	skipped_releases = num_releases - len(release_times)
-	return (release_times, skipped_releases)
+	def __init__(self, num_releases:int, skipped_releases:int, timestamps:Tuple[int, ...]) -> None:
+		self.num_releases = num_releases
+		self.skipped_releases = skipped_releases
+		self.timestamps = timestamps
+
+	# Returns the schedule of regular transfers, see build_release_schedule
+	@classmethod
+	def regular(
+		cls,
+		initial_release_time:datetime,
+		first_rem_release_time:datetime,
+		earliest_release_time:datetime,
+		num_releases:int
+		) -> 'ReleaseSchedule':
+		(release_times, skipped_releases) = build_release_schedule(initial_release_time, first_rem_release_time, earliest_release_time, num_releases)
+		return cls(num_releases, skipped_releases, release_timestamps(release_times))
+
+	# Returns the schedule of welcome transfers, with a single release at release_time, but not before earliest_release_time
+	@classmethod
+	def welcome(cls, release_time:datetime, earliest_release_time:datetime) -> 'ReleaseSchedule':
+		return cls(1, 0, release_timestamps([max(release_time, earliest_release_time)]))
+
+	def __eq__(self, other:object) -> bool:
+		return isinstance(other, ReleaseSchedule) and (self.num_releases, self.skipped_releases, self.timestamps) == \
+			(other.num_releases, other.skipped_releases, other.timestamps)
+
+# Definition of a release schedule from a schedule file (see --schedule). Each transfer has an initial release at
+# initial_release_time, and its remaining amount is split into equal releases at remaining_release_times.
+class ScheduleDefinition:
+	# Cadences of the remaining releases. The regular ones are given by the time between releases.
+	cadences = ("monthly", "weekly", "quarterly", "cliff_linear", "explicit")
+	intervals = {"monthly" : {"months" : 1}, "weekly" : {"weeks" : 1}, "quarterly" : {"months" : 3}}
+
+	def __init__(self, schedule_id:str, initial_release_time:datetime, remaining_release_times:List[datetime]) -> None:
+		if not remaining_release_times:
+			raise ValueError(f"Schedule \"{schedule_id}\" must have at least one release after the initial release.")
+		if initial_release_time > remaining_release_times[0]:
+			raise ValueError(f"Schedule \"{schedule_id}\": Initial release must be before the remaining ones")
+		if any(later <= earlier for earlier, later in zip(remaining_release_times, remaining_release_times[1:])):
+			raise ValueError(f"Schedule \"{schedule_id}\": The release times must be increasing.")
+		self.schedule_id = schedule_id
+		self.initial_release_time = initial_release_time
+		self.remaining_release_times = remaining_release_times
+
+	# Returns the number of releases of a transfer, including the initial release
+	def num_releases(self) -> int:
+		return len(self.remaining_release_times) + 1
+
+	# Returns the release schedule for transfers that are released no earlier than earliest_release_time
+	def release_schedule(self, earliest_release_time:datetime) -> ReleaseSchedule:
+		(release_times, skipped_releases) = combine_past_releases(self.initial_release_time, self.remaining_release_times, earliest_release_time)
+		return ReleaseSchedule(self.num_releases(), skipped_releases, release_timestamps(release_times))
+
+	# Create the definition of the schedule with the given id from its json object, e.g.,
+	# {"cadence" : "monthly", "initial_release_time" : "2021-08-26T14:00:00+01:00", "first_release_time" : "2021-09-26T14:00:00+01:00", "num_releases" : 10}
+	# The regular cadences "monthly", "weekly" and "quarterly" have num_releases (including the initial release) with the
+	# remaining ones starting at first_release_time. "cliff_linear" spreads them evenly from cliff_time to end_time,
+	# and "explicit" releases at the listed release_times.
+	@classmethod
+	def from_json(cls, schedule_id:str, definition:Dict[str, Any]) -> 'ScheduleDefinition':
+		def get(key:str, kind:type) -> Any:
+			if key not in definition:
+				raise ValueError(f"Schedule \"{schedule_id}\" has no \"{key}\".")
+			value = definition[key]
+			if not isinstance(value, kind) or isinstance(value, bool):
+				raise ValueError(f"Schedule \"{schedule_id}\": \"{key}\" has an invalid value.")
+			return value
+		def get_time(key:str) -> datetime:
+			return parse_release_time(get(key, str), f"Schedule \"{schedule_id}\": \"{key}\"")
+		def get_num_releases(minimum:int) -> int:
+			num_releases = get("num_releases", int)
+			if num_releases < minimum:
+				raise ValueError(f"Schedule \"{schedule_id}\" must have at least {minimum} releases.")
+			return num_releases
+
+		if not isinstance(definition, dict):
+			raise ValueError(f"Schedule \"{schedule_id}\" must be an object.")
+		cadence = get("cadence", str)
+		initial_release_time = get_time("initial_release_time")
+		if cadence in cls.intervals:
+			from dateutil.relativedelta import relativedelta
+			first_release_time = get_time("first_release_time")
+			num_releases = get_num_releases(2)
+			interval = cls.intervals[cadence]
+			remaining_release_times = [first_release_time + relativedelta(**{unit : i * count for unit, count in interval.items()}) for i in range(num_releases - 1)]
+		elif cadence == "cliff_linear":
+			cliff_time = get_time("cliff_time")
+			end_time = get_time("end_time")
+			num_releases = get_num_releases(3)
+			if end_time <= cliff_time:
+				raise ValueError(f"Schedule \"{schedule_id}\": The end time must be after the cliff.")
+			# whole seconds, as timestamps are in seconds
+			step = (end_time - cliff_time) / (num_releases - 2)
+			remaining_release_times = [cliff_time + timedelta(seconds = int((step * i).total_seconds())) for i in range(num_releases - 2)] + [end_time]
+		elif cadence == "explicit":
+			release_times = get("release_times", list)
+			remaining_release_times = [parse_release_time(release_time, f"Schedule \"{schedule_id}\": Release time {position}")
+				for position, release_time in enumerate(release_times, start=1)]
+		else:
+			raise ValueError(f"Schedule \"{schedule_id}\" has an unknown cadence \"{cadence}\". Valid cadences are {', '.join(cls.cadences)}.")
+		return cls(schedule_id, initial_release_time, remaining_release_times)
+
+# Parse a release time in ISO format with a time zone, e.g., "2021-08-26T14:00:00+01:00". what is used for error messages.
+def parse_release_time(value:Any, what:str) -> datetime:
+	try:
+		release_time = datetime.fromisoformat(value)
+	except (TypeError, ValueError):
+		raise ValueError(f"{what} is not a time in ISO format.")
+	if release_time.tzinfo is None:
+		raise ValueError(f"{what} must include a time zone.")
+	return release_time
+
+# The schedules defined by a schedule file (see --schedule), by their id. Transfers without a schedule id use
+# the default schedule. The file can also set the release time of welcome transfers.
+class ScheduleFile:
+	def __init__(self, schedules:Dict[str, ScheduleDefinition], default:str, welcome_release_time:Optional[datetime]) -> None:
+		self.schedules = schedules
+		self.default = default
+		self.welcome_release_time = welcome_release_time
+
+	# Parse the content of a schedule file, a json object like
+	# {"default" : "monthly", "welcome_release_time" : "2021-08-15T14:00:00+01:00", "schedules" : {"monthly" : {...}, "vesting" : {...}}}
+	# where "default" can be omitted if there is only one schedule, and "welcome_release_time" is optional.
+	# See ScheduleDefinition.from_json for the definition of a schedule.
+	@classmethod
+	def parse(cls, content:bytes) -> 'ScheduleFile':
+		import json
+		try:
+			data = json.loads(content.decode('utf-8-sig'))
+		except ValueError as error:
+			raise ValueError(f"The schedule file is not valid json: {error}")
+		if not isinstance(data, dict) or not isinstance(data.get("schedules"), dict) or not data["schedules"]:
+			raise ValueError("The schedule file must contain an object \"schedules\" with at least one schedule.")
+		schedules = {str(schedule_id) : ScheduleDefinition.from_json(schedule_id, definition) for schedule_id, definition in data["schedules"].items()}
+		if "default" in data:
+			default = data["default"]
+		elif len(schedules) == 1:
+			default = next(iter(schedules))
+		else:
+			raise ValueError("The schedule file must name the \"default\" schedule.")
+		if default not in schedules:
+			raise ValueError(f"The default schedule \"{default}\" is not defined.")
+		welcome_release_time = None
+		if "welcome_release_time" in data:
+			welcome_release_time = parse_release_time(data["welcome_release_time"], "\"welcome_release_time\"")
+		return cls(schedules, default, welcome_release_time)
+
+	# Returns the release schedule of every schedule id, each computed once for all transfers that use it
+	def release_schedules(self, earliest_release_time:datetime) -> Dict[str, ReleaseSchedule]:
+		return {schedule_id : definition.release_schedule(earliest_release_time) for schedule_id, definition in self.schedules.items()}
+
+# Parsed schedule files by the sha256 hash of their content, so that an unchanged file is parsed only once per process
+schedule_file_cache:Dict[str, ScheduleFile] = {}
+
+# Read and parse a schedule file, see ScheduleFile.parse. Raises an IOError if the file cannot be read,
+# and a ValueError if it is invalid.
+def load_schedule_file(filename:str) -> ScheduleFile:
+	import hashlib
+	with open(filename, 'rb') as schedule_file:
+		content = schedule_file.read()
+	content_hash = hashlib.sha256(content).hexdigest()
+	schedules = schedule_file_cache.get(content_hash)
+	if schedules is None:
+		schedules = schedule_file_cache[content_hash] = ScheduleFile.parse(content)
+	return schedules
+
+# Returns the release schedule of a transfer: its schedule in the table schedules if it has a schedule id,
+# and the default schedule of job otherwise
+def transfer_schedule(transfer:Dict[str, Any], job:Dict[str, Any]) -> ReleaseSchedule:
+	schedule_id = transfer.get("schedule")
+	if schedule_id is None:
+		return ReleaseSchedule(job["num_releases"], job["skipped_releases"], job["release_timestamps"])
+	return job["schedules"][schedule_id]
 
 # Returns list of amounts contructed by splitting remaining_amount into num_releases
 # and adding all skipped releases with initial_amount into the initial amount
@@ -238,39 +1440,1461 @@ def amounts_to_scheduled_list(
 	num_releases:int,
 	skipped_releases:int
 	) -> List[TransferAmount]:
-		if skipped_releases >= num_releases:
-			raise ValueError("The number of skipped releases must be less than total number of releases.")
+		schedule = AmountSchedule.for_transfer(initial_amount.get_micro_GTU(), remaining_amount.get_micro_GTU(), num_releases, skipped_releases)
+		return schedule.to_transfer_amounts()
+		
 
-		# regular transfer has first initial amount, then the remaining amount split into num_releases-1 releases
-		regular_amounts = [initial_amount, *remaining_amount.split_amount(num_releases-1)]
+# Returns the release amounts of a single transfer
+def transfer_amounts(transfer:Dict[str, Any], is_welcome:bool, num_releases:int, skipped_releases:int) -> AmountSchedule:
+	if is_welcome:
+		# welcome transfer only has one amount
+		return AmountSchedule([transfer["amount"].get_micro_GTU()])
+	return AmountSchedule.for_transfer(transfer["initial_amount"].get_micro_GTU(), transfer["remaining_amount"].get_micro_GTU(), num_releases, skipped_releases)
 
-		# add all skipped amounts into initial amount and put remaining ones after that in list
-		initial_amount = sum(regular_amounts[1:(skipped_releases+1)], regular_amounts[0])
-		amounts = [initial_amount, *regular_amounts[skipped_releases+1:]]
+# Returns the release amounts of the transfer read from row row_number, according to its release schedule in job.
+# Raises a ValueError stating the row number if they cannot be computed, e.g., if the remaining amount is too small
+# to be split into the releases.
+def row_amounts(row_number:int, transfer:Dict[str, Any], job:Dict[str, Any]) -> AmountSchedule:
+	schedule = transfer_schedule(transfer, job)
+	try:
+		return transfer_amounts(transfer, job["is_welcome"], schedule.num_releases, schedule.skipped_releases)
+	except (ValueError, AssertionError) as error:
+		raise ValueError(f"In row {row_number}: {error}")
 
-		return amounts
-		
+# Pipeline stage: compute the release amounts of every transfer read from a csv file and pass the transfers on unchanged,
+# so that a transfer that cannot be scheduled is found before anything is written. Raises a ValueError as row_amounts.
+def check_row_amounts(transfers:Iterable[Tuple[int, Dict[str, Any]]], job:Dict[str, Any]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+	for row_number, transfer in transfers:
+		row_amounts(row_number, transfer, job)
+		yield (row_number, transfer)
 
-# Main function
-def main():
-	config = get_config()
-	num_releases = config["num_releases"]
-	welcome_release_time = config["welcome_release_time"]
-	initial_release_time = config["initial_release_time"]
-	first_rem_release_time = config["first_rem_release_time"]
-	csv_delimiter = config["csv_delimiter"]
-	thousands_sep = config["thousands_sep"]
-	decimal_sep = config["decimal_sep"]
+# Create the pre-proposal of a single transfer with all its releases, given the table of release timestamps.
+# If use_template is set, the pre-proposal is serialized using the cached template for expiry and timestamps.
+def make_pre_proposal(
+	transfer:Dict[str, Any],
+	amounts:AmountSchedule,
+	timestamps:Tuple[int, ...],
+	expiry:datetime,
+	use_template:bool = False
+	) -> Union[ScheduledPreProposal, TemplatePreProposal]:
+	if use_template:
+		return TemplatePreProposal(get_pre_proposal_template(expiry, timestamps), transfer["sender_address"], transfer["receiver_address"], amounts)
+	pre_proposal = ScheduledPreProposal(transfer["sender_address"], transfer["receiver_address"], expiry)
+	pre_proposal.set_schedule(amounts, timestamps)
+	return pre_proposal
 
-	# proposals expire 2 hours from now
-	transaction_expiry = datetime.now() + relativedelta(hours = +2) 
-	# If regular releases are before earliest_release_time, they get combined into one at that time.
-	# earliest_release_time = 14:00 CET tomorrow.
-	# This can be later than all release times, in which case all releases happen at that time.
-	earliest_release_time = datetime.combine(date.today(), time.fromisoformat("14:00:00+01:00")) + relativedelta(days = +1)
+# Create the pre-proposals of a single transfer as make_pre_proposal. If the transfer has more than max_releases
+# releases, its schedule is split into parts of max_releases consecutive releases (the last one possibly shorter),
+# and a SplitPreProposal with one pre-proposal per part is returned.
+def make_pre_proposals(
+	transfer:Dict[str, Any],
+	amounts:AmountSchedule,
+	timestamps:Tuple[int, ...],
+	expiry:datetime,
+	use_template:bool = False,
+	max_releases:Optional[int] = None
+	) -> Union[ScheduledPreProposal, TemplatePreProposal, SplitPreProposal]:
+	if num_parts(len(amounts), max_releases) == 1:
+		return make_pre_proposal(transfer, amounts, timestamps, expiry, use_template)
+	return SplitPreProposal([make_pre_proposal(transfer, amounts[start:start + max_releases], timestamps[start:start + max_releases], expiry, use_template)
+		for start in range(0, len(amounts), max_releases)])
+
+# Returns the number of digits used for transfer numbers in file names, such that
+# the files sort in the order of the transfers. At least 3 digits are used.
+def file_number_width(num_transfers:int) -> int:
+	return max(3, len(str(num_transfers)))
+
+# Returns the name of the json file for the transfer with the given number
+def output_file_name(json_output_prefix:str, transfer_number:int, width:int = 3) -> str:
+	return json_output_prefix + str(transfer_number).zfill(width) + ".json"
+
+# Returns the names of the json files of a transfer with the given number of parts, in the order of the parts.
+# A transfer that is not split has a single file named by output_file_name. The parts of a split transfer are
+# numbered starting with 1, with as many digits as the number of parts, e.g., "pre-proposal_x_007-01.json",
+# so that the files sort in the order of the transfers and their parts.
+def output_file_names(json_output_prefix:str, transfer_number:int, width:int = 3, parts:int = 1) -> List[str]:
+	if parts == 1:
+		return [output_file_name(json_output_prefix, transfer_number, width)]
+	transfer_name = json_output_prefix + str(transfer_number).zfill(width)
+	return [f"{transfer_name}-{str(part).zfill(len(str(parts)))}.json" for part in range(1, parts + 1)]
+
+# Returns the pre-proposals of a transfer together with the names of their json files
+def output_parts(
+	json_output_prefix:str,
+	transfer_number:int,
+	width:int,
+	pre_proposal:Union[ScheduledPreProposal, TemplatePreProposal, SplitPreProposal]
+	) -> List[Tuple[str, Union[ScheduledPreProposal, TemplatePreProposal]]]:
+	if isinstance(pre_proposal, SplitPreProposal):
+		return list(zip(output_file_names(json_output_prefix, transfer_number, width, len(pre_proposal.parts)), pre_proposal.parts))
+	return [(output_file_name(json_output_prefix, transfer_number, width), pre_proposal)]
+
+# Pipeline stage: compute the amount of each release for every transfer.
+# Transfers with a schedule id use their release schedule in the table schedules, all others num_releases and skipped_releases.
+# Yields tuples (transfer_number, transfer, amounts), where transfers are numbered starting with 1.
+# Raises a ValueError stating the transfer number if the amounts of a transfer cannot be scheduled.
+def schedule_transfers(
+	transfers:Iterable[Dict[str, Any]],
+	is_welcome:bool,
+	num_releases:int,
+	skipped_releases:int,
+	schedules:Optional[Dict[str, ReleaseSchedule]] = None
+	) -> Iterator[Tuple[int, Dict[str, Any], AmountSchedule]]:
+	for transfer_number, transfer in enumerate(transfers, start=1):
+		schedule_id = transfer.get("schedule")
+		try:
+			if schedule_id is None:
+				amounts = transfer_amounts(transfer, is_welcome, num_releases, skipped_releases)
+			else:
+				amounts = transfer_amounts(transfer, is_welcome, schedules[schedule_id].num_releases, schedules[schedule_id].skipped_releases)
+		except (ValueError, AssertionError) as error:
+			raise ValueError(f"In transfer {transfer_number}: {error}")
+		yield (transfer_number, transfer, amounts)
+
+# Pipeline stage: create a pre-proposal containing all releases for every scheduled transfer,
+# pairing the amounts of each transfer with the shared table of release timestamps, or with the
+# timestamps of its schedule in the table schedules if it has a schedule id.
+# Transfers with more than max_releases releases get a SplitPreProposal, see make_pre_proposals.
+# Yields tuples (transfer_number, pre_proposal).
+def build_pre_proposals(
+	scheduled_transfers:Iterable[Tuple[int, Dict[str, Any], AmountSchedule]],
+	timestamps:Tuple[int, ...],
+	expiry:datetime,
+	use_template:bool = False,
+	schedules:Optional[Dict[str, ReleaseSchedule]] = None,
+	max_releases:Optional[int] = None
+	) -> Iterator[Tuple[int, Union[ScheduledPreProposal, TemplatePreProposal, SplitPreProposal]]]:
+	for transfer_number, transfer, amounts in scheduled_transfers:
+		transfer_timestamps = timestamps if schedules is None or "schedule" not in transfer else schedules[transfer["schedule"]].timestamps
+		yield (transfer_number, make_pre_proposals(transfer, amounts, transfer_timestamps, expiry, use_template, max_releases))
+
+# Totals of the transfers of one sender account. The cash-flow profile contains the total amount
+# released at each release time, by timestamp.
+class SenderTotals:
+	__slots__ = ("transfers", "releases", "amount", "profile")
+
+	def __init__(self) -> None:
+		self.transfers = 0
+		self.releases = 0
+		self.amount = 0
+		self.profile:Dict[int, int] = {}
+
+	# Add the release amounts of a single transfer, released at timestamps
+	def add(self, amounts:AmountSchedule, timestamps:Sequence[int]):
+		self.transfers += 1
+		self.releases += len(amounts)
+		self.amount += amounts.total()
+		profile = self.profile
+		for timestamp, amount in zip(timestamps, amounts):
+			profile[timestamp] = profile.get(timestamp, 0) + amount
 
+	# Add the totals of other, e.g., computed by a worker process
+	def merge(self, other:'SenderTotals'):
+		self.transfers += other.transfers
+		self.releases += other.releases
+		self.amount += other.amount
+		for timestamp, amount in other.profile.items():
+			self.profile[timestamp] = self.profile.get(timestamp, 0) + amount
+
+	# Returns the totals with the cash-flow profile in the order of the release times
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"transfers" : self.transfers,
+			"releases" : self.releases,
+			"amount" : self.amount,
+			"schedule" : [{"timestamp" : timestamp, "amount" : self.profile[timestamp]} for timestamp in sorted(self.profile)]
+		}
+
+# Totals over the scheduled transfers of a run, accumulated in one pass: the number of transfers and releases,
+# and the total amount in microGTU, both overall and per sender account.
+class TransferTotals:
+	def __init__(self) -> None:
+		self.transfers = 0
+		self.releases = 0
+		self.amount = 0
+		self.senders:Dict[str, SenderTotals] = {}
+
+	# Add the release amounts of a single transfer, released at timestamps
+	def add(self, transfer:Dict[str, Any], amounts:AmountSchedule, timestamps:Sequence[int]):
+		self.transfers += 1
+		self.releases += len(amounts)
+		self.amount += amounts.total()
+		sender_totals = self.senders.get(transfer["sender_address"])
+		if sender_totals is None:
+			sender_totals = self.senders[transfer["sender_address"]] = SenderTotals()
+		sender_totals.add(amounts, timestamps)
+
+	# Add the totals of other, e.g., computed by a worker process
+	def merge(self, other:'TransferTotals'):
+		self.transfers += other.transfers
+		self.releases += other.releases
+		self.amount += other.amount
+		for sender, other_totals in other.senders.items():
+			if sender in self.senders:
+				self.senders[sender].merge(other_totals)
+			else:
+				self.senders[sender] = other_totals
+
+	# Pipeline stage: add every scheduled transfer to the totals and pass it on unchanged.
+	# The release timestamps are those of build_pre_proposals.
+	def observe(
+		self,
+		scheduled_transfers:Iterable[Tuple[int, Dict[str, Any], AmountSchedule]],
+		timestamps:Tuple[int, ...],
+		schedules:Optional[Dict[str, ReleaseSchedule]] = None
+		) -> Iterator[Tuple[int, Dict[str, Any], AmountSchedule]]:
+		for scheduled_transfer in scheduled_transfers:
+			transfer = scheduled_transfer[1]
+			transfer_timestamps = timestamps if schedules is None or "schedule" not in transfer else schedules[transfer["schedule"]].timestamps
+			self.add(transfer, scheduled_transfer[2], transfer_timestamps)
+			yield scheduled_transfer
+
+	# Returns the overall totals
+	def to_dict(self) -> Dict[str, Any]:
+		return {"transfers" : self.transfers, "releases" : self.releases, "amount" : self.amount}
+
+	# Returns the overall totals and those of every sender, each with its cash-flow profile
+	def report(self) -> Dict[str, Any]:
+		profile = SenderTotals()
+		for sender_totals in self.senders.values():
+			profile.merge(sender_totals)
+		report = self.to_dict()
+		report["schedule"] = profile.to_dict()["schedule"]
+		report["senders"] = {sender : self.senders[sender].to_dict() for sender in sorted(self.senders)}
+		return report
+
+# Raise a ValueError if any sender commits more than its balance (in microGTU), listing all such senders.
+# Senders that are missing in balances are treated as having a balance of 0.
+def check_balances(totals:TransferTotals, balances:Dict[str, int]):
+	underfunded = [f"Sender {sender} commits {sender_totals.amount} microGTU, but its balance is {balances.get(sender, 0)} microGTU."
+		for sender, sender_totals in sorted(totals.senders.items()) if sender_totals.amount > balances.get(sender, 0)]
+	if underfunded:
+		raise ValueError("Insufficient balance. No pre-proposals were generated.\n" + "\n".join(underfunded))
+
+# Read a csv file with the balances of sender accounts. Each row contains an address and its balance in GTU,
+# formatted like the amounts in the csv file with the transfers.
+# Returns the balances in microGTU by address. Raises a ValueError for the first invalid row.
+def read_balances(filename:str, decimal_sep:str, thousands_sep:str, csv_delimiter:str) -> Dict[str, int]:
+	check_delimiters(decimal_sep, thousands_sep, csv_delimiter)
+	balances = {}
+	for row_number, row_data in read_csv_rows(filename, csv_delimiter, decimal_sep=decimal_sep):
+		if len(row_data) != 2:
+			raise ValueError(f"Incorrect balances file format. Each row must contain exactly 2 entries. Row {row_number} contains {len(row_data)}.")
+		address = row_data[0]
+		if not address_validator.is_valid(address):
+			raise ValueError(f"Invalid address \"{address}\" in row {row_number} of the balances file.")
+		if address in balances:
+			raise ValueError(f"Duplicate address \"{address}\" in row {row_number} of the balances file.")
+		try:
+			balances[address] = TransferAmount.parse_micro_gtu(row_data[1], decimal_sep, thousands_sep)
+		except ValueError as error:
+			raise ValueError(f"In row {row_number} of the balances file: {error}")
+	return balances
+
+# Index of the (sender, receiver) pairs of the transfers in a csv file, built in a single pass with one dictionary lookup
+# per transfer, to find transfers between the same accounts. The mode determines how duplicates are handled:
+# "warn" only reports them, "reject" raises a ValueError, and "merge" replaces them by a single transfer with the summed
+# amounts at the position of the first one. Transfers are identified by their row numbers in the csv file, which are not
+# consecutive if an Excel workbook has empty rows.
+class DuplicateIndex:
+	modes = ("allow", "warn", "reject", "merge")
+
+	def __init__(self, mode:str) -> None:
+		if mode not in self.modes:
+			raise ValueError(f"Invalid duplicates mode \"{mode}\".")
+		self.mode = mode
+		# senders are few, so pairs store a number per sender instead of its address
+		self.sender_ids:Dict[str, int] = {}
+		self.senders:List[str] = []
+		# row number of the first transfer of every pair
+		self.pairs:Dict[Tuple[int, str], int] = {}
+		# row numbers of all transfers of the pairs that occur more than once
+		self.duplicates:Dict[Tuple[int, str], List[int]] = {}
+		# merged transfer of every duplicate pair, see collect
+		self.merged:Dict[Tuple[int, str], Dict[str, Any]] = {}
+
+	def __key(self, sender:str, receiver:str) -> Tuple[int, str]:
+		sender_id = self.sender_ids.get(sender)
+		if sender_id is None:
+			sender_id = self.sender_ids[sender] = len(self.senders)
+			self.senders.append(sender)
+		return (sender_id, receiver)
+
+	# Add the transfer in the given row from sender to receiver
+	def add(self, row_number:int, sender:str, receiver:str):
+		key = self.__key(sender, receiver)
+		first = self.pairs.setdefault(key, row_number)
+		if first != row_number:
+			numbers = self.duplicates.get(key)
+			if numbers is None:
+				numbers = self.duplicates[key] = [first]
+			numbers.append(row_number)
+
+	# Pipeline stage: add all tuples (row_number, transfer), as yielded by iter_csv_transfers, to the index
+	# and pass them on unchanged
+	def index(self, transfers:Iterable[Tuple[int, Dict[str, Any]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+		for row_number, transfer in transfers:
+			self.add(row_number, transfer["sender_address"], transfer["receiver_address"])
+			yield (row_number, transfer)
+
+	# Pipeline stage: add all csv rows to the index and pass them on unchanged. Rows without both addresses are
+	# passed on without being added, the error is reported when they are validated.
+	def index_rows(self, rows:Iterable[Tuple[int, List[str]]]) -> Iterator[Tuple[int, List[str]]]:
+		for row in rows:
+			if len(row[1]) >= 2:
+				self.add(row[0], row[1][0], row[1][1])
+			yield row
+
+	# Returns whether transfers are merged, i.e., whether the transfers have to be passed through collect and deduplicate
+	def merging(self) -> bool:
+		return self.mode == "merge" and len(self.duplicates) > 0
+
+	# Returns the number of transfers that are removed by merging
+	def num_merged(self) -> int:
+		return sum(len(numbers) - 1 for numbers in self.duplicates.values()) if self.mode == "merge" else 0
+
+	# Returns a description of every duplicate pair, in the order of their first transfers
+	def describe_duplicates(self) -> List[str]:
+		return [f"Sender {self.senders[key[0]]} sends to receiver {key[1]} in rows {', '.join(map(str, numbers))}."
+			for key, numbers in sorted(self.duplicates.items(), key=lambda item: item[1][0])]
+
+	# Raise a ValueError listing the duplicates if they are rejected
+	def check(self):
+		if self.mode == "reject" and self.duplicates:
+			descriptions = self.describe_duplicates()
+			message = "Duplicate transfers. No pre-proposals were generated.\n" + "\n".join(descriptions[:MAX_REPORTED_DUPLICATES])
+			if len(descriptions) > MAX_REPORTED_DUPLICATES:
+				message += f"\n... and {len(descriptions) - MAX_REPORTED_DUPLICATES} more."
+			raise ValueError(message)
+
+	# Returns the warnings of the modes "warn" and "merge": all duplicate pairs, and, for "warn",
+	# all receivers that receive transfers from several senders
+	def warnings(self) -> List[str]:
+		if self.mode == "merge":
+			return [description + " The transfers were merged." for description in self.describe_duplicates()]
+		if self.mode != "warn":
+			return []
+		warnings = self.describe_duplicates()
+		senders_per_receiver:Dict[str, int] = {}
+		for _, receiver in self.pairs:
+			senders_per_receiver[receiver] = senders_per_receiver.get(receiver, 0) + 1
+		warnings.extend(f"Receiver {receiver} receives transfers from {count} senders."
+			for receiver, count in senders_per_receiver.items() if count > 1)
+		return warnings
+
+	# Sum the amounts of the transfers of every duplicate pair, which are then used by deduplicate.
+	# transfers must be the indexed tuples (row_number, transfer) in the same order. Raises a ValueError if a sum is out of range.
+	def collect(self, transfers:Iterable[Tuple[int, Dict[str, Any]]]):
+		merged = {}
+		for row_number, transfer in transfers:
+			key = self.__key(transfer["sender_address"], transfer["receiver_address"])
+			if key not in self.duplicates:
+				continue
+			if key not in merged:
+				merged[key] = dict(transfer)
+				continue
+			merged_transfer = merged[key]
+			if merged_transfer.get("schedule") != transfer.get("schedule"):
+				raise ValueError(f"Row {row_number} cannot be merged with row {self.pairs[key]}, since they have different schedules.")
+			try:
+				for amount_key in ("amount", "initial_amount", "remaining_amount"):
+					if amount_key in transfer:
+						merged_transfer[amount_key] = merged_transfer[amount_key] + transfer[amount_key]
+			except ValueError as error:
+				raise ValueError(f"Merging row {row_number} with row {self.pairs[key]}: {error}")
+		self.merged = merged
+
+	# Pipeline stage: replace the transfers of every duplicate pair by their merged transfer, see collect.
+	# Takes the indexed tuples (row_number, transfer) and yields the transfers only.
+	def deduplicate(self, transfers:Iterable[Tuple[int, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+		for row_number, transfer in transfers:
+			key = self.__key(transfer["sender_address"], transfer["receiver_address"])
+			if key not in self.merged:
+				yield transfer
+			elif self.pairs[key] == row_number:
+				yield self.merged[key]
+
+# Validate all rows of the csv file without keeping them in memory. The schedule of every transfer is computed,
+# so that transfers whose amounts cannot be split into their releases are rejected, unless duplicates are merged,
+# as their transfers are only scheduled once merged. If totals are given, the schedules are added to them, and if a
+# DuplicateIndex is given, every transfer is added to it. Returns the number of transfers. Raises a ValueError for the
+# first invalid row, and if totals are given while duplicates are merged, as they are then computed by aggregate_transfers.
+def validate_csv_transfers(
+	filename:str,
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	totals:Optional[TransferTotals] = None,
+	duplicates:Optional[DuplicateIndex] = None
+	) -> int:
+	schedule = duplicates is None or duplicates.mode != "merge"
+	if not schedule and totals is not None:
+		raise ValueError("The totals of merged transfers can only be computed once they are merged, see aggregate_transfers.")
+	num_transfers = 0
+	for row_number, transfer in iter_csv_transfers(filename, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], csv_delimiter, job["mmap"], job["schedules"]):
+		if schedule:
+			amounts = row_amounts(row_number, transfer, job)
+		num_transfers += 1
+		if duplicates is not None:
+			duplicates.add(row_number, transfer["sender_address"], transfer["receiver_address"])
+		if totals is not None:
+			totals.add(transfer, amounts, transfer_schedule(transfer, job).timestamps)
+	return num_transfers
+
+# Compute the schedule of every transfer, adding them to totals if given. Returns the number of transfers.
+# Raises a ValueError for the first transfer that cannot be scheduled.
+def aggregate_transfers(transfers:Iterable[Dict[str, Any]], job:Dict[str, Any], totals:Optional[TransferTotals]) -> int:
+	num_transfers = 0
+	scheduled_transfers = schedule_transfers(transfers, job["is_welcome"], job["num_releases"], job["skipped_releases"], job["schedules"])
+	if totals is not None:
+		scheduled_transfers = totals.observe(scheduled_transfers, job["release_timestamps"], job["schedules"])
+	for _ in scheduled_transfers:
+		num_transfers += 1
+	return num_transfers
+
+# Split an iterable into lists of at most chunk_size elements
+def chunked(iterable:Iterable[Any], chunk_size:int) -> Iterator[List[Any]]:
+	chunk = []
+	for item in iterable:
+		chunk.append(item)
+		if len(chunk) == chunk_size:
+			yield chunk
+			chunk = []
+	if chunk:
+		yield chunk
+
+# Run fn on every chunk using the executor and yield the results in the order of the chunks.
+# At most max_pending chunks are submitted at a time, so the input is never loaded into memory at once.
+def map_chunks(executor:'Executor', fn:Callable[[List[Any]], Any], chunks:Iterable[List[Any]], max_pending:int) -> Iterator[Any]:
+	pending = deque()
+	for chunk in chunks:
+		pending.append(executor.submit(fn, chunk))
+		if len(pending) >= max_pending:
+			yield pending.popleft().result()
+	while pending:
+		yield pending.popleft().result()
+
+# Worker for parallel generation: validate a chunk of csv rows, computing the schedule of every row, and if aggregate
+# is set, add the schedules to totals. Returns a tuple with the number of rows in the chunk, the error message of the
+# first invalid row (or None if all are valid), the address cache hits and misses of the chunk, and the totals (or None).
+def validate_rows(rows:List[Tuple[int, List[str]]], job:Dict[str, Any], aggregate:bool = False) -> Tuple[int, Optional[str], int, int, Optional[TransferTotals]]:
+	(hits, misses) = (address_validator.hits, address_validator.misses)
+	totals = TransferTotals() if aggregate else None
+	error = None
+	try:
+		transfers = parse_rows(rows, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], job["schedules"])
+		for (row_number, _), transfer in zip(rows, transfers):
+			amounts = row_amounts(row_number, transfer, job)
+			if totals is not None:
+				totals.add(transfer, amounts, transfer_schedule(transfer, job).timestamps)
+	except ValueError as e:
+		error = str(e)
+	return (len(rows), error, address_validator.hits - hits, address_validator.misses - misses, totals)
+
+# An error in one column of a csv row, as collected by --validate-only. column is the 1-based column number,
+# and None together with value if the error concerns the whole row, e.g., its number of columns.
+class RowError:
+	__slots__ = ("row", "column", "value", "reason")
+
+	def __init__(self, row:int, column:Optional[int], value:Optional[str], reason:str) -> None:
+		self.row = row
+		self.column = column
+		self.value = value
+		self.reason = reason
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {"row" : self.row, "column" : self.column, "value" : self.value, "reason" : self.reason}
+
+	def __str__(self):
+		if self.column is None:
+			return f"Row {self.row}: {self.reason}"
+		return f"Row {self.row}, column {self.column} (\"{self.value}\"): {self.reason}"
+
+# Returns all errors of a single csv row, instead of raising a ValueError for the first one like parse_row.
+# Every column is checked, and if all are valid, the release amounts of the transfer are computed.
+# valid_addresses are whether the sender and receiver are valid, if they were already checked, see collect_row_errors.
+def row_errors(row_number:int, row_data:List[str], job:Dict[str, Any], valid_addresses:Optional[Tuple[bool, bool]] = None) -> List[RowError]:
+	is_welcome = job["is_welcome"]
+	schedule_ids = job["schedules"]
+	expected = 3 if is_welcome else 4
+	if len(row_data) != expected and not (len(row_data) == 5 and schedule_ids is not None and not is_welcome):
+		return [RowError(row_number, None, None, f"Row contains {len(row_data)} entries, expected {expected}.")]
+	errors = []
+	for column, what in [(1, "sender"), (2, "receiver")]:
+		valid = address_validator.is_valid(row_data[column - 1]) if valid_addresses is None else valid_addresses[column - 1]
+		if not valid:
+			errors.append(RowError(row_number, column, row_data[column - 1], f"Invalid {what} address."))
+	for column in range(3, expected + 1):
+		try:
+			TransferAmount.from_string(row_data[column - 1], job["decimal_sep"], job["thousands_sep"])
+		except ValueError as error:
+			errors.append(RowError(row_number, column, row_data[column - 1], str(error)))
+	if len(row_data) == 5 and row_data[4] and row_data[4] not in schedule_ids:
+		errors.append(RowError(row_number, 5, row_data[4], "Unknown schedule."))
+	if not errors:
+		transfer = row_to_transfer(row_number, row_data, is_welcome, job["decimal_sep"], job["thousands_sep"])
+		schedule = transfer_schedule(transfer, job)
+		try:
+			transfer_amounts(transfer, is_welcome, schedule.num_releases, schedule.skipped_releases)
+		except (ValueError, AssertionError) as error:
+			errors.append(RowError(row_number, None, None, str(error)))
+	return errors
+
+# Report of --validate-only: the number of rows and invalid rows, and the errors of the first invalid rows.
+# At most max_errors errors are kept, but all invalid rows are counted.
+class ValidationReport:
+	def __init__(self, max_errors:int = DEFAULT_MAX_ERRORS) -> None:
+		if max_errors < 0:
+			raise ValueError(f"The maximal number of errors must not be negative, was {max_errors}")
+		self.max_errors = max_errors
+		self.rows = 0
+		self.invalid_rows = 0
+		self.num_errors = 0
+		self.errors:List[RowError] = []
+
+	# Add the errors of one row
+	def add(self, errors:List[RowError]):
+		self.rows += 1
+		if errors:
+			self.invalid_rows += 1
+			self.add_errors(errors)
+
+	# Add errors, keeping at most max_errors of all errors
+	def add_errors(self, errors:List[RowError]):
+		self.num_errors += len(errors)
+		self.errors.extend(errors[:self.max_errors - len(self.errors)])
+
+	# Add the report of a later chunk of rows, e.g., from a worker process
+	def merge(self, other:'ValidationReport'):
+		self.rows += other.rows
+		self.invalid_rows += other.invalid_rows
+		self.num_errors += other.num_errors
+		self.errors.extend(other.errors[:self.max_errors - len(self.errors)])
+
+	def is_valid(self) -> bool:
+		return self.invalid_rows == 0
+
+	# Returns whether errors were left out of the report
+	def truncated(self) -> bool:
+		return self.num_errors > len(self.errors)
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {
+			"rows" : self.rows,
+			"invalid_rows" : self.invalid_rows,
+			"errors" : self.num_errors,
+			"truncated" : self.truncated(),
+			"reported_errors" : [error.to_dict() for error in self.errors]
+		}
+
+# Worker for parallel validation: collect the errors of a chunk of csv rows, checking the addresses column by column.
+# Returns the report of the chunk, and the address cache hits and misses of the chunk.
+def collect_row_errors(rows:List[Tuple[int, List[str]]], job:Dict[str, Any], max_errors:int) -> Tuple[ValidationReport, int, int]:
+	(hits, misses) = (address_validator.hits, address_validator.misses)
+	report = ValidationReport(max_errors)
+	(invalid_senders, invalid_receivers) = (set(positions) for positions in invalid_address_positions(rows))
+	for position, (row_number, row_data) in enumerate(rows):
+		valid_addresses = (position not in invalid_senders, position not in invalid_receivers)
+		report.add(row_errors(row_number, row_data, job, valid_addresses))
+	return (report, address_validator.hits - hits, address_validator.misses - misses)
+
+# Check all rows of the csv file, collecting the errors of all invalid rows instead of stopping at the first one.
+# With more than one job, chunks of rows are checked by worker processes, and the report is the same as a serial one.
+# Nothing is written. Raises a ValueError if the delimiters are invalid.
+def validate_csv_file(
+	filename:str,
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	max_errors:int = DEFAULT_MAX_ERRORS,
+	jobs:int = 1,
+	chunk_size:int = PARALLEL_CHUNK_SIZE
+	) -> ValidationReport:
+	check_delimiters(job["decimal_sep"], job["thousands_sep"], csv_delimiter)
+	report = ValidationReport(max_errors)
+	chunks = chunked(read_csv_rows(filename, csv_delimiter, job["mmap"], job["decimal_sep"]), chunk_size)
+	worker = partial(collect_row_errors, job=job, max_errors=max_errors)
+	if jobs > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=jobs) as executor:
+			for (chunk_report, hits, misses) in map_chunks(executor, worker, chunks, 2*jobs):
+				address_validator.merge_stats(hits, misses)
+				report.merge(chunk_report)
+	else:
+		for chunk in chunks:
+			report.merge(worker(chunk)[0])
+	return report
+
+# Returns the pre-proposal for a single csv row of a parallel generation job
+def row_pre_proposal(row_number:int, row_data:List[str], job:Dict[str, Any]) -> Union[ScheduledPreProposal, TemplatePreProposal, SplitPreProposal]:
+	transfer = parse_row(row_number, row_data, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], job["schedules"])
+	amounts = row_amounts(row_number, transfer, job)
+	return make_pre_proposals(transfer, amounts, transfer_schedule(transfer, job).timestamps, job["expiry"], job["serializer"] == "template", job["max_releases"])
+
+# Worker for parallel generation: generate and write the pre-proposals for a chunk of numbered csv rows, given as tuples
+# (transfer_number, (row_number, row_data)). Transfers are numbered by their position in the input, as in a serial run,
+# which differs from the row number if rows are skipped, e.g., the empty rows of a workbook.
+# Returns the name of the first file that could not be written, or None if all were written.
+def write_rows(rows:List[Tuple[int, Tuple[int, List[str]]]], job:Dict[str, Any]) -> Optional[str]:
+	for transfer_number, (row_number, row_data) in rows:
+		pre_proposal = row_pre_proposal(row_number, row_data, job)
+		for out_file_name, part in output_parts(job["json_output_prefix"], transfer_number, job["file_number_width"], pre_proposal):
+			try:
+				part.write_json(out_file_name, job["compact"])
+			except IOError:
+				return out_file_name
+	return None
+
+# Worker for parallel generation: generate the pre-proposals for a chunk of numbered csv rows, see write_rows, and return
+# them serialized, as a list of tuples (file name, json), so that they can be added to a bundle.
+def serialize_rows(rows:List[Tuple[int, Tuple[int, List[str]]]], job:Dict[str, Any]) -> List[Tuple[str, str]]:
+	return [(os.path.basename(out_file_name), part.to_json(job["compact"]))
+		for transfer_number, (row_number, row_data) in rows
+		for out_file_name, part in output_parts(job["json_output_prefix"], transfer_number, job["file_number_width"], row_pre_proposal(row_number, row_data, job))]
+
+# Generate the pre-proposals for all rows of the csv file using a pool of worker processes.
+# All rows are validated before anything is written. The files are identical to those of a serial run.
+# If a bundle is given, the workers only serialize the pre-proposals and they are added to the bundle in order.
+# If totals are given, the transfers are added to them while validating, and if balances are given,
+# they are checked before anything is written. A DuplicateIndex can only be given if it does not merge.
+# If a FileWriter is given, the workers only serialize the pre-proposals, which are then written by its threads.
+# Returns the number of transfers. Raises a ValueError for the first invalid row and a WriteError
+# if a file could not be written.
+def generate_in_parallel(
+	filename:str,
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	jobs:int,
+	chunk_size:int = PARALLEL_CHUNK_SIZE,
+	bundle:Optional[PreProposalBundle] = None,
+	totals:Optional[TransferTotals] = None,
+	balances:Optional[Dict[str, int]] = None,
+	duplicates:Optional[DuplicateIndex] = None,
+	writer:Optional[FileWriter] = None
+	) -> int:
+	from concurrent.futures import ProcessPoolExecutor
+	if duplicates is not None and duplicates.mode == "merge":
+		raise ValueError("Duplicate transfers can only be merged with a single job.")
+	check_delimiters(job["decimal_sep"], job["thousands_sep"], csv_delimiter)
+	num_transfers = 0
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		rows = read_csv_rows(filename, csv_delimiter, job["mmap"], job["decimal_sep"])
+		if duplicates is not None:
+			# the rows are indexed by the main process while they are validated by the workers
+			rows = duplicates.index_rows(rows)
+		chunks = chunked(rows, chunk_size)
+		for (num_rows, error, hits, misses, chunk_totals) in map_chunks(executor, partial(validate_rows, job=job, aggregate=totals is not None), chunks, 2*jobs):
+			address_validator.merge_stats(hits, misses)
+			if error is not None:
+				raise ValueError(error)
+			num_transfers += num_rows
+			if totals is not None:
+				totals.merge(chunk_totals)
+		if duplicates is not None:
+			duplicates.check()
+		if balances is not None:
+			check_balances(totals, balances)
+
+		job = dict(job, file_number_width=file_number_width(num_transfers))
+		chunks = chunked(enumerate(read_csv_rows(filename, csv_delimiter, job["mmap"], job["decimal_sep"]), start=1), chunk_size)
+		if writer is not None:
+			folder = os.path.dirname(job["json_output_prefix"])
+			for serialized in map_chunks(executor, partial(serialize_rows, job=job), chunks, 2*jobs):
+				for name, content in serialized:
+					writer.submit(os.path.join(folder, name), content)
+		elif bundle is None:
+			for failed_file in map_chunks(executor, partial(write_rows, job=job), chunks, 2*jobs):
+				if failed_file is not None:
+					raise WriteError(failed_file)
+		else:
+			for serialized in map_chunks(executor, partial(serialize_rows, job=job), chunks, 2*jobs):
+				for name, content in serialized:
+					try:
+						bundle.add(name, content)
+					except IOError:
+						raise WriteError(bundle.filename)
+	return num_transfers
+
+# Write all pre-proposals, either to one json file each, or into the bundle if one is given.
+# If a FileWriter is given, the json files are written by its threads. If a manifest is given,
+# every written file is recorded in it.
+# Raises a WriteError if a file could not be written.
+def write_pre_proposals(
+	pre_proposals:Iterable[Tuple[int, Union[ScheduledPreProposal, TemplatePreProposal, SplitPreProposal]]],
+	json_output_prefix:str,
+	width:int,
+	compact:bool,
+	bundle:Optional[PreProposalBundle] = None,
+	manifest:Optional['Manifest'] = None,
+	writer:Optional[FileWriter] = None
+	):
+	for transfer_number, pre_proposal in pre_proposals:
+		parts = output_parts(json_output_prefix, transfer_number, width, pre_proposal)
+		for out_file_name, part in parts:
+			if writer is not None:
+				writer.submit(out_file_name, part.to_json(compact))
+				continue
+			try:
+				if bundle is None:
+					part.write_json(out_file_name, compact)
+				else:
+					bundle.add(os.path.basename(out_file_name), part.to_json(compact))
+			except IOError:
+				raise WriteError(out_file_name if bundle is None else bundle.filename)
+		if manifest is not None:
+			manifest.record(transfer_number, [out_file_name for out_file_name, _ in parts])
+
+# Returns a hash of the content of a transfer. The hash does not depend on how the amounts are formatted in the csv file.
+def transfer_hash(transfer:Dict[str, Any]) -> str:
+	import hashlib
+	fields = [transfer["sender_address"], transfer["receiver_address"]]
+	fields.extend(str(transfer[key].get_micro_GTU()) for key in ("amount", "initial_amount", "remaining_amount") if key in transfer)
+	if "schedule" in transfer:
+		fields.append(transfer["schedule"])
+	return hashlib.sha256(",".join(fields).encode('utf-8')).hexdigest()
+
+# Returns the sha256 hash of the content of a file, or None if it cannot be read
+def file_hash(filename:str) -> Optional[str]:
+	import hashlib
+	try:
+		with open(filename, 'rb') as in_file:
+			return hashlib.sha256(in_file.read()).hexdigest()
+	except IOError:
+		return None
+
+# Manifest of the pre-proposals written by a resumable run (see --resume), stored as JSON Lines.
+# The first line records the parameters shared by all pre-proposals of the run and their expiry. Every further line
+# records the written pre-proposal of a transfer: the transfer number, a hash of the transfer, and the names and hashes
+# of its files, i.e., one file, or one per part if the transfer was split (see --max-releases).
+# Lines are appended while writing, so after a failed run the manifest lists all files written so far, and a rerun
+# only writes the pre-proposals that are missing, changed, or whose transfer changed.
+class Manifest:
+	version:int = 2
+
+	def __init__(self, filename:str, job:Dict[str, Any]):
+		self.filename = filename
+		self.fingerprint = self.job_fingerprint(job)
+		self.expiry = job["expiry"]
+		# entries of the previous run by transfer number, if they can be reused
+		self.previous:Dict[int, Dict[str, Any]] = {}
+		# all files listed by the previous run, whether they can be reused or not
+		self.previous_files:set = set()
+		# entries of this run by transfer number, and the hashes of the transfers that are still to be written
+		self.entries:Dict[int, Dict[str, Any]] = {}
+		self.pending:Dict[int, str] = {}
+		self.reused = 0
+		self.file:Optional[IO[str]] = None
+
+	# Returns a hash of the parameters that, besides the transfer and the expiry, determine the content of a pre-proposal
+	@staticmethod
+	def job_fingerprint(job:Dict[str, Any]) -> str:
+		import hashlib
+		import json
+		parameters = [job["is_welcome"], job["num_releases"], job["skipped_releases"], list(job["release_timestamps"]), job["compact"]]
+		if job["schedules"] is not None:
+			parameters.append([[schedule_id, schedule.num_releases, schedule.skipped_releases, list(schedule.timestamps)]
+				for schedule_id, schedule in sorted(job["schedules"].items())])
+		return hashlib.sha256(json.dumps(parameters).encode('utf-8')).hexdigest()
+
+	# Read the manifest of a previous run, if there is one. Its pre-proposals are reused if they were generated with
+	# the same parameters and expire at least RESUME_MIN_VALIDITY_MINUTES from now. In that case, the returned job
+	# uses the expiry of the previous run, so that all pre-proposals expire at the same time. Otherwise job is returned.
+	def load(self, job:Dict[str, Any]) -> Dict[str, Any]:
+		import json
+		try:
+			with open(self.filename) as manifest_file:
+				lines = manifest_file.read().splitlines()
+		except FileNotFoundError:
+			return job
+		entries = []
+		for line in lines:
+			try:
+				entries.append(json.loads(line))
+			except ValueError:
+				# e.g., the last line of a run that was killed while writing it
+				continue
+		if not entries:
+			return job
+		(header, entries) = (entries[0], [entry for entry in entries[1:] if "transfer" in entry])
+		self.previous_files = {file_name for entry in entries for file_name in entry["files"]}
+		if header.get("version") != self.version or header.get("fingerprint") != self.fingerprint:
+			return job
+		expiry = datetime.fromisoformat(header["expiry"])
+		if expiry.timestamp() < (datetime.now() + timedelta(minutes = +RESUME_MIN_VALIDITY_MINUTES)).timestamp():
+			return job
+		# later lines replace earlier ones for the same transfer
+		self.previous = {entry["transfer"] : entry for entry in entries}
+		self.expiry = expiry
+		return dict(job, expiry=expiry)
+
+	# Pipeline stage: pass on the scheduled transfers whose pre-proposal must be written.
+	# Transfers whose pre-proposal from the previous run is unchanged are skipped.
+	# max_releases is the maximal number of releases per pre-proposal, see make_pre_proposals.
+	def skip_current(
+		self,
+		scheduled_transfers:Iterable[Tuple[int, Dict[str, Any], AmountSchedule]],
+		json_output_prefix:str,
+		width:int,
+		max_releases:Optional[int] = None
+		) -> Iterator[Tuple[int, Dict[str, Any], AmountSchedule]]:
+		for scheduled_transfer in scheduled_transfers:
+			(transfer_number, transfer, amounts) = scheduled_transfer
+			row_hash = transfer_hash(transfer)
+			entry = self.previous.get(transfer_number)
+			if entry is not None and entry["row_hash"] == row_hash \
+				and entry["files"] == output_file_names(json_output_prefix, transfer_number, width, num_parts(len(amounts), max_releases)) \
+				and [file_hash(file_name) for file_name in entry["files"]] == entry["file_hashes"]:
+				self.entries[transfer_number] = entry
+				self.reused += 1
+			else:
+				self.pending[transfer_number] = row_hash
+				yield scheduled_transfer
+
+	# Start writing the manifest. Entries of the previous run stay valid if they are reused.
+	def open(self):
+		import json
+		try:
+			if self.previous:
+				self.file = open(self.filename, 'a')
+			else:
+				self.file = open(self.filename, 'w')
+				self.file.write(json.dumps({"version" : self.version, "fingerprint" : self.fingerprint, "expiry" : self.expiry.isoformat()}) + "\n")
+		except IOError:
+			raise WriteError(self.filename)
+
+	# Record that the pre-proposal of the given transfer has been written to the files file_names
+	def record(self, transfer_number:int, file_names:List[str]):
+		import json
+		entry = {"transfer" : transfer_number, "row_hash" : self.pending.pop(transfer_number), "files" : file_names,
+			"file_hashes" : [file_hash(file_name) for file_name in file_names]}
+		self.entries[transfer_number] = entry
+		try:
+			self.file.write(json.dumps(entry) + "\n")
+		except IOError:
+			raise WriteError(self.filename)
+
+	# Stop writing the manifest, e.g., after an error
+	def close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	# Finish a successful run: rewrite the manifest with only the current entries, and remove the files of the
+	# previous run that no longer belong to any transfer, e.g., because the csv file has fewer rows now.
+	def finish(self):
+		import json
+		self.close()
+		temp_filename = self.filename + ".tmp"
+		try:
+			with open(temp_filename, 'w') as manifest_file:
+				manifest_file.write(json.dumps({"version" : self.version, "fingerprint" : self.fingerprint, "expiry" : self.expiry.isoformat()}) + "\n")
+				for transfer_number in sorted(self.entries):
+					manifest_file.write(json.dumps(self.entries[transfer_number]) + "\n")
+			os.replace(temp_filename, self.filename)
+		except IOError:
+			raise WriteError(self.filename)
+		current_files = {file_name for entry in self.entries.values() for file_name in entry["files"]}
+		for stale_file in self.previous_files - current_files:
+			if os.path.exists(stale_file):
+				os.remove(stale_file)
+
+# Returns the total size in bytes of the files written for num_transfers transfers
+def output_size(job:Dict[str, Any], num_transfers:int, bundle:Optional[PreProposalBundle]) -> int:
+	if bundle is not None:
+		return os.path.getsize(bundle.filename)
+	import glob
+	width = file_number_width(num_transfers)
+	size = 0
+	for transfer_number in range(1, num_transfers + 1):
+		out_file_name = output_file_name(job["json_output_prefix"], transfer_number, width)
+		if os.path.exists(out_file_name):
+			size += os.path.getsize(out_file_name)
+		else:
+			# the transfer was split into parts, see output_file_names
+			size += sum(os.path.getsize(part_file_name) for part_file_name in glob.glob(glob.escape(out_file_name[:-len(".json")]) + "-*.json"))
+	return size
+
+# Write the report of the profiler as json, together with the address cache statistics
+def write_profile_report(filename:str, profiler:StageProfiler, csv_input_file:str, jobs:int):
+	import json
+	report = profiler.report()
+	report["input_csv"] = csv_input_file
+	report["jobs"] = jobs
+	report["address_cache"] = {"hits" : address_validator.hits, "misses" : address_validator.misses}
+	try:
+		with open(filename, 'w') as report_file:
+			json.dump(report, report_file, indent=4)
+	except IOError:
+		raise WriteError(filename)
+
+# Write the totals of all senders, with their cash-flow profiles, as json
+def write_sender_totals(filename:str, totals:TransferTotals):
+	import json
+	try:
+		with open(filename, 'w') as report_file:
+			json.dump(totals.report(), report_file, indent=4)
+	except IOError:
+		raise WriteError(filename)
+
+# Generate the pre-proposals for all transfers in the csv file and write them in the given output format.
+# Nothing is written if any row of the csv file is invalid.
+# If a StageProfiler is given, the stages of the run are measured by it.
+# If a loaded Manifest is given, unchanged pre-proposals of the previous run are kept (only for a single
+# process and one json file per transfer).
+# If TransferTotals are given, all transfers are added to them.
+# If balances (in microGTU by address) are given, the total amount of every sender is checked against its balance
+# before anything is written, and a ValueError is raised if any balance is insufficient.
+# If a DuplicateIndex is given, all transfers are added to it and duplicates are handled according to its mode
+# before anything is written. Merging duplicates requires a single job.
+# If a FileWriter is given, the json files are written by its threads, and once all of them have been written,
+# the marker file of the run is written (see write_complete_marker).
+# Returns the number of transfers. Raises a ValueError for invalid input, a WriteError if the output
+# could not be written, and an IOError if the csv file could not be read.
+def generate(
+	csv_input_file:str,
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	jobs:int = 1,
+	stream:bool = False,
+	output_format:str = "json",
+	profiler:Union[StageProfiler, NullProfiler] = null_profiler,
+	manifest:Optional[Manifest] = None,
+	totals:Optional[TransferTotals] = None,
+	balances:Optional[Dict[str, int]] = None,
+	duplicates:Optional[DuplicateIndex] = None,
+	writer:Optional[FileWriter] = None
+	) -> int:
+	bundle_class = OUTPUT_FORMATS[output_format]
+	if manifest is not None and (jobs > 1 or bundle_class is not None or writer is not None):
+		raise ValueError("A manifest can only be used with a single job and one json file per transfer, written by the main thread.")
+	if writer is not None:
+		if bundle_class is not None:
+			raise ValueError("Writer threads can only be used with one json file per transfer.")
+		# a marker of a previous run must not be mistaken for one of this run
+		marker_name = complete_marker_name(job["json_output_prefix"])
+		if os.path.exists(marker_name):
+			try:
+				os.remove(marker_name)
+			except IOError:
+				raise WriteError(marker_name)
+	# the balances are checked against the totals, which are then computed before writing
+	precheck = balances is not None
+	if precheck and totals is None:
+		totals = TransferTotals()
+	bundle = None
+	if bundle_class is not None:
+		# The bundle is named like the json files, without the transfer number
+		bundle_file_name = job["json_output_prefix"][:-1] + bundle_class.extension
+		job = dict(job, compact=job["compact"] or bundle_class.requires_compact)
+		try:
+			bundle = bundle_class(bundle_file_name)
+		except IOError:
+			raise WriteError(bundle_file_name)
+
+	try:
+		if jobs > 1:
+			# the work is done by the worker processes, so only the main process is measured, as a single stage
+			with profiler.stage("generate_in_parallel"):
+				num_transfers = generate_in_parallel(csv_input_file, csv_delimiter, job, jobs, bundle=bundle, totals=totals, balances=balances, duplicates=duplicates, writer=writer)
+			profiler.count("generate_in_parallel", rows=num_transfers)
+		else:
+			if profiler.enabled:
+				read_transfers = partial(profiled_csv_transfers, profiler=profiler)
+			else:
+				read_transfers = iter_csv_transfers
+			merge = duplicates is not None and duplicates.mode == "merge"
+			# whether the totals have already been computed before writing
+			aggregated = False
+			if stream:
+				# Validate all rows first, so that no file is written if any row is invalid.
+				# The transfers are then read again one at a time while writing.
+				# If balances are checked, the totals are computed in the same pass, unless duplicates may be merged.
+				aggregated = precheck and not merge
+				with profiler.stage("validate"):
+					num_transfers = validate_csv_transfers(csv_input_file, csv_delimiter, job, totals if aggregated else None, duplicates)
+				profiler.count("validate", rows=num_transfers)
+				rows = read_transfers(csv_input_file, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], csv_delimiter, use_mmap=job["mmap"], schedule_ids=job["schedules"])
+				transfers = (transfer for _, transfer in rows)
+				read_again = lambda: iter_csv_transfers(csv_input_file, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], csv_delimiter, job["mmap"], job["schedules"])
+				if duplicates is not None:
+					duplicates.check()
+					if merge:
+						# sum the duplicates in another pass, only the merged transfers are kept in memory.
+						# Transfers are scheduled once merged, in a further pass, so that they are checked before writing.
+						with profiler.stage("merge_duplicates"):
+							if duplicates.merging():
+								duplicates.collect(read_again())
+							aggregate_transfers(duplicates.deduplicate(read_again()), job, totals if precheck else None)
+							aggregated = precheck
+						transfers = duplicates.deduplicate(rows)
+						num_transfers -= duplicates.num_merged()
+			else:
+				# the amounts of every row are checked while reading, so that no file is written if any row cannot be scheduled.
+				# Duplicates are scheduled once merged, so their rows are not checked.
+				check_job = job if not merge else None
+				if profiler.enabled or duplicates is not None:
+					# duplicates are identified by the row numbers of their transfers
+					rows = read_transfers(csv_input_file, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], csv_delimiter, use_mmap=job["mmap"], schedule_ids=job["schedules"])
+					rows = list(check_row_amounts(rows, check_job) if check_job is not None else rows)
+					transfers = [transfer for _, transfer in rows]
+				else:
+					transfers = csv_to_list(csv_input_file, job["is_welcome"], job["decimal_sep"], job["thousands_sep"], csv_delimiter, job["mmap"], job["schedules"], check_job)
+				if duplicates is not None:
+					with profiler.stage("merge_duplicates" if merge else "index_duplicates"):
+						for _ in duplicates.index(rows):
+							pass
+						duplicates.check()
+						if duplicates.merging():
+							duplicates.collect(rows)
+							transfers = list(duplicates.deduplicate(rows))
+						if merge:
+							# transfers are scheduled once merged, so they are checked before writing instead of the rows
+							aggregate_transfers(transfers, job, None)
+				num_transfers = len(transfers)
+
+			# process all transfers, each stage handles one transfer at a time
+			scheduled_transfers = profiler.iterate("schedule", schedule_transfers(transfers, job["is_welcome"], job["num_releases"], job["skipped_releases"], job["schedules"]))
+			if totals is not None and not aggregated:
+				scheduled_transfers = totals.observe(scheduled_transfers, job["release_timestamps"], job["schedules"])
+				if precheck:
+					# schedule all transfers before writing, keeping the schedules for writing
+					scheduled_transfers = list(scheduled_transfers)
+			if precheck:
+				check_balances(totals, balances)
+			if manifest is not None:
+				scheduled_transfers = manifest.skip_current(scheduled_transfers, job["json_output_prefix"], file_number_width(num_transfers), job["max_releases"])
+				manifest.open()
+			pre_proposals = profiler.iterate("build_pre_proposals", build_pre_proposals(scheduled_transfers, job["release_timestamps"], job["expiry"], job["serializer"] == "template", job["schedules"], job["max_releases"]))
+			with profiler.stage("write"):
+				write_pre_proposals(pre_proposals, job["json_output_prefix"], file_number_width(num_transfers), job["compact"], bundle, manifest, writer)
+			if manifest is not None:
+				manifest.finish()
+
+		if bundle is not None:
+			with profiler.stage("write"):
+				try:
+					bundle.close()
+				except IOError:
+					raise WriteError(bundle.filename)
+		if writer is not None:
+			with profiler.stage("write"):
+				writer.close()
+				write_complete_marker(job["json_output_prefix"], num_transfers, writer.written, writer.sync)
+
+		if profiler.enabled:
+			profiler.count("write", rows=num_transfers, bytes=output_size(job, num_transfers, bundle))
+	except BaseException:
+		if bundle is not None:
+			bundle.abort()
+		if writer is not None:
+			writer.abort()
+		if manifest is not None:
+			manifest.close()
+		raise
+
+	return num_transfers
+
+# Returns the prefix of the output files for a csv file. The files are written to the current folder and contain the csv file name.
+def output_prefix(csv_input_file:str) -> str:
+	return "pre-proposal_" + os.path.splitext(os.path.basename(csv_input_file))[0] + "_"
+
+# Expand the glob patterns among the input file names, e.g., "tranches/*.csv", in sorted order.
+# Names without wildcards are kept as they are. Raises a ValueError if a pattern does not match any file.
+def expand_input_files(patterns:Iterable[str]) -> List[str]:
+	input_files = []
+	for pattern in patterns:
+		# the wildcards of glob.has_magic, without importing glob for plain file names
+		if any(wildcard in pattern for wildcard in "*?["):
+			import glob
+			matches = sorted(glob.glob(pattern))
+			if not matches:
+				raise ValueError(f"No file matches \"{pattern}\".")
+			input_files.extend(matches)
+		else:
+			input_files.append(pattern)
+	return input_files
+
+# Worker for batch mode: generate the pre-proposals for one csv file of a batch, using the release schedule
+# and expiry of the batch in job. No error stops the other files of the batch, all are returned as part of the result.
+# Returns a dictionary with the file name, the totals of the file, the exit code main would use for this file and the
+# error message (or None), the address cache statistics, the time used and the warnings about duplicate transfers,
+# which are handled according to the DuplicateIndex mode duplicates. If writer_threads is positive, the files are
+# written by a FileWriter with that many threads, syncing them if sync is set.
+def generate_batch_file(
+	csv_input_file:str,
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	stream:bool,
+	output_format:str,
+	duplicates:str = "allow",
+	writer_threads:int = 0,
+	sync:bool = False
+	) -> Dict[str, Any]:
+	job = dict(job, json_output_prefix=output_prefix(csv_input_file))
+	totals = TransferTotals()
+	duplicate_index = DuplicateIndex(duplicates) if duplicates != "allow" else None
+	writer = FileWriter(writer_threads, sync) if writer_threads > 0 else None
+	(hits, misses) = (address_validator.hits, address_validator.misses)
+	(exit_code, error) = (0, None)
+	start = perf_counter()
+	try:
+		generate(csv_input_file, csv_delimiter, job, 1, stream, output_format, totals=totals, duplicates=duplicate_index, writer=writer)
+	except WriteError as e:
+		(exit_code, error) = (3, str(e))
+	except IOError as e:
+		(exit_code, error) = (3, f"Error reading file \"{csv_input_file}\": {e}")
+	except ValueError as e:
+		(exit_code, error) = (2, f"Error: {e}")
+	except Exception as e:
+		# any other failure is also limited to this file, with the exit code of an uncaught exception
+		(exit_code, error) = (1, f"Error: {type(e).__name__}: {e}")
+	result = {"input_csv" : csv_input_file, "exit_code" : exit_code, "error" : error, "seconds" : perf_counter() - start}
+	result.update(totals.to_dict())
+	result["warnings"] = duplicate_index.warnings() if duplicate_index is not None and error is None else []
+	result["address_cache"] = {"hits" : address_validator.hits - hits, "misses" : address_validator.misses - misses}
+	return result
+
+# Generate the pre-proposals for all csv files of a batch, which share the release schedule and expiry in job.
+# With more than one job, the files are processed concurrently, one file per worker process.
+# Returns the results of generate_batch_file in the order of the files.
+def generate_batch(
+	input_files:Sequence[str],
+	csv_delimiter:str,
+	job:Dict[str, Any],
+	jobs:int = 1,
+	stream:bool = False,
+	output_format:str = "json",
+	duplicates:str = "allow",
+	writer_threads:int = 0,
+	sync:bool = False
+	) -> List[Dict[str, Any]]:
+	prefixes = [output_prefix(csv_input_file) for csv_input_file in input_files]
+	for prefix in prefixes:
+		if prefixes.count(prefix) > 1:
+			raise ValueError(f"Several input files would write to \"{prefix}*\", the file names must be different.")
+	worker = partial(generate_batch_file, csv_delimiter=csv_delimiter, job=job, stream=stream, output_format=output_format, duplicates=duplicates, writer_threads=writer_threads, sync=sync)
+	if jobs > 1 and len(input_files) > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=min(jobs, len(input_files))) as executor:
+			results = list(executor.map(worker, input_files))
+		# the addresses were validated by the worker processes
+		for result in results:
+			address_validator.merge_stats(result["address_cache"]["hits"], result["address_cache"]["misses"])
+	else:
+		results = [worker(csv_input_file) for csv_input_file in input_files]
+	return results
+
+# Returns the summary report of a batch: the results of all files and the totals over the files without errors
+def batch_report(results:Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+	succeeded = [result for result in results if result["error"] is None]
+	return {
+		"files" : list(results),
+		"total" : {
+			"files" : len(results),
+			"failed" : len(results) - len(succeeded),
+			"transfers" : sum(result["transfers"] for result in succeeded),
+			"releases" : sum(result["releases"] for result in succeeded),
+			"amount" : sum(result["amount"] for result in succeeded)
+		}
+	}
+
+# Finds the csv files in a folder that are ready to be processed by --watch. A file is ready once its size and modification
+# time are unchanged between two polls, so that files that are still being copied are not read. A file is found again if
+# it is modified, and files with a completion marker newer than the file were already processed, e.g., before a restart.
+# Files that could not be processed are moved aside by set_aside.
+class FolderWatcher:
+	def __init__(self, folder:str) -> None:
+		self.folder = folder
+		# size and modification time of the files seen by the last poll, which are ready if unchanged at the next one
+		self.candidates:Dict[str, Tuple[int, float]] = {}
+		# size and modification time of the files that were found ready
+		self.found:Dict[str, Tuple[int, float]] = {}
+
+	# Returns whether a file modified at mtime was already processed, i.e., has a newer completion marker
+	@staticmethod
+	def __completed(csv_input_file:str, mtime:float) -> bool:
+		try:
+			return os.path.getmtime(complete_marker_name(output_prefix(csv_input_file))) >= mtime
+		except OSError:
+			return False
+
+	# Scan the folder and return the files that became ready since the last poll, in sorted order
+	def poll(self) -> List[str]:
+		ready = []
+		candidates = {}
+		with os.scandir(self.folder) as entries:
+			files = sorted((entry.path, entry.stat()) for entry in entries if entry.is_file() and entry.name.lower().endswith(('.csv', '.xlsx')))
+		for path, stat in files:
+			key = (stat.st_size, stat.st_mtime)
+			if self.found.get(path) == key:
+				continue
+			if self.candidates.get(path) == key:
+				self.found[path] = key
+				if not self.__completed(path, stat.st_mtime):
+					ready.append(path)
+			else:
+				candidates[path] = key
+		self.candidates = candidates
+		return ready
+
+	# Move a file that could not be processed into the subfolder WATCH_FAILED_FOLDER, where it is not found again,
+	# so that it can be inspected and dropped into the folder again once fixed.
+	# Returns the new path of the file, or None if it could not be moved.
+	def set_aside(self, csv_input_file:str) -> Optional[str]:
+		failed_folder = os.path.join(self.folder, WATCH_FAILED_FOLDER)
+		target = os.path.join(failed_folder, os.path.basename(csv_input_file))
+		try:
+			os.makedirs(failed_folder, exist_ok=True)
+			os.replace(csv_input_file, target)
+		except OSError:
+			return None
+		self.found.pop(csv_input_file, None)
+		return target
+
+# Status of --watch, which is written to a json file whenever it changes, so that it can be monitored.
+# The throughput is the number of transfers per second of generation, and the latency of a file
+# the time from finding it until its pre-proposals and completion marker were written.
+class WatchStatus:
+	def __init__(self, filename:str, folder:str) -> None:
+		self.filename = filename
+		self.folder = folder
+		self.started = datetime.now()
+		self.files = 0
+		self.failed = 0
+		self.pending = 0
+		self.transfers = 0
+		self.seconds = 0.0
+		self.recent:deque = deque(maxlen=WATCH_RECENT_FILES)
+
+	# Add the result of generate_batch_file for a file, found latency seconds ago
+	def add(self, result:Dict[str, Any], latency:float):
+		self.files += 1
+		self.seconds += result["seconds"]
+		if result["error"] is None:
+			self.transfers += result["transfers"]
+		else:
+			self.failed += 1
+		self.recent.append({
+			"input_csv" : result["input_csv"],
+			"transfers" : result["transfers"],
+			"error" : result["error"],
+			"completed" : datetime.now().isoformat(),
+			"latency_seconds" : latency
+		})
+
+	def to_dict(self) -> Dict[str, Any]:
+		latencies = [recent["latency_seconds"] for recent in self.recent]
+		return {
+			"folder" : self.folder,
+			"started" : self.started.isoformat(),
+			"updated" : datetime.now().isoformat(),
+			"files" : self.files,
+			"failed" : self.failed,
+			"pending" : self.pending,
+			"transfers" : self.transfers,
+			"transfers_per_second" : self.transfers / self.seconds if self.seconds > 0 else 0.0,
+			"latency_seconds" : {
+				"last" : latencies[-1] if latencies else None,
+				"mean" : sum(latencies) / len(latencies) if latencies else None,
+				"max" : max(latencies) if latencies else None
+			},
+			"recent" : list(self.recent)
+		}
+
+	# Atomically replace the status file, so that readers never see a partial one
+	def write(self):
+		import json
+		temp_name = self.filename + ".tmp"
+		try:
+			with open(temp_name, 'w') as status_file:
+				json.dump(self.to_dict(), status_file, indent=4)
+			os.replace(temp_name, self.filename)
+		except IOError:
+			raise WriteError(self.filename)
+
+# Jobs of --watch, which runs for days: every file gets a new expiry, and the release schedules are only
+# computed again when the earliest release time changes, i.e., once a day.
+class WatchJobs:
+	def __init__(self, job:Dict[str, Any], config:Dict[str, Any], schedule_file:Optional[ScheduleFile], earliest_release_time:datetime) -> None:
+		self.job = job
+		self.config = config
+		self.schedule_file = schedule_file
+		self.earliest_release_time = earliest_release_time
+
+	# Returns the job for a file found now
+	def current(self) -> Dict[str, Any]:
+		earliest_release_time = next_earliest_release_time()
+		if earliest_release_time != self.earliest_release_time:
+			(schedule, schedules) = run_release_schedules(self.config, self.schedule_file, self.job["is_welcome"], earliest_release_time)
+			self.job = dict(self.job,
+				num_releases=schedule.num_releases,
+				skipped_releases=schedule.skipped_releases,
+				release_timestamps=schedule.timestamps,
+				schedules=schedules)
+			self.earliest_release_time = earliest_release_time
+		# proposals expire 2 hours from now
+		return dict(self.job, expiry=datetime.now() + timedelta(hours = +2))
+
+# Initializer of the worker processes of watch: Ctrl+C only stops the main process, which then waits for the files
+# being processed
+def ignore_interrupts():
+	import signal
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Generate the pre-proposals for the csv files arriving in folder, which is scanned every poll_interval seconds by a
+# FolderWatcher, until interrupted or, if polls is given, for that many polls. make_job returns the job for a file when
+# it is found, so that the expiry is renewed. Every file is generated by generate_batch_file with writer threads, which
+# write its completion marker. With more than one job, files are processed concurrently by a pool of worker processes,
+# which is kept for all files, so the imports and caches of the workers stay warm. The status is written to status_file.
+# A file that fails does not stop the others; it is moved aside by FolderWatcher.set_aside, and its result has the new
+# path as "moved_to". Yields the result of every file as it completes.
+def watch(
+	folder:str,
+	csv_delimiter:str,
+	make_job:Callable[[], Dict[str, Any]],
+	status_file:str,
+	jobs:int = 1,
+	stream:bool = False,
+	duplicates:str = "allow",
+	writer_threads:int = 1,
+	sync:bool = False,
+	poll_interval:float = WATCH_POLL_INTERVAL,
+	polls:Optional[int] = None
+	) -> Iterator[Dict[str, Any]]:
+	from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+	watcher = FolderWatcher(folder)
+	status = WatchStatus(status_file, folder)
+	status.write()
+	worker = partial(generate_batch_file, csv_delimiter=csv_delimiter, stream=stream, output_format="json", duplicates=duplicates, writer_threads=writer_threads, sync=sync)
+	executor = ProcessPoolExecutor(max_workers=jobs, initializer=ignore_interrupts) if jobs > 1 else None
+	# the time each pending file was found, by its future
+	pending:Dict[Any, float] = {}
+	try:
+		poll = 0
+		while polls is None or poll < polls or pending:
+			if polls is None or poll < polls:
+				poll += 1
+				for csv_input_file in watcher.poll():
+					found = perf_counter()
+					if executor is None:
+						result = worker(csv_input_file, job=make_job())
+						if result["error"] is not None:
+							result["moved_to"] = watcher.set_aside(csv_input_file)
+						status.add(result, perf_counter() - found)
+						status.write()
+						yield result
+					else:
+						pending[executor.submit(worker, csv_input_file, job=make_job())] = found
+						status.pending = len(pending)
+						status.write()
+			if pending:
+				(done, _) = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+				for future in sorted(done, key=pending.get):
+					found = pending.pop(future)
+					result = future.result()
+					# the addresses were validated by the worker process
+					address_validator.merge_stats(result["address_cache"]["hits"], result["address_cache"]["misses"])
+					if result["error"] is not None:
+						result["moved_to"] = watcher.set_aside(result["input_csv"])
+					status.pending = len(pending)
+					status.add(result, perf_counter() - found)
+					status.write()
+					yield result
+			elif polls is None or poll < polls:
+				sleep(poll_interval)
+	finally:
+		if executor is not None:
+			executor.shutdown()
+
+# Yield the rows of a csv file or workbook as read_csv_rows, raising a ReadError if it cannot be read, e.g., if it
+# is not UTF-8 or not a valid workbook. Numeric cells of a workbook that cannot be read exactly are added to
+# inexact_cells instead, see read_xlsx_rows.
+def read_source_rows(filename:str, csv_delimiter:str, decimal_sep:str, inexact_cells:Dict[Tuple[int, int], str]) -> Iterator[Tuple[int, List[str]]]:
+	import csv
+	try:
+		if is_xlsx_file(filename):
+			yield from read_xlsx_rows(filename, decimal_sep, inexact_cells)
+		else:
+			yield from read_csv_rows(filename, csv_delimiter)
+	except (IOError, ValueError, csv.Error) as e:
+		raise ReadError(filename, str(e))
+
+# Library entry point: generate the pre-proposals of the transfers in source, which is either the name of a csv file
+# or the rows of one, as sequences of strings. Transfers are released according to schedule, or, if they have a
+# schedule id, according to their schedule in the table schedules (see ScheduleFile.release_schedules).
+# The pre-proposals expire at expiry, by default 2 hours from now, like those of the script.
+#
+# All rows are validated before anything is returned. Raises an InvalidRowsError with the errors of all invalid rows
+# (at most max_errors are kept, see ValidationReport), including numeric cells of a workbook that cannot be read exactly,
+# a ReadError if the csv file cannot be read, e.g., if it is not UTF-8 or not a valid workbook, and a ValueError for
+# invalid delimiters.
+#
+# Returns an iterator of tuples (transfer_number, pre_proposal) as build_pre_proposals. If serialize is set, it yields
+# tuples (file_name, content) instead, with the json of every file as bytes, named as written by the script with
+# json_output_prefix. Pre-proposals are only created while iterating, so they are never all in memory. Like with
+# --stream, a csv file is read twice, once to validate all rows and once while iterating, so its rows are not kept either.
+def generate_pre_proposals(
+	source:Union[str, Iterable[Sequence[str]]],
+	schedule:ReleaseSchedule,
+	schedules:Optional[Dict[str, ReleaseSchedule]] = None,
+	is_welcome:bool = False,
+	expiry:Optional[datetime] = None,
+	decimal_sep:str = '.',
+	thousands_sep:str = ',',
+	csv_delimiter:str = ',',
+	max_releases:int = MAX_SCHEDULE_LENGTH,
+	use_template:bool = False,
+	serialize:bool = False,
+	compact:bool = False,
+	json_output_prefix:str = "pre-proposal_",
+	max_errors:int = DEFAULT_MAX_ERRORS
+	) -> Iterator[Tuple[Any, Any]]:
+	check_delimiters(decimal_sep, thousands_sep, csv_delimiter)
+	if expiry is None:
+		expiry = datetime.now() + timedelta(hours = +2)
+	job = {
+		"is_welcome" : is_welcome,
+		"decimal_sep" : decimal_sep,
+		"thousands_sep" : thousands_sep,
+		"num_releases" : schedule.num_releases,
+		"skipped_releases" : schedule.skipped_releases,
+		"release_timestamps" : schedule.timestamps,
+		"schedules" : schedules
+	}
+	# reasons of the numeric cells of a workbook that cannot be read exactly, by row and column
+	inexact_cells:Dict[Tuple[int, int], str] = {}
+	if isinstance(source, str):
+		read_rows = lambda: read_source_rows(source, csv_delimiter, decimal_sep, inexact_cells)
+	else:
+		# the rows are kept, so that they can be read again after the validation
+		rows = [(row_number, list(row_data)) for row_number, row_data in enumerate(source, start=1)]
+		read_rows = lambda: iter(rows)
+	num_transfers = 0
+	try:
+		for row_number, row_data in read_rows():
+			row_amounts(row_number, parse_row(row_number, row_data, is_welcome, decimal_sep, thousands_sep, schedules), job)
+			num_transfers += 1
+	except ValueError:
+		# collect the errors of all rows, which is only done if a row is invalid
+		report = ValidationReport(max_errors)
+		for row_number, row_data in read_rows():
+			errors = row_errors(row_number, row_data, job)
+			report.add([RowError(error.row, error.column, error.value, inexact_cells.get((error.row, error.column), error.reason)) for error in errors])
+		raise InvalidRowsError(report)
+	transfers = (parse_row(row_number, row_data, is_welcome, decimal_sep, thousands_sep, schedules) for row_number, row_data in read_rows())
+	scheduled = schedule_transfers(transfers, is_welcome, schedule.num_releases, schedule.skipped_releases, schedules)
+	pre_proposals = build_pre_proposals(scheduled, schedule.timestamps, expiry, use_template, schedules, max_releases)
+	if not serialize:
+		return pre_proposals
+	width = file_number_width(num_transfers)
+	return ((file_name, part.to_json(compact).encode('utf-8'))
+		for transfer_number, pre_proposal in pre_proposals
+		for file_name, part in output_parts(json_output_prefix, transfer_number, width, pre_proposal))
+
+# Build the parser for the command line arguments
+def build_argument_parser(decimal_sep:str, thousands_sep:str) -> argparse.ArgumentParser:
 	parser = argparse.ArgumentParser(description="Generate pre-proposals from the csv file \"input_csv\".\n"\
-		"For each row in the csv file, a json file with the corresponding pre-proposal is generated in the same folder.\n"
+		"For each row in the csv file, a json file with the corresponding pre-proposal is generated in the current folder.\n"
+		"Several csv files or patterns like \"tranches/*.csv\" can be given, which are then processed as one batch\n"\
+		"sharing the release schedule and expiry.\n"
 		"\n"
 		"The expected format of that file is a UTF-8 csv file with:\n"\
 		"One row for each transfer, columns separated by ','.\n"\
@@ -282,36 +2906,352 @@ def main():
 		"If the optional argument \"--welcome\" is present, the tool generates pre-proposals for welcome transfers.\n"\
 		"These only have one release, and thus expect a csv file with only 3 columns: sender, receiver, and amount.\n"
 		"\n"
-		"The release schedules are hard-coded in this script.", formatter_class=argparse.RawDescriptionHelpFormatter)
-	parser.add_argument("input_csv", type=str, help="Filename of a csv file to generate pre-proposals from.")
+		"The release schedules are hard-coded in this script, unless a schedule file is given with \"--schedule\".\n"
+		"Such a file can define several schedules, in which case rows can have a fifth column with the id of their schedule.", formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("input_csv", type=str, nargs="*", help="Filename of a csv file to generate pre-proposals from, "\
+		"or several file names or patterns for batch mode. Files ending in .xlsx are read as Excel workbooks, from their first sheet.")
 	parser.add_argument("--welcome", help="Generate welcome transfers with only one release.", action="store_true")
+	parser.add_argument("--schedule", metavar="FILE", help="Json file defining the release schedules instead of the hard-coded one, "\
+		"with monthly, weekly, quarterly, cliff_linear or explicit cadences (see ScheduleFile.parse). Rows of regular transfers "\
+		"can have a fifth column with the id of their schedule; rows without one use the default schedule.")
+	parser.add_argument("--stream", help="Process the csv file row by row instead of loading it into memory. "\
+		"The file is read twice: once to validate all rows, and once to generate the pre-proposals.", action="store_true")
+	parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Number of worker processes used to generate "\
+		"the pre-proposals (default: 1). With more than one, the file is read twice like with --stream. "\
+		"In batch mode, up to N files are processed at the same time, each by one process.")
+	parser.add_argument("--summary", metavar="REPORT", help="Write a json report with the number of transfers, releases and "\
+		"the total amount in microGTU of every input file, and the totals of all files. Implies batch mode.")
+	parser.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default="json", help="\"json\" (default) writes one "\
+		"json file per transfer. \"jsonl\" writes a single JSON Lines file with one pre-proposal per line, \"zip\" and \"tar\" "\
+		"write a single archive containing the json files.")
+	parser.add_argument("--mmap", help="Read the csv file through a memory map, decoding it in chunks, which is faster for large files. "\
+		"Rows are read exactly as without this option. Only files without quoted fields, e.g., amounts without thousands separators, "\
+		"are read faster.", action="store_true")
+	parser.add_argument("--watch", metavar="FOLDER", help="Keep running and generate the pre-proposals of every csv or xlsx file "\
+		"arriving in FOLDER, instead of the input files. A file is processed once it is no longer being written to. "\
+		"Every file gets a marker file ending in .complete once all its files are written, and files with a marker are "\
+		f"not processed again. Files that fail are moved to the subfolder \"{WATCH_FAILED_FOLDER}\". With --jobs N, N files are "\
+		"processed concurrently. Stop with Ctrl+C.")
+	parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL, metavar="SECONDS", help="Seconds "\
+		f"between two scans of the folder of --watch (default: {WATCH_POLL_INTERVAL}).")
+	parser.add_argument("--status", metavar="FILE", default="watch_status.json", help="Json file with the status of --watch, "\
+		"i.e., the number of processed and failed files, the throughput and the latency of recent files (default: watch_status.json).")
+	parser.add_argument("--validate-only", help="Only check all rows of the csv file, without writing pre-proposals. "\
+		"Instead of stopping at the first invalid row, the errors of all rows are collected and printed, "\
+		"with row, column, value and reason.", action="store_true")
+	parser.add_argument("--max-errors", type=int, default=DEFAULT_MAX_ERRORS, metavar="N", help="Maximal number of errors "\
+		f"printed and reported by --validate-only (default: {DEFAULT_MAX_ERRORS}). All invalid rows are still counted.")
+	parser.add_argument("--error-report", metavar="REPORT", help="Write the errors found by --validate-only as json to the file REPORT.")
+	parser.add_argument("--writer-threads", type=int, default=0, metavar="N", help="Write the json files with N threads "\
+		"instead of the main process, for folders where opening and writing files is slow, e.g., on network drives. "\
+		f"At most {WRITER_QUEUE_SIZE} pre-proposals wait for a thread. Once all files are written, a marker file "\
+		"\"pre-proposal_<input_csv>.complete\" is written atomically. Only with --output-format json.")
+	parser.add_argument("--fsync", action="store_true", help="Sync the files written by --writer-threads or --watch to disk, "\
+		f"in batches of {FSYNC_BATCH_SIZE} files per thread, before the marker file is written.")
+	parser.add_argument("--compact", help="Write json without indentation and whitespace.", action="store_true")
+	parser.add_argument("--serializer", choices=["json", "template"], default="json", help="\"json\" (default) encodes each "\
+		"pre-proposal with the json module. \"template\" renders the parts shared by all pre-proposals once and only fills in "\
+		"sender, receiver and amounts, which is faster. Both produce identical files.")
+	parser.add_argument("--verbose", help="Print statistics, such as the hit rate of the address cache.", action="store_true")
+	parser.add_argument("--max-releases", type=int, default=MAX_SCHEDULE_LENGTH, metavar="N", help="Maximal number of releases "\
+		f"of a pre-proposal (default and at most: {MAX_SCHEDULE_LENGTH}). The schedule of a transfer with more releases is split "\
+		"into several pre-proposals of consecutive releases, written to numbered files, e.g., \"pre-proposal_x_007-1.json\".")
+	parser.add_argument("--max-bytes", type=int, metavar="N", help="Maximal size in bytes of the payload of a pre-proposal, "\
+		"which has 34 bytes plus 16 bytes per release. Longer schedules are split as with --max-releases.")
+	parser.add_argument("--duplicates", choices=DuplicateIndex.modes, default="allow", help="How several transfers from the same "\
+		"sender to the same receiver are handled: \"allow\" them (default), \"warn\" about them and about receivers of several senders, "\
+		"\"reject\" the csv file, or \"merge\" them into one transfer with the summed amounts (only with a single job).")
+	parser.add_argument("--balances", metavar="FILE", help="Csv file with the balance of every sender account: one row per account "\
+		"with its address and its balance in GTU, formatted like the amounts of input_csv. Before anything is written, the total "\
+		"amount each sender sends is compared with its balance, and nothing is generated if any balance is insufficient.")
+	parser.add_argument("--sender-totals", metavar="REPORT", help="Write a json report with the number of transfers and releases "\
+		"and the total amount in microGTU of every sender, and the amount released at each release time.")
+	parser.add_argument("--resume", help="Keep a manifest of the written pre-proposals, and on a rerun only write the pre-proposals "\
+		"of new or changed rows, or whose file is missing or was modified. Files of a previous run are only kept if they "\
+		f"expire in at least {RESUME_MIN_VALIDITY_MINUTES} minutes, and the new files then get the same expiry. "\
+		"Only supported with one json file per transfer and a single job.", action="store_true")
+	parser.add_argument("--profile", metavar="REPORT", help="Measure wall time, CPU time, rows and bytes of every stage "\
+		"(reading the csv file, checking addresses, parsing amounts, scheduling, building and writing the pre-proposals) "\
+		"and write them as json to the file REPORT.")
+	parser.add_argument("--profile-stats", metavar="FILE", help="Run the generation under cProfile and write the statistics "\
+		"to FILE, which can be read with the pstats module.")
+	return parser
+
+# Print the number of generated proposals
+def print_summary(num_transfers:int):
+	if (num_transfers == 0):
+		print(f"CSV file does not contain any transfers.")
+	elif (num_transfers == 1):
+		print(f"Successfully generated {num_transfers} proposal.")
+	else:
+		print(f"Successfully generated {num_transfers} proposals.")
+
+# Check all rows of the csv file for --validate-only, print the errors, and write the error report if requested.
+# Exits with exit code 2 if any row is invalid.
+def run_validation(csv_input_file:str, csv_delimiter:str, job:Dict[str, Any], args:argparse.Namespace):
+	try:
+		report = validate_csv_file(csv_input_file, csv_delimiter, job, args.max_errors, args.jobs)
+	except IOError as e:
+		print(f"Error reading file \"{csv_input_file}\": {e}")
+		sys.exit(3)
+	except ValueError as e:
+		print(f"Error: {e}")
+		sys.exit(2)
+
+	for error in report.errors:
+		print(error)
+	if report.truncated():
+		print(f"... {report.num_errors - len(report.errors)} more errors not shown.")
+	if args.error_report:
+		import json
+		try:
+			with open(args.error_report, 'w') as report_file:
+				json.dump(dict(report.to_dict(), input_csv=csv_input_file), report_file, indent=4)
+		except IOError:
+			print(WriteError(args.error_report))
+			sys.exit(3)
+	if report.is_valid():
+		print(f"All {report.rows} rows are valid.")
+	else:
+		print(f"{report.invalid_rows} of {report.rows} rows are invalid.")
+		sys.exit(2)
+
+# Generate the pre-proposals for the csv files arriving in the folder of --watch until interrupted, and print the result
+# of every file. make_job returns the job for a file when it is found.
+def run_watch(csv_delimiter:str, make_job:Callable[[], Dict[str, Any]], args:argparse.Namespace):
+	print(f"Watching \"{args.watch}\" for csv files, stop with Ctrl+C.")
+	try:
+		for result in watch(args.watch, csv_delimiter, make_job, args.status, args.jobs, args.stream, args.duplicates,
+			max(args.writer_threads, 1), args.fsync, args.poll_interval):
+			print(f"{result['input_csv']}:")
+			for warning in result["warnings"]:
+				print(f"Warning: {warning}")
+			if result["error"] is None:
+				print_summary(result["transfers"])
+			else:
+				print(result["error"])
+				if result["moved_to"] is not None:
+					print(f"Moved the file to \"{result['moved_to']}\".")
+	except KeyboardInterrupt:
+		print("Stopped watching.")
+	except WriteError as e:
+		print(e)
+		sys.exit(3)
+	except IOError as e:
+		print(f"Error reading folder \"{args.watch}\": {e}")
+		sys.exit(3)
+
+# Generate the pre-proposals for all files of a batch, print the result of every file, and write the summary report
+# if requested. Exits with the exit code of the first failing file, if any.
+def run_batch(input_files:Sequence[str], csv_delimiter:str, job:Dict[str, Any], args:argparse.Namespace):
+	try:
+		results = generate_batch(input_files, csv_delimiter, job, args.jobs, args.stream, args.output_format, args.duplicates, args.writer_threads, args.fsync)
+	except ValueError as e:
+		print(f"Error: {e}")
+		sys.exit(2)
+
+	for result in results:
+		print(f"{result['input_csv']}:")
+		for warning in result["warnings"]:
+			print(f"Warning: {warning}")
+		if result["error"] is None:
+			print_summary(result["transfers"])
+		else:
+			print(result["error"])
+	report = batch_report(results)
+	print(f"Generated {report['total']['transfers']} proposals from {report['total']['files'] - report['total']['failed']} of {report['total']['files']} files.")
+	if args.summary:
+		import json
+		try:
+			with open(args.summary, 'w') as report_file:
+				json.dump(report, report_file, indent=4)
+		except IOError:
+			print(WriteError(args.summary))
+			sys.exit(3)
+	if args.verbose:
+		print(f"Address validation: {address_validator}")
+
+	failed = [result for result in results if result["error"] is not None]
+	if failed:
+		sys.exit(failed[0]["exit_code"])
+
+# Returns the earliest release time of transfers generated now, which is 14:00 CET tomorrow.
+# If regular releases are before it, they get combined into one at that time.
+# This can be later than all release times, in which case all releases happen at that time.
+def next_earliest_release_time() -> datetime:
+	return datetime.combine(date.today(), time.fromisoformat("14:00:00+01:00")) + timedelta(days = +1)
+
+# Returns the release schedule of a run, and the release schedules of all schedule ids if a schedule file is given.
+# Welcome transfers have a single release at the welcome release time of the schedule file, or else of config.
+# Releases before earliest_release_time are combined into one at that time. Raises a ValueError if the schedule is invalid.
+def run_release_schedules(
+	config:Dict[str, Any],
+	schedule_file:Optional[ScheduleFile],
+	is_welcome:bool,
+	earliest_release_time:datetime
+	) -> Tuple[ReleaseSchedule, Optional[Dict[str, ReleaseSchedule]]]:
+	if is_welcome:
+		welcome_release_time = config["welcome_release_time"]
+		if schedule_file is not None and schedule_file.welcome_release_time is not None:
+			welcome_release_time = schedule_file.welcome_release_time
+		welcome = ReleaseSchedule.welcome(welcome_release_time, earliest_release_time)
+		# the configured number of releases is kept, although welcome transfers only have one release
+		return (ReleaseSchedule(config["num_releases"], welcome.skipped_releases, welcome.timestamps), None)
+	if schedule_file is not None:
+		# each schedule is computed once, for all transfers that use it
+		schedules = schedule_file.release_schedules(earliest_release_time)
+		return (schedules[schedule_file.default], schedules)
+	return (ReleaseSchedule.regular(config["initial_release_time"], config["first_rem_release_time"], earliest_release_time, config["num_releases"]), None)
+
+# Main function
+def main():
+	config = get_config()
+	csv_delimiter = config["csv_delimiter"]
+	thousands_sep = config["thousands_sep"]
+	decimal_sep = config["decimal_sep"]
+
+	# proposals expire 2 hours from now
+	transaction_expiry = datetime.now() + timedelta(hours = +2)
+	earliest_release_time = next_earliest_release_time()
+
+	parser = build_argument_parser(decimal_sep, thousands_sep)
 	args = parser.parse_args()
+	if args.jobs < 1:
+		parser.error("--jobs must be at least 1")
+	if args.resume and (args.jobs > 1 or args.output_format != "json"):
+		parser.error("--resume can only be used with --output-format json and a single job")
+	if args.writer_threads < 0:
+		parser.error("--writer-threads must not be negative")
+	if args.writer_threads > 0 and (args.resume or args.output_format != "json"):
+		parser.error("--writer-threads can only be used with --output-format json and without --resume")
+	if args.max_errors < 0:
+		parser.error("--max-errors must not be negative")
+	if args.error_report and not args.validate_only:
+		parser.error("--error-report can only be used with --validate-only")
+	if args.watch is not None:
+		if args.input_csv or args.summary or args.resume or args.profile or args.profile_stats or args.balances or args.sender_totals or args.validate_only:
+			parser.error("--watch cannot be used with input files, --summary, --resume, --profile, --profile-stats, --balances, "\
+				"--sender-totals and --validate-only")
+		if args.output_format != "json":
+			parser.error("--watch can only be used with --output-format json")
+		if args.poll_interval <= 0:
+			parser.error("--poll-interval must be positive")
+	elif not args.input_csv:
+		parser.error("the following arguments are required: input_csv")
+	if args.fsync and args.writer_threads == 0 and args.watch is None:
+		parser.error("--fsync can only be used with --writer-threads or --watch")
+	try:
+		max_releases = releases_per_pre_proposal(args.max_releases, args.max_bytes)
+	except ValueError as e:
+		parser.error(str(e))
+	try:
+		input_files = expand_input_files(args.input_csv) if args.watch is None else [""]
+	except ValueError as e:
+		print(f"Error: {e}")
+		sys.exit(2)
+	batch_mode = len(input_files) > 1 or args.summary is not None
+	if batch_mode and (args.resume or args.profile or args.profile_stats or args.balances or args.sender_totals):
+		parser.error("--resume, --profile, --profile-stats, --balances and --sender-totals can only be used with a single input file")
+	if batch_mode and args.validate_only:
+		parser.error("--validate-only can only be used with a single input file")
+	# in batch mode, each file is generated by a single process
+	if args.duplicates == "merge" and args.jobs > 1 and not batch_mode:
+		parser.error("--duplicates merge can only be used with a single job")
 	
 	is_welcome = args.welcome
-	csv_input_file = args.input_csv
+	csv_input_file = input_files[0]
 	#Output files contain the csv_input_file name 
-	json_output_prefix = "pre-proposal_" + os.path.splitext(os.path.basename(csv_input_file))[0] + "_"
+	json_output_prefix = output_prefix(csv_input_file)
+
+	schedule_file = None
+	if args.schedule:
+		try:
+			schedule_file = load_schedule_file(args.schedule)
+		except IOError as e:
+			print(f"Error reading file \"{args.schedule}\": {e}")
+			sys.exit(3)
+		except ValueError as e:
+			print(f"Error: {e}")
+			sys.exit(2)
 
 	# Build release schedule
-	if is_welcome:
-		# Release schedule for welcome transfer is just single date
-		release_times = [max(welcome_release_time, earliest_release_time)]
-		skipped_releases = 0
-	else:
+	try:
+		(schedule, schedules) = run_release_schedules(config, schedule_file, is_welcome, earliest_release_time)
+	except ValueError as e:
+		print(f"Error: {e}")
+		sys.exit(2)
+
+	job = {
+		"is_welcome" : is_welcome,
+		"decimal_sep" : decimal_sep,
+		"thousands_sep" : thousands_sep,
+		"num_releases" : schedule.num_releases,
+		"skipped_releases" : schedule.skipped_releases,
+		"release_timestamps" : schedule.timestamps,
+		"expiry" : transaction_expiry,
+		"json_output_prefix" : json_output_prefix,
+		"compact" : args.compact,
+		"serializer" : args.serializer,
+		"mmap" : args.mmap,
+		"schedules" : schedules,
+		"max_releases" : max_releases
+	}
+	if args.watch is not None:
+		run_watch(csv_delimiter, WatchJobs(job, config, schedule_file, earliest_release_time).current, args)
+		return
+	if args.validate_only:
+		run_validation(csv_input_file, csv_delimiter, job, args)
+		return
+	if batch_mode:
+		run_batch(input_files, csv_delimiter, job, args)
+		return
+
+	manifest = None
+	if args.resume:
+		manifest = Manifest(json_output_prefix[:-1] + ".manifest.jsonl", job)
 		try:
-			(release_times,skipped_releases) = build_release_schedule(
-				initial_release_time,
-				first_rem_release_time,
-				earliest_release_time,
-				num_releases)
+			job = manifest.load(job)
+		except (IOError, ValueError, KeyError) as e:
+			print(f"Error reading manifest \"{manifest.filename}\": {e}")
+			sys.exit(3)
+
+	balances = None
+	if args.balances:
+		try:
+			balances = read_balances(args.balances, decimal_sep, thousands_sep, csv_delimiter)
+		except IOError as e:
+			print(f"Error reading file \"{args.balances}\": {e}")
+			sys.exit(3)
 		except ValueError as e:
 			print(f"Error: {e}")
 			sys.exit(2)
+	totals = TransferTotals() if args.sender_totals else None
+	duplicates = DuplicateIndex(args.duplicates) if args.duplicates != "allow" else None
+	writer = FileWriter(args.writer_threads, args.fsync) if args.writer_threads > 0 else None
 
-	
-	# read csv file
+	profiler = StageProfiler() if args.profile else null_profiler
+	if args.profile_stats:
+		import cProfile
+		c_profiler = cProfile.Profile()
 	try:
-		transfers = csv_to_list(csv_input_file, is_welcome, decimal_sep, thousands_sep, csv_delimiter)
+		if args.profile_stats:
+			c_profiler.enable()
+		try:
+			num_transfers = generate(csv_input_file, csv_delimiter, job, args.jobs, args.stream, args.output_format, profiler, manifest, totals, balances, duplicates, writer)
+		finally:
+			if args.profile_stats:
+				c_profiler.disable()
+				try:
+					c_profiler.dump_stats(args.profile_stats)
+				except IOError:
+					raise WriteError(args.profile_stats)
+		if args.profile:
+			write_profile_report(args.profile, profiler, csv_input_file, args.jobs)
+		if args.sender_totals:
+			write_sender_totals(args.sender_totals, totals)
+	except WriteError as e:
+		print(e)
+		sys.exit(3)
 	except IOError as e:
 		print(f"Error reading file \"{csv_input_file}\": {e}")
 		sys.exit(3)
@@ -319,34 +3259,14 @@ def main():
 		print(f"Error: {e}")
 		sys.exit(2)
 
-	# process all transfers in list
-	for transfer_number, transfer in enumerate(transfers, start=1):
-		out_file_name = json_output_prefix + str(transfer_number).zfill(3) + ".json"
-		
-		if is_welcome:
-			# welcome transfer only has one amount
-			amounts = [transfer["amount"]]
-		else:
-			amounts = amounts_to_scheduled_list(transfer["initial_amount"], transfer["remaining_amount"], num_releases, skipped_releases)
-
-		# create pre-proposal and add all releases
-		pre_proposal = ScheduledPreProposal(transfer["sender_address"], transfer["receiver_address"], transaction_expiry)
-		for i in range(len(release_times)):
-			pre_proposal.add_release(amounts[i], release_times[i])
-		
-		# Finally write json file
-		try:
-			pre_proposal.write_json(out_file_name)
-		except IOError:
-			print(f"Error writing file \"{out_file_name}\".")
-			sys.exit(3)
-	
-	if (len(transfers) == 0):
-		print(f"CSV file does not contain any transfers.")
-	elif (len(transfers) == 1):
-		print(f"Successfully generated {len(transfers)} proposal.")
-	else:
-		print(f"Successfully generated {len(transfers)} proposals.")
+	if duplicates is not None:
+		for warning in duplicates.warnings():
+			print(f"Warning: {warning}")
+	print_summary(num_transfers)
+	if manifest is not None and manifest.reused > 0:
+		print(f"Kept {manifest.reused} unchanged pre-proposals of the previous run.")
+	if args.verbose:
+		print(f"Address validation: {address_validator}")
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
@@ -6,9 +6,67 @@ import unittest
 import random
 from unittest.case import skip
 from dateutil.relativedelta import relativedelta
+from base58 import b58encode_check
 from unittest.mock import patch, mock_open
+import io
+import json
+import re
+import os
+import subprocess
+import sys
+import tempfile
+import zipfile
 from proposal_generator import *
 
+# Valid account addresses used by the tests
+SENDER = '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE'
+RECEIVER = '4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7'
+OTHER_RECEIVER = '3XSLuJcXg6xEua6iBPnWacc3iWh93yEDMCqX8FbE3RDSbEnT9P'
+
+#Returns the schedule of num_releases regular releases, the first one today and the others daily,
+#so that the initial release is combined with the past ones
+def regular_schedule(num_releases):
+    ir_time = datetime.combine(date.today(), time.fromisoformat("14:00:00+01:00"))
+    return ReleaseSchedule.regular(ir_time, ir_time + relativedelta(days = +1), ir_time, num_releases)
+
+#Returns a job as built by main, for 3 regular releases at fixed times expiring in 2 hours.
+#The releases are those of schedule if given, and any other entry can be overridden.
+def make_job(schedule=None, **overrides):
+    job = {
+        "is_welcome" : False,
+        "decimal_sep" : '.',
+        "thousands_sep" : ',',
+        "num_releases" : 3,
+        "skipped_releases" : 0,
+        "release_timestamps" : (1000,2000,3000),
+        "expiry" : datetime.now() + relativedelta(hours = +2),
+        "json_output_prefix" : None,
+        "compact" : False,
+        "serializer" : "json",
+        "mmap" : False,
+        "schedules" : None,
+        "max_releases" : None
+    }
+    if schedule is not None:
+        job.update(num_releases=schedule.num_releases, skipped_releases=schedule.skipped_releases, release_timestamps=schedule.timestamps)
+    job.update(overrides)
+    return job
+
+#Base class of tests that write files, to a temporary folder that is removed after each test
+class FileTestCase(unittest.TestCase):
+
+    sender = SENDER
+    receiver = RECEIVER
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    #Make the temporary folder the current folder, to which the script writes its output files
+    def enter_dir(self):
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.dir.name)
+
 
 class TestTransferAmount(unittest.TestCase):
 
@@ -52,6 +110,35 @@ class TestTransferAmount(unittest.TestCase):
         #Too large
         self.assertRaises(ValueError, TransferAmount.from_string,str(TransferAmount.max_amount//1000000+1),'.',',')
 
+    def test_from_string_separators(self):
+        self.assertEqual(TransferAmount.from_string('1.278,123456',',','.'),TransferAmount(1278123456))
+        self.assertEqual(TransferAmount.from_string('1 278,5',',',' '),TransferAmount(1278500000))
+        self.assertRaises(ValueError, TransferAmount.from_string,'1,278.5',',','.')
+        self.assertRaises(ValueError, TransferAmount.from_string,'1.278.5',',','.')
+
+    def test_parse_agrees_with_regex(self):
+        #Reference implementation, which was used before parse_micro_gtu
+        def reference(amount_string):
+            amount_string = amount_string.strip()
+            if not re.match(r"^[0-9]+([.][0-9]{1,6})?$", amount_string) and not re.match(r"^[0-9]{1,3}([,][0-9]{3})*([.][0-9]{1,6})?$", amount_string):
+                raise ValueError()
+            return TransferAmount(int(Decimal(amount_string.replace(',', '')) * 1000000))
+        for i in range(0,5000):
+            amount_string = ''.join(random.choice('0123456789,. ') for _ in range(random.randrange(0,12)))
+            with self.subTest(amount_string):
+                try:
+                    expected = reference(amount_string)
+                except ValueError:
+                    self.assertRaises(ValueError, TransferAmount.from_string,amount_string,'.',',')
+                else:
+                    self.assertEqual(TransferAmount.from_string(amount_string,'.',','),expected)
+
+    def test_parse_column(self):
+        self.assertEqual(TransferAmount.parse_column([' 1 ','2,000.5','0.000001'],'.',','),[1000000,2000500000,1])
+        self.assertRaisesRegex(ValueError,'At position 1',TransferAmount.parse_column,['1','0','x'],'.',',')
+        self.assertRaisesRegex(ValueError,'At position 2',TransferAmount.parse_column,['1','2','x'],'.',',')
+        self.assertRaisesRegex(ValueError,'At position 0',TransferAmount.parse_column,['1'+'0'*5000],'.',',')
+
     def test_addition(self):
         #Random additions in valid range
         for i in range(0,1000):
@@ -74,6 +161,86 @@ class TestTransferAmount(unittest.TestCase):
             self.assertEqual(y[i],TransferAmount(1))
         self.assertEqual(y[-1],TransferAmount(2))
 
+class TestAmountSchedule(unittest.TestCase):
+
+    def test_slots(self):
+        self.assertFalse(hasattr(TransferAmount(1),'__dict__'))
+        self.assertFalse(hasattr(AmountSchedule([1]),'__dict__'))
+
+    def test_split(self):
+        self.assertEqual(AmountSchedule.split(10,9),AmountSchedule([1]*8+[2]))
+        self.assertEqual(AmountSchedule.split(10,1),AmountSchedule([10]))
+        self.assertEqual(AmountSchedule.split(TransferAmount.max_amount,1).amounts.itemsize,8)
+        self.assertRaises(AssertionError,AmountSchedule.split,10,0)
+        self.assertRaises(AssertionError,AmountSchedule.split,10,11)
+
+    def test_random_for_transfer(self):
+        for i in range(0,1000):
+            with self.subTest(i):
+                num_releases = random.randrange(2,30)
+                skipped = random.randrange(0,num_releases)
+                initial = random.randrange(1,TransferAmount.max_amount//2)
+                remaining = random.randrange(num_releases,TransferAmount.max_amount//2)
+                #Fold the skipped releases using TransferAmount objects
+                regular_amounts = [TransferAmount(initial), *[TransferAmount(a) for a in AmountSchedule.split(remaining,num_releases-1)]]
+                expected = [sum(regular_amounts[1:skipped+1],regular_amounts[0]), *regular_amounts[skipped+1:]]
+                schedule = AmountSchedule.for_transfer(initial,remaining,num_releases,skipped)
+                self.assertEqual(schedule.to_transfer_amounts(),expected)
+                self.assertEqual(schedule.total(),initial+remaining)
+
+    def test_for_transfer_invalid(self):
+        self.assertRaises(ValueError,AmountSchedule.for_transfer,1,1,10,10)
+        self.assertRaises(AssertionError,AmountSchedule.for_transfer,1,1,1,0)
+        #Folded initial release is too large
+        self.assertRaises(ValueError,AmountSchedule.for_transfer,TransferAmount.max_amount,9,10,1)
+        self.assertEqual(AmountSchedule.for_transfer(TransferAmount.max_amount-1,9,10,1)[0],TransferAmount.max_amount)
+
+    def test_schedule_transfers_error(self):
+        transfers = [{"initial_amount" : TransferAmount(1), "remaining_amount" : TransferAmount(9)}] * 3
+        transfers[2] = {"initial_amount" : TransferAmount(1), "remaining_amount" : TransferAmount(8)}
+        with self.assertRaisesRegex(ValueError,'In transfer 3: Cannot split 8 into 9 parts'):
+            list(schedule_transfers(transfers,False,10,0))
+
+class TestAddressValidator(FileTestCase):
+
+    def test_valid(self):
+        validator = AddressValidator()
+        self.assertTrue(validator.is_valid(self.sender))
+        self.assertTrue(validator.is_valid(b58encode_check(bytes([1]) + bytes(32)).decode()))
+
+    def test_invalid(self):
+        validator = AddressValidator()
+        #Bad checksum
+        self.assertFalse(validator.is_valid('39Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE'))
+        #Not base58
+        self.assertFalse(validator.is_valid('0OIl'))
+        self.assertFalse(validator.is_valid(''))
+        #Wrong version byte
+        self.assertFalse(validator.is_valid(b58encode_check(bytes([2]) + bytes(32)).decode()))
+        #Wrong length
+        self.assertFalse(validator.is_valid(b58encode_check(bytes([1]) + bytes(31)).decode()))
+        self.assertFalse(validator.is_valid(b58encode_check(bytes([1]) + bytes(33)).decode()))
+
+    def test_cache(self):
+        validator = AddressValidator(cache_size=2)
+        for _ in range(3):
+            validator.is_valid(self.sender)
+        self.assertEqual((validator.hits,validator.misses),(2,1))
+        self.assertAlmostEqual(validator.hit_rate(),2/3)
+        #The least recently used address is evicted
+        validator.is_valid(self.receiver)
+        validator.is_valid('39Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE')
+        self.assertEqual(list(validator.cache),[self.receiver,'39Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE'])
+        validator.is_valid(self.sender)
+        self.assertEqual((validator.hits,validator.misses),(2,4))
+        self.assertRaises(ValueError,AddressValidator,0)
+
+    def test_validate_column(self):
+        validator = AddressValidator()
+        column = [self.sender, self.receiver, 'invalid', self.sender, 'invalid']
+        self.assertEqual(validator.validate_column(column),[2,4])
+        self.assertEqual(validator.misses,3)
+
 class TestCSVReader(unittest.TestCase):
 
     def test_valid_release(self):
@@ -181,6 +348,76 @@ class TestCSVReader(unittest.TestCase):
             self.assertRaises(ValueError,csv_to_list,test_filename,False,'.',',',',')
             mock_file.assert_called_once_with(test_filename, newline='', encoding='utf-8-sig')
 
+    def test_iter_transfers_row_numbers(self):
+        release_test_data = (
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 1,000.000000 "\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 2,000.000000 "\n'
+        )
+        test_filename = './test.csv'
+        with patch('builtins.open', new=mock_open(read_data=release_test_data)) as mock_file:
+            result = iter_csv_transfers(test_filename,True,'.',',',',')
+            self.assertEqual(next(result),(1,{
+                "sender_address": '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE',
+                "receiver_address":'4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7',
+                "amount" : TransferAmount(1000000000)
+            }))
+            self.assertEqual(next(result)[0],2)
+            self.assertRaises(StopIteration,next,result)
+
+    def test_iterate_invalid_row(self):
+        release_test_data = ( #second row is bad
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 1,000.000000 "\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 2,000.0000000 "\n'
+        )
+        with patch('builtins.open', new=mock_open(read_data=release_test_data)):
+            with self.assertRaisesRegex(ValueError,'In row 2'):
+                list(iter_csv_transfers('./test.csv',True,'.',',',','))
+
+class TestMappedCSVReader(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+
+    def assertSameRows(self, content, delimiter=','):
+        with open(self.csv_file, 'wb') as csvfile:
+            csvfile.write(content.encode('utf-8'))
+        expected = list(read_csv_rows(self.csv_file, delimiter))
+        for chunk_size in [1, 7, 64, MMAP_CHUNK_SIZE]:
+            with self.subTest((content, chunk_size)):
+                self.assertEqual(list(read_mapped_csv_rows(self.csv_file, delimiter, chunk_size)),expected)
+
+    def test_same_rows(self):
+        self.assertSameRows('')
+        self.assertSameRows('a,b,1,2\nc,d,3,4\n')
+        self.assertSameRows('\ufeffa,b,1,2\n\nc,d, 3 ,4')
+        self.assertSameRows('a;b;1,5;2\n', ';')
+        self.assertSameRows('a,b,"1,000.5","2,000"\r\nc,d,3,4\r\n')
+        #Quoted line breaks and quotes, also across chunks
+        self.assertSameRows('a,"b\n\nc",1\n"x ""y""",z\næ,ø,å\n' * 5)
+        self.assertSameRows('a,b\n' * 20 + 'a,"' + 'b\n' * 20 + '",c\n' + 'a,b\n' * 20)
+        #Quotes inside unquoted fields are kept
+        self.assertSameRows('a,b"c,1\n')
+
+    def test_random_rows(self):
+        for i in range(50):
+            content = ''.join(random.choice(['a', ',', '"', '\n', '\r', '\r\n', ' ', 'ø']) for _ in range(random.randrange(0, 60)))
+            self.assertSameRows(content)
+
+    def test_same_errors(self):
+        release_test_data = ( #second row is bad
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 1,000.000000 "\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 2,000.000000 "," 2,000.000000 "\n'
+        )
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.write(release_test_data)
+        with self.assertRaises(ValueError) as expected:
+            csv_to_list(self.csv_file,True,'.',',',',')
+        with self.assertRaises(ValueError) as mapped:
+            csv_to_list(self.csv_file,True,'.',',',',',True)
+        self.assertEqual(str(mapped.exception),str(expected.exception))
+        self.assertIn('Row 2 contains 4', str(mapped.exception))
+
 class TestReleaseScheduleBuilder(unittest.TestCase):
 
     def test_valid_releases(self):
@@ -219,6 +456,95 @@ class TestReleaseScheduleBuilder(unittest.TestCase):
         not_relevant = time1
         self.assertRaises(ValueError,build_release_schedule,time2,time1,not_relevant,num_releases)
 
+class TestScheduleFile(FileTestCase):
+
+    definitions = {
+        "default" : "monthly",
+        "schedules" : {
+            "monthly" : {"cadence" : "monthly", "initial_release_time" : "2030-08-26T14:00:00+01:00", "first_release_time" : "2030-09-26T14:00:00+01:00", "num_releases" : 10},
+            "weekly" : {"cadence" : "weekly", "initial_release_time" : "2030-08-26T14:00:00+01:00", "first_release_time" : "2030-09-02T14:00:00+01:00", "num_releases" : 5},
+            "quarterly" : {"cadence" : "quarterly", "initial_release_time" : "2030-08-26T14:00:00+01:00", "first_release_time" : "2030-11-26T14:00:00+01:00", "num_releases" : 3},
+            "vesting" : {"cadence" : "cliff_linear", "initial_release_time" : "2030-08-26T14:00:00+01:00", "cliff_time" : "2031-08-26T14:00:00+01:00", "end_time" : "2031-08-27T14:00:00+01:00", "num_releases" : 5},
+            "explicit" : {"cadence" : "explicit", "initial_release_time" : "2030-08-26T14:00:00+01:00", "release_times" : ["2030-12-24T18:00:00+01:00", "2031-12-24T18:00:00+01:00"]}
+        }
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.schedule_file = os.path.join(self.dir.name, 'schedules.json')
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.earliest_release_time = datetime.fromisoformat("2030-01-01T14:00:00+01:00")
+
+    def parse(self, definitions):
+        return ScheduleFile.parse(json.dumps(definitions).encode('utf-8'))
+
+    def test_cadences(self):
+        schedules = self.parse(self.definitions).release_schedules(self.earliest_release_time)
+        ir_time = datetime.fromisoformat("2030-08-26T14:00:00+01:00")
+        (release_times, skipped_releases) = build_release_schedule(ir_time, datetime.fromisoformat("2030-09-26T14:00:00+01:00"), self.earliest_release_time, 10)
+        self.assertEqual(schedules["monthly"],ReleaseSchedule(10, skipped_releases, release_timestamps(release_times)))
+        self.assertEqual(schedules["weekly"].timestamps[1:],tuple(int(datetime.fromisoformat("2030-09-02T14:00:00+01:00").timestamp() + i*7*24*3600) * 1000 for i in range(4)))
+        self.assertEqual(len(schedules["quarterly"].timestamps),3)
+        vesting = schedules["vesting"].timestamps
+        self.assertEqual([later - earlier for earlier, later in zip(vesting[1:], vesting[2:])],[8*3600*1000]*3)
+        self.assertEqual(schedules["explicit"].num_releases,3)
+        #Releases before the earliest release time are combined into the initial release
+        schedules = self.parse(self.definitions).release_schedules(datetime.fromisoformat("2030-09-10T14:00:00+01:00"))
+        self.assertEqual(schedules["weekly"].skipped_releases,2)
+        self.assertEqual(schedules["weekly"].timestamps[0],int(datetime.fromisoformat("2030-09-10T14:00:00+01:00").timestamp()) * 1000)
+
+    def test_invalid(self):
+        monthly = self.definitions["schedules"]["monthly"]
+        for definitions in [
+            {"schedules" : {}},
+            {"schedules" : {"a" : monthly, "b" : monthly}},
+            {"default" : "c", "schedules" : {"a" : monthly}},
+            {"schedules" : {"a" : dict(monthly, cadence="daily")}},
+            {"schedules" : {"a" : dict(monthly, num_releases=1)}},
+            {"schedules" : {"a" : dict(monthly, initial_release_time="2030-08-26T14:00:00")}},
+            {"schedules" : {"a" : dict(monthly, initial_release_time="2031-08-26T14:00:00+01:00")}},
+            {"schedules" : {"a" : {"cadence" : "explicit", "initial_release_time" : "2030-08-26T14:00:00+01:00", "release_times" : ["2031-01-01T00:00:00+01:00", "2030-12-01T00:00:00+01:00"]}}}]:
+            with self.subTest(definitions):
+                self.assertRaises(ValueError,self.parse,definitions)
+        self.assertRaises(ValueError,ScheduleFile.parse,b'{"schedules" :')
+
+    def test_cache(self):
+        with open(self.schedule_file, 'w') as schedule_file:
+            json.dump(self.definitions, schedule_file)
+        schedules = load_schedule_file(self.schedule_file)
+        self.assertIs(load_schedule_file(self.schedule_file),schedules)
+        with open(self.schedule_file, 'w') as schedule_file:
+            json.dump(dict(self.definitions, default="weekly"), schedule_file)
+        self.assertEqual(load_schedule_file(self.schedule_file).default,"weekly")
+
+    def test_schedule_per_row(self):
+        schedule_file = self.parse(self.definitions)
+        schedules = schedule_file.release_schedules(self.earliest_release_time)
+        job = make_job(schedules[schedule_file.default], json_output_prefix=os.path.join(self.dir.name, 'serial_'), schedules=schedules)
+        schedule_ids = ['', 'weekly', 'vesting', 'explicit', 'monthly', 'quarterly'] * 3
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},1,{i+1}000,{schedule_id}\n' for i, schedule_id in enumerate(schedule_ids))
+            csvfile.write(f'{self.sender},{self.receiver},1,2\n')
+        totals = TransferTotals()
+        self.assertEqual(generate(self.csv_file, ',', job, totals=totals),19)
+        generate(self.csv_file, ',', dict(job, json_output_prefix=os.path.join(self.dir.name, 'parallel_')), 2)
+        output = {}
+        for name in os.listdir(self.dir.name):
+            if name.endswith('.json') and name != 'schedules.json':
+                with open(os.path.join(self.dir.name, name)) as pre_proposal_file:
+                    output[name] = json.load(pre_proposal_file)["payload"]["schedule"]
+        for i, schedule_id in enumerate(schedule_ids + ['']):
+            with self.subTest(i):
+                schedule = schedules[schedule_id or "monthly"]
+                self.assertEqual([release["timestamp"] for release in output[f'serial_{i+1:03}.json']],list(schedule.timestamps))
+                self.assertEqual(output[f'parallel_{i+1:03}.json'],output[f'serial_{i+1:03}.json'])
+        self.assertEqual(totals.releases,sum(len(schedule) for schedule in output.values()) // 2)
+        #Unknown schedule ids and schedule ids without a schedule file are rejected
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.write(f'{self.sender},{self.receiver},1,2,daily\n')
+        self.assertRaises(ValueError,generate,self.csv_file,',',job)
+        self.assertRaises(ValueError,generate,self.csv_file,',',dict(job, schedules=None))
+
 class TestAmountToScheduledList(unittest.TestCase):
 
     def test_valid_amounts(self):
@@ -254,6 +580,881 @@ class TestAmountToScheduledList(unittest.TestCase):
 
 
 
+class TestParallelGeneration(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.job = make_job(regular_schedule(10), json_output_prefix=os.path.join(self.dir.name, 'parallel_'))
+
+    def write_csv(self, rows):
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(rows)
+
+    def read_output(self, prefix):
+        return {name[len(prefix):]: open(os.path.join(self.dir.name, name), 'rb').read() for name in os.listdir(self.dir.name) if name.startswith(prefix)}
+
+    def test_identical_to_serial(self):
+        self.write_csv([f'{self.sender},{self.receiver},"{i},000.5","{i*7}.000001"\n' for i in range(1,26)])
+        scheduled = schedule_transfers(csv_to_list(self.csv_file,False,'.',',',','), False, 10, self.job["skipped_releases"])
+        for transfer_number, pre_proposal in build_pre_proposals(scheduled, self.job["release_timestamps"], self.job["expiry"]):
+            pre_proposal.write_json(output_file_name(os.path.join(self.dir.name, 'serial_'), transfer_number))
+        self.assertEqual(generate_in_parallel(self.csv_file, ',', self.job, 2, chunk_size=4), 25)
+        serial = self.read_output('serial_')
+        self.assertEqual(len(serial),25)
+        self.assertEqual(self.read_output('parallel_'),serial)
+
+    def test_template_identical_to_serial(self):
+        self.write_csv([f'{self.sender},{self.receiver},"{i},000.5","{i*7}.000001"\n' for i in range(1,26)])
+        self.job["serializer"] = "json"
+        generate(self.csv_file, ',', dict(self.job, json_output_prefix=os.path.join(self.dir.name, 'serial_')))
+        self.job["serializer"] = "template"
+        generate(self.csv_file, ',', self.job)
+        generate(self.csv_file, ',', self.job, 2)
+        self.assertEqual(self.read_output('parallel_'),self.read_output('serial_'))
+
+    def test_invalid_row_number(self):
+        rows = [f'{self.sender},{self.receiver},1,1\n'] * 12
+        rows[10] = f'{self.sender},{self.receiver},1,-1\n'
+        self.write_csv(rows)
+        with self.assertRaisesRegex(ValueError,'In row 11:'):
+            generate_in_parallel(self.csv_file, ',', self.job, 2, chunk_size=4)
+        self.assertEqual(self.read_output('parallel_'),{})
+
+    def test_unsplittable_row_number(self):
+        self.write_csv([f'{self.sender},{self.receiver},1,1\n', f'{self.sender},{self.receiver},1,0.000001\n'])
+        with self.assertRaisesRegex(ValueError,'In row 2: Cannot split 1 into 9 parts'):
+            generate_in_parallel(self.csv_file, ',', self.job, 2, chunk_size=1)
+        self.assertEqual(self.read_output('parallel_'),{})
+
+    def test_parse_rows(self):
+        rows = [(i, [self.sender, self.receiver, str(i), '1']) for i in range(1,6)]
+        self.assertEqual(parse_rows(rows, False, '.', ','),[parse_row(row_number, row_data, False, '.', ',') for row_number, row_data in rows])
+        #The first invalid row is reported, as by parse_row
+        rows[3] = (4, [self.sender, 'invalid', '1', '1'])
+        rows[1] = (2, [self.sender, self.receiver, '1'])
+        with self.assertRaisesRegex(ValueError,'Row 2 contains 3'):
+            parse_rows(rows, False, '.', ',')
+        rows[1] = (2, ['invalid', self.receiver, '1', '1'])
+        with self.assertRaisesRegex(ValueError,'Invalid sender address "invalid" in row 2'):
+            parse_rows(rows, False, '.', ',')
+        rows[1] = (2, [self.sender, self.receiver, '1', '1.0000001'])
+        with self.assertRaisesRegex(ValueError,'In row 2: "1.0000001" is not a valid amount string'):
+            parse_rows(rows, False, '.', ',')
+        #Welcome transfers and schedule ids
+        welcome = [(i, [self.sender, self.receiver, f'{i},000']) for i in range(1,4)]
+        self.assertEqual(parse_rows(welcome, True, '.', ','),[parse_row(row_number, row_data, True, '.', ',') for row_number, row_data in welcome])
+        scheduled = [(1, [self.sender, self.receiver, '1', '2', 'a']), (2, [self.sender, self.receiver, '1', '2', ''])]
+        self.assertEqual([transfer.get("schedule") for transfer in parse_rows(scheduled, False, '.', ',', {'a'})],['a', None])
+        welcome[2] = (3, [self.sender, self.receiver, '0'])
+        with self.assertRaisesRegex(ValueError,'In row 3: Amount 0 not in valid range'):
+            parse_rows(welcome, True, '.', ',')
+
+    def test_validate_rows_addresses(self):
+        rows = [(i, [self.sender, self.receiver, '1', '1']) for i in range(1,9)]
+        address_validator.cache.clear()
+        (num_rows, error, hits, misses, _) = validate_rows(rows, self.job)
+        #Each distinct address of the chunk is looked up once
+        self.assertEqual((num_rows, error, hits, misses),(8, None, 0, 2))
+
+class TestSplitSchedules(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.job = make_job(regular_schedule(12), json_output_prefix=os.path.join(self.dir.name, 'split_'), max_releases=5)
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},{i},{i*11}.000001\n' for i in range(1,4))
+
+    def read_output(self, prefix):
+        return {name[len(prefix):]: open(os.path.join(self.dir.name, name), 'rb').read() for name in os.listdir(self.dir.name) if name.startswith(prefix)}
+
+    def test_limits(self):
+        self.assertEqual(releases_per_pre_proposal(),MAX_SCHEDULE_LENGTH)
+        self.assertEqual(releases_per_pre_proposal(10, scheduled_transfer_payload_size(4) + 15),4)
+        self.assertRaises(ValueError,releases_per_pre_proposal,MAX_SCHEDULE_LENGTH + 1)
+        self.assertRaises(ValueError,releases_per_pre_proposal,10,scheduled_transfer_payload_size(1) - 1)
+        self.assertEqual([num_parts(n, 5) for n in [1,5,6,10,11]],[1,1,2,2,3])
+        self.assertEqual(num_parts(1000, None),1)
+        self.assertEqual(output_file_names('p_', 7, 3, 12)[0],'p_007-01.json')
+        self.assertEqual(output_file_names('p_', 7),['p_007.json'])
+
+    def test_split(self):
+        self.assertEqual(generate(self.csv_file, ',', self.job),3)
+        output = self.read_output('split_')
+        self.assertEqual(sorted(output),[f'{i:03}-{part}.json' for i in range(1,4) for part in range(1,4)])
+        for i in range(1,4):
+            with self.subTest(i):
+                parts = [json.loads(output[f'{i:03}-{part}.json'])["payload"]["schedule"] for part in range(1,4)]
+                self.assertEqual([len(part) for part in parts],[5,5,2])
+                releases = [release for part in parts for release in part]
+                self.assertEqual([release["timestamp"] for release in releases],list(self.job["release_timestamps"]))
+                self.assertEqual(sum(int(release["amount"]) for release in releases),i*12000000 + 1)
+        #Templates, parallel workers and bundles write the same parts
+        generate(self.csv_file, ',', dict(self.job, serializer="template", json_output_prefix=os.path.join(self.dir.name, 'template_')))
+        self.assertEqual(self.read_output('template_'),output)
+        generate(self.csv_file, ',', dict(self.job, json_output_prefix=os.path.join(self.dir.name, 'parallel_')), 2)
+        self.assertEqual(self.read_output('parallel_'),output)
+        for jobs in [1,2]:
+            generate(self.csv_file, ',', dict(self.job, json_output_prefix=os.path.join(self.dir.name, f'bundle{jobs}_')), jobs, output_format="zip")
+            with zipfile.ZipFile(os.path.join(self.dir.name, f'bundle{jobs}.zip')) as bundle:
+                self.assertEqual(bundle.namelist(),[f'bundle{jobs}_{name}' for name in sorted(output)])
+
+    def test_resume(self):
+        manifest = Manifest(os.path.join(self.dir.name, 'split.manifest.jsonl'), self.job)
+        generate(self.csv_file, ',', manifest.load(self.job), manifest=manifest)
+        manifest = Manifest(os.path.join(self.dir.name, 'split.manifest.jsonl'), self.job)
+        job = manifest.load(self.job)
+        generate(self.csv_file, ',', job, manifest=manifest)
+        self.assertEqual(manifest.reused,3)
+        #Parts of another split are replaced
+        manifest = Manifest(os.path.join(self.dir.name, 'split.manifest.jsonl'), self.job)
+        generate(self.csv_file, ',', dict(manifest.load(self.job), max_releases=6), manifest=manifest)
+        self.assertEqual(manifest.reused,0)
+        self.assertEqual(sorted(name for name in self.read_output('split_') if name.endswith('.json')),[f'{i:03}-{part}.json' for i in range(1,4) for part in range(1,3)])
+
+class TestValidateOnly(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.job = make_job(regular_schedule(10), json_output_prefix=os.path.join(self.dir.name, 'validate_'))
+        rows = [f'{self.sender},{self.receiver},{i},{i}.5\n' for i in range(1,41)]
+        rows[4] = f'{self.sender},invalid,1,1\n'
+        rows[9] = f'{self.sender},{self.receiver},1\n'
+        rows[19] = f'invalid,{self.receiver},1.0000001,"1,00"\n'
+        rows[29] = f'{self.sender},{self.receiver},1,0.000001\n'
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(rows)
+
+    def test_collect_all_errors(self):
+        report = validate_csv_file(self.csv_file, ',', self.job)
+        self.assertEqual((report.rows, report.invalid_rows, report.num_errors),(40, 4, 6))
+        self.assertFalse(report.is_valid())
+        self.assertEqual([(error.row, error.column, error.value) for error in report.errors],
+            [(5, 2, 'invalid'), (10, None, None), (20, 1, 'invalid'), (20, 3, '1.0000001'), (20, 4, '1,00'), (30, None, None)])
+        self.assertEqual(report.errors[1].reason,"Row contains 3 entries, expected 4.")
+        self.assertEqual(report.errors[0].reason,"Invalid receiver address.")
+        #The same report is built by parallel workers
+        self.assertEqual(validate_csv_file(self.csv_file, ',', self.job, jobs=2, chunk_size=7).to_dict(),report.to_dict())
+        #Nothing is written
+        self.assertEqual(os.listdir(self.dir.name),['test.csv'])
+
+    def test_max_errors(self):
+        for jobs in [1,2]:
+            with self.subTest(jobs=jobs):
+                report = validate_csv_file(self.csv_file, ',', self.job, 3, jobs, chunk_size=7)
+                self.assertEqual([error.row for error in report.errors],[5, 10, 20])
+                self.assertEqual(report.to_dict()["errors"],6)
+                self.assertTrue(report.to_dict()["truncated"])
+        self.assertRaises(ValueError,ValidationReport,-1)
+
+    def test_valid_file(self):
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},{i},{i}.5\n' for i in range(1,11))
+        report = validate_csv_file(self.csv_file, ',', self.job)
+        self.assertTrue(report.is_valid())
+        self.assertEqual(report.to_dict(),{"rows" : 10, "invalid_rows" : 0, "errors" : 0, "truncated" : False, "reported_errors" : []})
+
+class TestLibrary(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.schedule = regular_schedule(10)
+        self.expiry = datetime.now() + relativedelta(hours = +2)
+        self.rows = [[self.sender, self.receiver, f'{i},000.5', f'{i*7}.000001'] for i in range(1,13)]
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{sender},{receiver},"{initial}",{remaining}\n' for sender, receiver, initial, remaining in self.rows)
+
+    def test_identical_to_script(self):
+        job = make_job(self.schedule, expiry=self.expiry, json_output_prefix=os.path.join(self.dir.name, 'script_'), max_releases=4)
+        generate(self.csv_file, ',', job)
+        for source in [self.rows, self.csv_file]:
+            with self.subTest(source=type(source)):
+                output = generate_pre_proposals(source, self.schedule, expiry=self.expiry, max_releases=4, serialize=True, json_output_prefix=job["json_output_prefix"])
+                files = {file_name: content for file_name, content in output}
+                self.assertEqual(len(files),36)
+                for file_name, content in files.items():
+                    with open(file_name, 'rb') as json_file:
+                        self.assertEqual(json_file.read(),content)
+
+    def test_pre_proposals(self):
+        pre_proposals = list(generate_pre_proposals(self.rows, self.schedule, expiry=self.expiry, use_template=True))
+        self.assertEqual([transfer_number for transfer_number, _ in pre_proposals],list(range(1,13)))
+        content = json.loads(pre_proposals[0][1].to_json())
+        self.assertEqual(content["payload"]["toAddress"],self.receiver)
+        self.assertEqual(sum(release["amount"] for release in content["payload"]["schedule"]),1000500000 + 7000001)
+        earliest_release_time = datetime.combine(date.today(), time.fromisoformat("14:00:00+01:00")) + relativedelta(days = +1)
+        welcome = ReleaseSchedule.welcome(datetime.fromisoformat("1970-08-26T14:00:00+01:00"), earliest_release_time)
+        self.assertEqual(welcome.timestamps,(int(earliest_release_time.timestamp())*1000,))
+        (_, pre_proposal) = next(generate_pre_proposals([row[:3] for row in self.rows], welcome, is_welcome=True))
+        self.assertEqual(json.loads(pre_proposal.to_json())["payload"]["schedule"],[{"amount" : 1000500000, "timestamp" : welcome.timestamps[0]}])
+
+    def test_errors(self):
+        rows = self.rows + [[self.sender, 'invalid', '1', '1'], [self.sender, self.receiver, '1', '0.000001']]
+        with self.assertRaises(InvalidRowsError) as context:
+            generate_pre_proposals(rows, self.schedule)
+        self.assertIsInstance(context.exception,ValueError)
+        self.assertEqual([(error.row, error.column) for error in context.exception.report.errors],[(13, 2), (14, None)])
+        self.assertEqual(str(context.exception),'2 of 14 rows are invalid. Row 13, column 2 ("invalid"): Invalid receiver address.')
+        missing = os.path.join(self.dir.name, 'missing.csv')
+        with self.assertRaises(ReadError) as context:
+            generate_pre_proposals(missing, self.schedule)
+        self.assertIsInstance(context.exception,IOError)
+        self.assertTrue(str(context.exception).startswith(f'Error reading file "{missing}": '))
+        self.assertRaises(ValueError,generate_pre_proposals,self.rows,self.schedule,decimal_sep=',')
+
+    def test_unreadable_files(self):
+        not_utf8 = os.path.join(self.dir.name, 'latin1.csv')
+        with open(not_utf8, 'wb') as csvfile:
+            csvfile.write(f'{self.sender},{self.receiver},1,1\n{self.sender},{self.receiver},"1,000.5",Ø\n'.encode('latin-1'))
+        invalid = os.path.join(self.dir.name, 'invalid.xlsx')
+        with zipfile.ZipFile(invalid, 'w') as workbook:
+            workbook.writestr('xl/workbook.xml', 'not xml')
+        for filename in [not_utf8, invalid]:
+            with self.subTest(filename=filename):
+                with self.assertRaises(ReadError) as context:
+                    generate_pre_proposals(filename, self.schedule)
+                self.assertTrue(str(context.exception).startswith(f'Error reading file "{filename}": '))
+
+    def test_streamed_file(self):
+        #The rows are not kept after the validation, the file is read again while iterating
+        output = generate_pre_proposals(self.csv_file, self.schedule, expiry=self.expiry)
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{sender},{receiver},"{initial}",{remaining}\n' for sender, receiver, initial, remaining in self.rows[:2])
+        self.assertEqual([transfer_number for transfer_number, _ in output],[1, 2])
+
+class TestWatch(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        #Output files are written to the current folder
+        self.enter_dir()
+        self.folder = os.path.join(self.dir.name, 'drop')
+        os.mkdir(self.folder)
+        self.job = make_job(regular_schedule(10))
+
+    def write_csv(self, name, num_rows):
+        with open(os.path.join(self.folder, name), 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},{i},{i}.5\n' for i in range(1, num_rows + 1))
+
+    def test_folder_watcher(self):
+        watcher = FolderWatcher(self.folder)
+        self.write_csv('a.csv', 2)
+        self.assertEqual(watcher.poll(),[])
+        self.assertEqual(watcher.poll(),[os.path.join(self.folder, 'a.csv')])
+        self.assertEqual(watcher.poll(),[])
+        #Files are only ready once they are unchanged between two polls
+        self.write_csv('b.csv', 2)
+        watcher.poll()
+        self.write_csv('b.csv', 3)
+        self.assertEqual(watcher.poll(),[])
+        self.assertEqual(watcher.poll(),[os.path.join(self.folder, 'b.csv')])
+        #Files with a newer completion marker were already processed
+        write_complete_marker(output_prefix('a.csv'), 2, 2)
+        watcher = FolderWatcher(self.folder)
+        watcher.poll()
+        self.assertEqual(watcher.poll(),[os.path.join(self.folder, 'b.csv')])
+
+    def test_watch(self):
+        self.write_csv('a.csv', 3)
+        self.write_csv('b.csv', 5)
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                with open(os.path.join(self.folder, 'bad.csv'), 'w') as csvfile:
+                    csvfile.write('invalid\n')
+                results = list(watch(self.folder, ',', lambda: self.job, 'status.json', jobs, poll_interval=0, polls=2))
+                #With several jobs, the results are yielded as the files complete
+                self.assertEqual(sorted((os.path.basename(result['input_csv']), result['transfers'], result['exit_code']) for result in results),
+                    [('a.csv', 3, 0), ('b.csv', 5, 0), ('bad.csv', 0, 2)])
+                with open(complete_marker_name(output_prefix('b.csv'))) as marker_file:
+                    self.assertEqual(json.load(marker_file)["files"],5)
+                self.assertFalse(os.path.exists(complete_marker_name(output_prefix('bad.csv'))))
+                with open('status.json') as status_file:
+                    status = json.load(status_file)
+                self.assertEqual((status["files"], status["failed"], status["pending"], status["transfers"]),(3, 1, 0, 8))
+                self.assertEqual(len(status["recent"]),3)
+                self.assertGreater(status["transfers_per_second"],0)
+                self.assertIsNotNone(status["latency_seconds"]["max"])
+                #Failed files are moved aside, and processed files are skipped after a restart
+                self.assertEqual(os.listdir(os.path.join(self.folder, WATCH_FAILED_FOLDER)),['bad.csv'])
+                self.assertEqual([result['moved_to'] for result in results if result['error'] is not None],[os.path.join(self.folder, WATCH_FAILED_FOLDER, 'bad.csv')])
+                self.assertEqual(list(watch(self.folder, ',', lambda: self.job, 'status.json', jobs, poll_interval=0, polls=2)),[])
+                os.remove(complete_marker_name(output_prefix('a.csv')))
+                os.remove(complete_marker_name(output_prefix('b.csv')))
+
+    def test_failed_file_does_not_stop_watch(self):
+        failed = os.path.join(self.folder, WATCH_FAILED_FOLDER, 'a.csv')
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                #The remaining amount of the first file cannot be split into the releases
+                with open(os.path.join(self.folder, 'a.csv'), 'w') as csvfile:
+                    csvfile.write(f'{self.sender},{self.receiver},1,0.000001\n')
+                self.write_csv('b.csv', 2)
+                results = list(watch(self.folder, ',', lambda: self.job, 'status.json', jobs, poll_interval=0, polls=2))
+                self.assertEqual(sorted((os.path.basename(result['input_csv']), result['exit_code']) for result in results),[('a.csv', 2), ('b.csv', 0)])
+                self.assertEqual(os.listdir(os.path.join(self.folder, WATCH_FAILED_FOLDER)),['a.csv'])
+                self.assertTrue(os.path.exists(complete_marker_name(output_prefix('b.csv'))))
+                self.assertFalse(os.path.exists(output_file_name(output_prefix('a.csv'), 1)))
+                os.remove(failed)
+                os.remove(os.path.join(self.folder, 'b.csv'))
+                os.remove(complete_marker_name(output_prefix('b.csv')))
+        #Unexpected errors are also limited to their file
+        self.write_csv('a.csv', 2)
+        with patch('proposal_generator.generate', side_effect=AssertionError('failed')):
+            results = list(watch(self.folder, ',', lambda: self.job, 'status.json', poll_interval=0, polls=2))
+        self.assertEqual([(result['exit_code'], result['error'], result['moved_to']) for result in results],[(1, 'Error: AssertionError: failed', failed)])
+
+    def test_watch_jobs(self):
+        earliest_release_time = next_earliest_release_time()
+        config = {
+            "num_releases" : 10,
+            "welcome_release_time" : datetime.fromisoformat("1970-08-26T14:00:00+01:00"),
+            "initial_release_time" : datetime.fromisoformat("2021-08-26T14:00:00+01:00"),
+            "first_rem_release_time" : datetime.fromisoformat("2021-09-26T14:00:00+01:00")
+        }
+        jobs = WatchJobs(self.job, config, None, earliest_release_time - relativedelta(days = +1))
+        job = jobs.current()
+        (schedule, _) = run_release_schedules(config, None, False, earliest_release_time)
+        self.assertEqual(job["release_timestamps"],schedule.timestamps)
+        self.assertGreater(job["expiry"],self.job["expiry"])
+        self.assertIs(jobs.current()["release_timestamps"],job["release_timestamps"])
+
+class TestXlsx(FileTestCase):
+
+    main_ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    relationships_ns = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+    #Write a workbook whose first sheet contains rows, given by row number. Strings are shared strings,
+    #except those starting with "inline:", and numbers are given as stored by Excel.
+    def write_xlsx(self, name, rows):
+        strings = []
+        xml_rows = []
+        for row_number, cells in rows.items():
+            xml_cells = []
+            for column, value in enumerate(cells):
+                reference = f'{chr(ord("A") + column)}{row_number}'
+                if value is None:
+                    continue
+                if isinstance(value, str) and value.startswith('inline:'):
+                    xml_cells.append(f'<c r="{reference}" t="inlineStr"><is><t>{value[7:]}</t></is></c>')
+                elif isinstance(value, str):
+                    strings.append(value)
+                    xml_cells.append(f'<c r="{reference}" t="s"><v>{len(strings) - 1}</v></c>')
+                else:
+                    xml_cells.append(f'<c r="{reference}" s="1"><v>{value}</v></c>')
+            xml_rows.append(f'<row r="{row_number}">{"".join(xml_cells)}</row>')
+        filename = os.path.join(self.dir.name, name)
+        with zipfile.ZipFile(filename, 'w') as workbook:
+            workbook.writestr('xl/workbook.xml', f'<workbook xmlns="{self.main_ns}" xmlns:r="{self.relationships_ns}"><sheets>'
+                '<sheet name="Transfers" sheetId="1" r:id="rId2"/><sheet name="Other" sheetId="2" r:id="rId1"/></sheets></workbook>')
+            workbook.writestr('xl/_rels/workbook.xml.rels', '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/><Relationship Id="rId2" Target="worksheets/sheet2.xml"/></Relationships>')
+            workbook.writestr('xl/worksheets/sheet1.xml', f'<worksheet xmlns="{self.main_ns}"><sheetData/></worksheet>')
+            workbook.writestr('xl/worksheets/sheet2.xml', f'<worksheet xmlns="{self.main_ns}"><sheetData>{"".join(xml_rows)}</sheetData></worksheet>')
+            workbook.writestr('xl/sharedStrings.xml', f'<sst xmlns="{self.main_ns}">' +
+                "".join(f'<si><r><t>{string[:3]}</t></r><r><t>{string[3:]}</t></r></si>' for string in strings) + '</sst>')
+        return filename
+
+    def test_rows(self):
+        filename = self.write_xlsx('transfers.xlsx', {
+            1 : [self.sender, self.receiver, 1000, 20.5],
+            2 : [self.sender, 'inline:' + self.receiver, 1000.0000009999999, '1,000.5', None],
+            4 : [self.sender, self.receiver, 1.5E-5, 1E+3],
+            5 : [None, None]
+        })
+        self.assertTrue(is_xlsx_file(filename))
+        self.assertEqual(list(read_csv_rows(filename, ';')),[
+            (1, [self.sender, self.receiver, '1000', '20.5']),
+            (2, [self.sender, self.receiver, '1000.000001', '1,000.5']),
+            (4, [self.sender, self.receiver, '0.000015', '1000'])
+        ])
+        #Numbers use the configured decimal separator
+        self.assertEqual(list(read_xlsx_rows(filename, ','))[0][1][3],'20,5')
+        self.assertEqual([xlsx_column(reference) for reference in ['A1', 'D7', 'AA10']],[0, 3, 26])
+
+    def test_inexact_numbers(self):
+        self.assertEqual(xlsx_number('1000000000.000001', '.'),'1000000000.000001')
+        self.assertEqual(xlsx_number('8000000000.0000019', '.'),'8000000000.000002')
+        self.assertEqual(xlsx_number('1E+20', '.'),'100000000000000000000')
+        #More than 6 decimals, or a number that stands for several amounts
+        for value in ['1.0000005', '0.1234567', '9000000000.0000019']:
+            with self.subTest(value=value):
+                self.assertRaisesRegex(ValueError,'enter it as text',xlsx_number,value, '.')
+        filename = self.write_xlsx('transfers.xlsx', {
+            1 : [self.sender, self.receiver, 1000, 20.5],
+            3 : [self.sender, self.receiver, 1000, 1.0000005]
+        })
+        self.assertRaisesRegex(ValueError,'In row 3, cell D3: The number 1.0000005',list,read_xlsx_rows(filename))
+        #The library reports them as invalid rows
+        with self.assertRaises(InvalidRowsError) as context:
+            generate_pre_proposals(filename, regular_schedule(10))
+        [error] = context.exception.report.errors
+        self.assertEqual((error.row, error.column, error.value),(3, 4, '1.0000005'))
+        self.assertRegex(error.reason,'enter it as text')
+
+    def test_duplicate_row_numbers(self):
+        #Duplicates are reported with their rows in the workbook, which has empty rows, by every path
+        filename = self.write_xlsx('transfers.xlsx', {
+            2 : [self.sender, self.receiver, 1, 2],
+            3 : [self.receiver, self.sender, 1, 2],
+            6 : [self.sender, self.receiver, 1, 2]
+        })
+        job = make_job(json_output_prefix=os.path.join(self.dir.name, 'out_'))
+        for (jobs, stream) in [(1, False), (1, True), (2, False)]:
+            with self.subTest(jobs=jobs, stream=stream):
+                with self.assertRaisesRegex(ValueError, "in rows 2, 6\\."):
+                    generate(filename, ',', job, jobs, stream, duplicates=DuplicateIndex("reject"))
+        index = DuplicateIndex("merge")
+        rows = list(index.index(iter_csv_transfers(filename,False,'.',',',',')))
+        index.collect(rows)
+        self.assertEqual([transfer["receiver_address"] for transfer in index.deduplicate(rows)],[self.receiver, self.sender])
+
+    def test_same_validation_as_csv(self):
+        filename = self.write_xlsx('transfers.xlsx', {row_number : [self.sender, self.receiver, row_number, row_number * 7.25] for row_number in range(1, 6)})
+        csv_file = os.path.join(self.dir.name, 'transfers.csv')
+        with open(csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},{i},{i * 7.25}\n' for i in range(1, 6))
+        self.assertEqual([transfer["remaining_amount"].get_micro_GTU() for transfer in csv_to_list(filename, False, '.', ',', ',')],
+            [transfer["remaining_amount"].get_micro_GTU() for transfer in csv_to_list(csv_file, False, '.', ',', ',')])
+        invalid = self.write_xlsx('invalid.xlsx', {1 : [self.sender, self.receiver, 1, 1], 3 : [self.sender, self.receiver, -1, 1]})
+        self.assertRaisesRegex(ValueError,'In row 3',csv_to_list,invalid, False, '.', ',', ',')
+
+    def test_parallel_numbering(self):
+        #Row 4 is empty, so the transfer of row 5 is the third one in both a serial and a parallel run
+        filename = self.write_xlsx('transfers.xlsx', {row_number : [self.sender, self.receiver, row_number, row_number] for row_number in [2, 3, 5]})
+        job = make_job(json_output_prefix=os.path.join(self.dir.name, 'serial_'))
+        self.assertEqual(generate(filename, ',', job),3)
+        self.assertEqual(generate_in_parallel(filename, ',', dict(job, json_output_prefix=os.path.join(self.dir.name, 'parallel_')), 2, chunk_size=1),3)
+        for i in range(1,4):
+            with open(output_file_name(os.path.join(self.dir.name, 'serial_'), i),'rb') as serial, open(output_file_name(os.path.join(self.dir.name, 'parallel_'), i),'rb') as parallel:
+                self.assertEqual(serial.read(),parallel.read())
+        self.assertFalse(os.path.exists(output_file_name(os.path.join(self.dir.name, 'parallel_'), 5)))
+
+    def test_invalid_workbook(self):
+        filename = os.path.join(self.dir.name, 'invalid.xlsx')
+        with open(filename, 'w') as invalid:
+            invalid.write('not a workbook')
+        self.assertRaises(ValueError,list,read_csv_rows(filename, ','))
+        with zipfile.ZipFile(filename, 'w') as workbook:
+            workbook.writestr('xl/workbook.xml', f'<workbook xmlns="{self.main_ns}"><sheets/></workbook>')
+        self.assertRaises(ValueError,list,read_csv_rows(filename, ','))
+
+class TestFileWriter(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.job = make_job(regular_schedule(3), json_output_prefix=os.path.join(self.dir.name, 'serial_'))
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(f'{self.sender},{self.receiver},{i},{i*3}.000001\n' for i in range(1,30))
+
+    def read_output(self, prefix):
+        return {name[len(prefix):]: open(os.path.join(self.dir.name, name), 'rb').read() for name in os.listdir(self.dir.name) if name.startswith(prefix) and name.endswith('.json')}
+
+    def test_identical_to_serial(self):
+        generate(self.csv_file, ',', self.job)
+        output = self.read_output('serial_')
+        for (jobs, sync) in [(1, False), (1, True), (2, False)]:
+            with self.subTest(jobs=jobs, sync=sync):
+                prefix = f'threads{jobs}{sync}_'
+                job = dict(self.job, json_output_prefix=os.path.join(self.dir.name, prefix))
+                self.assertEqual(generate(self.csv_file, ',', job, jobs, writer=FileWriter(3, sync)),29)
+                self.assertEqual(self.read_output(prefix),output)
+                with open(complete_marker_name(job["json_output_prefix"])) as marker_file:
+                    marker = json.load(marker_file)
+                self.assertEqual((marker["transfers"], marker["files"]),(29, 29))
+
+    def test_stale_marker_removed(self):
+        job = dict(self.job, json_output_prefix=os.path.join(self.dir.name, 'stale_'))
+        generate(self.csv_file, ',', job, writer=FileWriter(2))
+        marker_name = complete_marker_name(job["json_output_prefix"])
+        self.assertTrue(os.path.exists(marker_name))
+        with open(self.csv_file, 'a') as csvfile:
+            csvfile.write('invalid,row,1,1\n')
+        self.assertRaises(ValueError,generate,self.csv_file, ',', job, writer=FileWriter(2))
+        self.assertFalse(os.path.exists(marker_name))
+
+    def test_write_error(self):
+        writer = FileWriter(2)
+        missing = os.path.join(self.dir.name, 'missing', 'file.json')
+        writer.submit(missing, '{}')
+        with self.assertRaises(WriteError) as context:
+            writer.close()
+        self.assertEqual(str(context.exception),f'Error writing file "{missing}".')
+        self.assertEqual(context.exception.path,missing)
+        job = dict(self.job, json_output_prefix=os.path.join(self.dir.name, 'missing', 'out_'))
+        self.assertRaises(WriteError,generate,self.csv_file, ',', job, writer=FileWriter(2))
+        self.assertRaises(ValueError,generate,self.csv_file, ',', self.job, output_format="zip", writer=FileWriter(2))
+
+class TestOutputFormats(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines([f'{self.sender},{self.receiver},{i}.5\n' for i in range(1,13)])
+        self.job = make_job(is_welcome=True, num_releases=1, release_timestamps=release_timestamps([datetime.fromisoformat("2030-08-26T14:00:00+01:00")]), json_output_prefix=os.path.join(self.dir.name, 'pre-proposal_test_'))
+
+    def test_file_number_width(self):
+        self.assertEqual(output_file_name('p_', 7, file_number_width(12)),'p_007.json')
+        self.assertEqual(output_file_name('p_', 7, file_number_width(1000)),'p_0007.json')
+        self.assertEqual(output_file_name('p_', 1000, file_number_width(1000)),'p_1000.json')
+
+    def test_abstract_bundle(self):
+        #A bundle without _close_file fails when it is created, before anything is written
+        class IncompleteBundle(PreProposalBundle):
+            def add(self, name, content):
+                pass
+        self.assertRaises(TypeError,IncompleteBundle,os.path.join(self.dir.name, 'bundle'))
+        self.assertRaises(TypeError,PreProposalBundle,os.path.join(self.dir.name, 'bundle'))
+
+    def test_jsonl(self):
+        self.assertEqual(generate(self.csv_file, ',', self.job, output_format="jsonl"), 12)
+        with open(os.path.join(self.dir.name, 'pre-proposal_test.jsonl')) as bundle:
+            lines = bundle.read().splitlines()
+        self.assertEqual(len(lines),12)
+        self.assertNotIn(' ',lines[0])
+        self.assertEqual(json.loads(lines[4])["payload"]["schedule"][0]["amount"],5500000)
+        self.assertEqual(sorted(os.listdir(self.dir.name)),['pre-proposal_test.jsonl','test.csv'])
+
+    def test_zip_matches_json_files(self):
+        generate(self.csv_file, ',', self.job, output_format="zip")
+        generate(self.csv_file, ',', self.job)
+        with zipfile.ZipFile(os.path.join(self.dir.name, 'pre-proposal_test.zip')) as archive:
+            self.assertEqual(len(archive.namelist()),12)
+            for name in archive.namelist():
+                with open(os.path.join(self.dir.name, name),'rb') as json_file:
+                    self.assertEqual(archive.read(name),json_file.read())
+
+    def test_invalid_row_leaves_no_bundle(self):
+        with open(self.csv_file, 'a') as csvfile:
+            csvfile.write(f'{self.sender},{self.receiver},0\n')
+        self.assertRaises(ValueError, generate, self.csv_file, ',', self.job, output_format="tar")
+        self.assertEqual(os.listdir(self.dir.name),['test.csv'])
+
+class TestManifest(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.prefix = os.path.join(self.dir.name, 'pre-proposal_test_')
+        self.job = make_job(is_welcome=True, num_releases=1, release_timestamps=(1000,), json_output_prefix=self.prefix)
+
+    def run_resumable(self, amounts, job = None):
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines([f'{self.sender},{self.receiver},{amount}\n' for amount in amounts])
+        manifest = Manifest(self.prefix[:-1] + '.manifest.jsonl', job or self.job)
+        job = manifest.load(job or self.job)
+        self.assertEqual(generate(self.csv_file, ',', job, manifest=manifest), len(amounts))
+        return manifest
+
+    def test_resume(self):
+        self.assertEqual(self.run_resumable(['1','2','3','4']).reused,0)
+        with open(output_file_name(self.prefix, 2),'w') as modified:
+            modified.write('{}')
+        os.remove(output_file_name(self.prefix, 3))
+        #Row 4 changed, row 2 and 3 must be rewritten
+        manifest = self.run_resumable(['1','2','3','5'], dict(self.job, expiry=datetime.now() + relativedelta(hours = +3)))
+        self.assertEqual(manifest.reused,1)
+        #The expiry of the first run is kept
+        self.assertEqual(manifest.expiry,self.job["expiry"])
+        for i, amount in enumerate([1,2,3,5], start=1):
+            with open(output_file_name(self.prefix, i)) as out_file:
+                pre_proposal = json.load(out_file)
+            self.assertEqual(pre_proposal["payload"]["schedule"][0]["amount"],amount*1000000)
+            self.assertEqual(pre_proposal["expiry"]["value"],int(self.job["expiry"].timestamp()))
+        #The file of the removed row is deleted
+        self.assertEqual(self.run_resumable(['1','2']).reused,2)
+        self.assertFalse(os.path.exists(output_file_name(self.prefix, 3)))
+        with open(self.prefix[:-1] + '.manifest.jsonl') as manifest_file:
+            self.assertEqual(len(manifest_file.read().splitlines()),3)
+
+    def test_no_reuse(self):
+        self.run_resumable(['1','2'])
+        #Different parameters
+        self.assertEqual(self.run_resumable(['1','2'], dict(self.job, compact=True)).reused,0)
+        #Expires too soon
+        self.run_resumable(['1','2'], dict(self.job, expiry=datetime.now() + relativedelta(minutes = +RESUME_MIN_VALIDITY_MINUTES-1)))
+        self.assertEqual(self.run_resumable(['1','2']).reused,0)
+
+class TestBatch(FileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        #Output files are written to the current folder
+        self.enter_dir()
+        self.job = make_job()
+
+    def write_csv(self, filename, rows):
+        with open(filename, 'w') as csvfile:
+            csvfile.writelines(rows)
+
+    def test_expand_input_files(self):
+        for name in ['b.csv','a.csv','c.txt']:
+            self.write_csv(name, [])
+        self.assertEqual(expand_input_files(['*.csv','c.txt','missing.csv']),['a.csv','b.csv','c.txt','missing.csv'])
+        self.assertRaises(ValueError,expand_input_files,['*.xlsx'])
+
+    def test_batch(self):
+        self.write_csv('a.csv', [f'{self.sender},{self.receiver},1,2\n'] * 2)
+        self.write_csv('b.csv', [f'{self.sender},{self.receiver},1.5,0.000002\n'])
+        self.write_csv('c.csv', [f'{self.sender},{self.receiver},1\n'])
+        for jobs in [1,2]:
+            with self.subTest(jobs):
+                results = generate_batch(['a.csv','b.csv','c.csv'], ',', self.job, jobs)
+                self.assertEqual([result["transfers"] for result in results],[2,1,0])
+                self.assertEqual([result["exit_code"] for result in results],[0,0,2])
+                self.assertEqual(results[0]["amount"],6000000)
+                self.assertEqual(results[1]["releases"],3)
+                self.assertEqual(batch_report(results)["total"],{"files" : 3, "failed" : 1, "transfers" : 3, "releases" : 9, "amount" : 7500002})
+                self.assertEqual(sorted(name for name in os.listdir() if name.endswith('.json')),
+                    ['pre-proposal_a_001.json','pre-proposal_a_002.json','pre-proposal_b_001.json'])
+
+    def test_failed_file_does_not_stop_batch(self):
+        self.write_csv('a.csv', [f'{self.sender},{self.receiver},1,0.000001\n'])
+        self.write_csv('b.csv', [f'{self.sender},{self.receiver},1,2\n'])
+        for jobs in [1,2]:
+            with self.subTest(jobs):
+                results = generate_batch(['a.csv','b.csv'], ',', self.job, jobs)
+                self.assertEqual([result["exit_code"] for result in results],[2,0])
+                self.assertEqual(results[0]["error"],'Error: In row 1: Cannot split 1 into 2 parts, amount is too small')
+                self.assertEqual(results[1]["transfers"],1)
+                self.assertEqual(sorted(name for name in os.listdir() if name.endswith('.json')),['pre-proposal_b_001.json'])
+        # unexpected errors are also limited to their file
+        with patch('proposal_generator.generate', side_effect=[AssertionError('failed'), 1]):
+            results = generate_batch(['a.csv','b.csv'], ',', self.job)
+        self.assertEqual([(result["exit_code"], result["error"]) for result in results],[(1,'Error: AssertionError: failed'),(0,None)])
+
+    def test_same_output_prefix(self):
+        os.mkdir('other')
+        self.assertRaises(ValueError,generate_batch,['a.csv',os.path.join('other','a.csv')],',',self.job)
+
+class TestSenderTotals(FileTestCase):
+
+    other_sender = RECEIVER
+    receiver = OTHER_RECEIVER
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.balances_file = os.path.join(self.dir.name, 'balances.csv')
+        self.job = make_job(json_output_prefix=os.path.join(self.dir.name, 'out_'))
+        rows = [f'{self.sender},{self.receiver},1,2\n', f'{self.other_sender},{self.receiver},"1,000",0.000003\n'] * 5
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(rows)
+
+    def output_files(self):
+        return [name for name in os.listdir(self.dir.name) if name.startswith('out_')]
+
+    def test_aggregation(self):
+        totals = TransferTotals()
+        self.assertEqual(generate(self.csv_file, ',', self.job, totals=totals), 10)
+        self.assertEqual(totals.to_dict(), {"transfers" : 10, "releases" : 30, "amount" : 5*3000000 + 5*1000000003})
+        report = totals.report()
+        self.assertEqual(report["senders"][self.sender]["schedule"],
+            [{"timestamp" : 1000, "amount" : 5*1000000}, {"timestamp" : 2000, "amount" : 5*1000000}, {"timestamp" : 3000, "amount" : 5*1000000}])
+        self.assertEqual(report["senders"][self.other_sender]["amount"], 5*1000000003)
+        self.assertEqual(sum(release["amount"] for release in report["schedule"]), report["amount"])
+
+    def test_parallel_and_stream_identical_to_serial(self):
+        serial = TransferTotals()
+        generate(self.csv_file, ',', self.job, totals=serial)
+        balances = {self.sender : 10**12, self.other_sender : 10**12}
+        for (jobs, stream) in [(2, False), (1, True)]:
+            with self.subTest(jobs=jobs, stream=stream):
+                totals = TransferTotals()
+                generate(self.csv_file, ',', self.job, jobs, stream, totals=totals, balances=balances)
+                self.assertEqual(totals.report(), serial.report())
+
+    def test_insufficient_balance(self):
+        with open(self.balances_file, 'w') as csvfile:
+            csvfile.write(f'{self.sender},"1,000,000"\n{self.other_sender},5000.000014\n')
+        balances = read_balances(self.balances_file, '.', ',', ',')
+        self.assertEqual(balances, {self.sender : 10**12, self.other_sender : 5000000014})
+        for (jobs, stream) in [(1, False), (2, False), (1, True)]:
+            with self.subTest(jobs=jobs, stream=stream):
+                with self.assertRaisesRegex(ValueError, self.other_sender):
+                    generate(self.csv_file, ',', self.job, jobs, stream, balances=balances)
+                self.assertEqual(self.output_files(), [])
+        balances[self.other_sender] += 1
+        self.assertEqual(generate(self.csv_file, ',', self.job, balances=balances), 10)
+        self.assertEqual(len(self.output_files()), 10)
+
+    def test_invalid_balances(self):
+        for content in [f'{self.sender}\n', f'{self.sender}x,1\n', f'{self.sender},1\n{self.sender},2\n', f'{self.sender},-1\n']:
+            with self.subTest(content):
+                with open(self.balances_file, 'w') as csvfile:
+                    csvfile.write(content)
+                self.assertRaises(ValueError, read_balances, self.balances_file, '.', ',', ',')
+
+class TestDuplicates(FileTestCase):
+
+    other_sender = RECEIVER
+    receiver = OTHER_RECEIVER
+
+    def setUp(self):
+        super().setUp()
+        self.csv_file = os.path.join(self.dir.name, 'test.csv')
+        self.job = make_job(json_output_prefix=os.path.join(self.dir.name, 'out_'))
+        self.write_csv([
+            f'{self.sender},{self.receiver},1,2\n',
+            f'{self.other_sender},{self.receiver},1,2\n',
+            f'{self.sender},{self.other_sender},1,2\n',
+            f'{self.sender},{self.receiver},0.5,0.000001\n'])
+
+    def write_csv(self, rows):
+        with open(self.csv_file, 'w') as csvfile:
+            csvfile.writelines(rows)
+
+    def read_output(self, prefix):
+        return {name[len(prefix):]: json.load(open(os.path.join(self.dir.name, name))) for name in os.listdir(self.dir.name) if name.startswith(prefix)}
+
+    def test_index(self):
+        index = DuplicateIndex("warn")
+        transfers = list(iter_csv_transfers(self.csv_file,False,'.',',',','))
+        self.assertEqual(list(index.index(transfers)),transfers)
+        self.assertEqual(index.duplicates,{(0,self.receiver) : [1,4]})
+        self.assertEqual(index.num_merged(),0)
+        index.check()
+        self.assertEqual(index.warnings(),[
+            f"Sender {self.sender} sends to receiver {self.receiver} in rows 1, 4.",
+            f"Receiver {self.receiver} receives transfers from 2 senders."])
+        self.assertRaises(ValueError,DuplicateIndex,"ignore")
+
+    def test_validate_merged_totals(self):
+        #Merged transfers are only scheduled once merged, so their totals are not computed while validating
+        self.assertRaisesRegex(ValueError,'once they are merged',validate_csv_transfers,self.csv_file, ',', self.job, TransferTotals(), DuplicateIndex("merge"))
+        self.assertEqual(validate_csv_transfers(self.csv_file, ',', self.job, None, DuplicateIndex("merge")),4)
+
+    def test_reject(self):
+        # the remaining amount of the last row of setUp can only be split once it is merged with the first row
+        self.write_csv([
+            f'{self.sender},{self.receiver},1,2\n',
+            f'{self.other_sender},{self.receiver},1,2\n',
+            f'{self.sender},{self.other_sender},1,2\n',
+            f'{self.sender},{self.receiver},0.5,0.000002\n'])
+        for (jobs, stream) in [(1, False), (1, True), (2, False)]:
+            with self.subTest(jobs=jobs, stream=stream):
+                with self.assertRaisesRegex(ValueError, "rows 1, 4"):
+                    generate(self.csv_file, ',', self.job, jobs, stream, duplicates=DuplicateIndex("reject"))
+                self.assertEqual(self.read_output('out_'),{})
+
+    def test_merge(self):
+        self.assertEqual(generate(self.csv_file, ',', dict(self.job, json_output_prefix=os.path.join(self.dir.name, 'stream_')), stream=True, duplicates=DuplicateIndex("merge")),3)
+        totals = TransferTotals()
+        self.assertEqual(generate(self.csv_file, ',', self.job, totals=totals, balances={self.sender : 10**7, self.other_sender : 10**7}, duplicates=DuplicateIndex("merge")),3)
+        self.assertEqual(totals.to_dict(),{"transfers" : 3, "releases" : 9, "amount" : 9500001})
+        merged = self.read_output('out_')
+        self.assertEqual(self.read_output('stream_'),merged)
+        self.assertEqual(sorted(merged),['001.json','002.json','003.json'])
+        amounts = [int(release["amount"]) for release in merged['001.json']["payload"]["schedule"]]
+        self.assertEqual(amounts,[1500000,1000000,1000001])
+        self.assertEqual(merged['002.json']["sender"],self.other_sender)
+        self.assertRaises(ValueError,generate,self.csv_file,',',self.job,2,duplicates=DuplicateIndex("merge"))
+
+    def test_merge_out_of_range(self):
+        self.write_csv([f'{self.sender},{self.receiver},18446744073709.551615,1\n', f'{self.sender},{self.receiver},1,1\n'])
+        with self.assertRaisesRegex(ValueError, "row 2"):
+            generate(self.csv_file, ',', self.job, duplicates=DuplicateIndex("merge"))
+
+class TestProfiler(FileTestCase):
+
+    def test_nested_stages(self):
+        profiler = StageProfiler()
+        with profiler.stage('outer'):
+            self.assertEqual(list(profiler.iterate('inner', range(3))),[0,1,2])
+        report = profiler.report()
+        self.assertEqual(list(report["stages"]),['outer','inner'])
+        self.assertEqual(report["stages"]["inner"]["rows"],3)
+        self.assertGreaterEqual(report["stages"]["outer"]["wall_time"],0)
+        self.assertLessEqual(sum(stage["wall_time"] for stage in report["stages"].values()),report["wall_time"])
+        self.assertEqual(profiler.running,[])
+
+    def test_null_profiler(self):
+        rows = [1,2]
+        self.assertIs(null_profiler.iterate('read_csv', rows),rows)
+        with null_profiler.stage('write'):
+            pass
+
+    def test_profiled_generate(self):
+        csv_file = os.path.join(self.dir.name, 'test.csv')
+        with open(csv_file, 'w') as csvfile:
+            csvfile.writelines([f'{self.sender},{self.receiver},{i}.5\n' for i in range(1,6)])
+        job = make_job(is_welcome=True, num_releases=1, release_timestamps=(1000,), json_output_prefix=os.path.join(self.dir.name, 'profiled_'))
+        profiler = StageProfiler()
+        self.assertEqual(generate(csv_file, ',', job, profiler=profiler),5)
+        generate(csv_file, ',', dict(job, json_output_prefix=os.path.join(self.dir.name, 'plain_')))
+        for i in range(1,6):
+            with open(output_file_name(os.path.join(self.dir.name, 'profiled_'), i),'rb') as profiled, open(output_file_name(os.path.join(self.dir.name, 'plain_'), i),'rb') as plain:
+                self.assertEqual(profiled.read(),plain.read())
+        stages = profiler.report()["stages"]
+        for stage in ['read_csv','check_addresses','parse_amounts','schedule','build_pre_proposals','write']:
+            self.assertEqual(stages[stage]["rows"],5)
+        self.assertEqual(stages["read_csv"]["bytes"],os.path.getsize(csv_file))
+        self.assertEqual(stages["write"]["bytes"],sum(os.path.getsize(output_file_name(os.path.join(self.dir.name, 'plain_'), i)) for i in range(1,6)))
+
+class TestPreProposal(unittest.TestCase):
+
+    def test_timestamp_table(self):
+        release_times = [datetime.fromisoformat("2021-08-26T14:00:00+01:00") + relativedelta(months = +i) for i in range(3)]
+        timestamps = release_timestamps(release_times)
+        self.assertIsInstance(timestamps,tuple)
+        self.assertEqual(timestamps,tuple(int(t.timestamp())*1000 for t in release_times))
+
+    def test_set_schedule_matches_add_release(self):
+        release_times = [datetime.fromisoformat("2021-08-26T14:00:00+01:00") + relativedelta(months = +i) for i in range(3)]
+        expiry = datetime.now()
+        amounts = AmountSchedule.for_transfer(1000,10,4,1)
+        expected = ScheduledPreProposal('sender','receiver',expiry)
+        for amount, release_time in zip(amounts.to_transfer_amounts(), release_times):
+            expected.add_release(amount, release_time)
+        pre_proposal = ScheduledPreProposal('sender','receiver',expiry)
+        pre_proposal.set_schedule(amounts, release_timestamps(release_times))
+        self.assertEqual(pre_proposal.data,expected.data)
+
+class TestPreProposalTemplate(unittest.TestCase):
+
+    def test_compatible_with_json_dump(self):
+        expiry = datetime.now() + relativedelta(hours = +2)
+        for num_releases in [0,1,2,10,30]:
+            timestamps = tuple(random.randrange(0,2**45) for _ in range(num_releases))
+            template = PreProposalTemplate(expiry, timestamps)
+            for i in range(20):
+                with self.subTest((num_releases,i)):
+                    amounts = AmountSchedule(random.randrange(1,TransferAmount.max_amount) for _ in range(num_releases))
+                    sender = random.choice(['38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE', 'a"b\\c', 'æøå'])
+                    pre_proposal = ScheduledPreProposal(sender, '4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7', expiry)
+                    pre_proposal.set_schedule(amounts, timestamps)
+                    for compact in [False, True]:
+                        rendered = template.render(sender, '4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7', amounts, compact)
+                        self.assertEqual(json.loads(rendered),pre_proposal.data)
+                        self.assertEqual(rendered,pre_proposal.to_json(compact))
+
+    def test_write(self):
+        expiry = datetime.now()
+        template = get_pre_proposal_template(expiry, (1000,2000))
+        self.assertIs(get_pre_proposal_template(expiry, (1000,2000)),template)
+        out_file = io.StringIO()
+        template.write(out_file, 's', 'r', [1,2])
+        self.assertEqual(out_file.getvalue(),template.render('s', 'r', [1,2]))
+
+class TestStartup(unittest.TestCase):
+
+    #Modules that are only imported by the functions using them
+    lazy_modules = ['json', 'csv', 'decimal', 'dateutil', 'base58', 'zipfile', 'tarfile', 'hashlib', 'glob', 'concurrent.futures', 'numpy', 'openpyxl', 'xml']
+
+    def test_startup_imports(self):
+        #Without site-packages, so that third party modules cannot be imported at startup
+        result = subprocess.run([sys.executable, '-S', '-c', 'import sys, proposal_generator; print("\\n".join(sorted(sys.modules)))'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        modules = result.stdout.split()
+        self.assertIn('proposal_generator',modules)
+        for lazy in self.lazy_modules:
+            with self.subTest(lazy):
+                self.assertEqual([module for module in modules if module == lazy or module.startswith(lazy + '.')],[])
+
 class TestMain(unittest.TestCase):
 
     def test_valid_welcome_transfer(self):
@@ -265,7 +1466,7 @@ class TestMain(unittest.TestCase):
                 "amount" : TransferAmount(1000000000)
             }
         ]
-        arguments = argparse.Namespace(welcome=True, input_csv='./test.csv')
+        arguments = build_argument_parser('.',',').parse_args(['./test.csv','--welcome'])
         config = {
 		"num_releases" : 10,
 		"welcome_release_time" : time1,
@@ -314,7 +1515,7 @@ class TestMain(unittest.TestCase):
                 "remaining_amount" : TransferAmount(10)
             }
         ]
-        arguments = argparse.Namespace(welcome=False, input_csv='./test.csv')
+        arguments = build_argument_parser('.',',').parse_args(['./test.csv'])
         config = {
 		"num_releases" : 10,
 		"welcome_release_time" : datetime.fromisoformat("1970-08-26T14:00:00+01:00"),
@@ -354,6 +1555,52 @@ class TestMain(unittest.TestCase):
                             main()
                             mock_call.assert_called_once_with(expected_content, mock_file(),indent=4)
 
+    def test_stream_writes_all_transfers(self):
+        release_test_data = (
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 1,000.000000 "\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 2,000.000000 "\n'
+        )
+        arguments = build_argument_parser('.',',').parse_args(['./test.csv','--welcome','--stream'])
+        with patch('argparse.ArgumentParser.parse_args', return_value=arguments):
+            with patch('builtins.open', new=mock_open(read_data=release_test_data)) as mock_file:
+                with patch('json.dump') as mock_call:
+                    main()
+                    self.assertEqual(mock_call.call_count,2)
+                    self.assertEqual(mock_call.call_args_list[1][0][0]["payload"]["schedule"][0]["amount"],2000000000)
+                    mock_file.assert_any_call('pre-proposal_test_002.json','w')
+
+    def test_stream_invalid_row_writes_nothing(self):
+        release_test_data = ( #second row is bad
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 1,000.000000 "\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4abKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7," 2,000.000000 "\n'
+        )
+        arguments = build_argument_parser('.',',').parse_args(['./test.csv','--welcome','--stream'])
+        with patch('argparse.ArgumentParser.parse_args', return_value=arguments):
+            with patch('builtins.open', new=mock_open(read_data=release_test_data)):
+                with patch('json.dump') as mock_call:
+                    with self.assertRaises(SystemExit) as exit_info:
+                        main()
+                    self.assertEqual(exit_info.exception.code,2)
+                    mock_call.assert_not_called()
+
+    def test_unsplittable_amount_writes_nothing(self):
+        release_test_data = ( #remaining amount of the second row cannot be split into the releases
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7,1000,1000\n'
+            '38Dh9TwGWCieKppVu3ft91bjPvpyt7hWWNdFTRz9P3CCdvYHjE,4QbKSwdnF1PTtN6LqdTfmUt7FQDTToxFVV746ysy7TazZy4zx7,1000,0.000001\n'
+        )
+        for options in [[], ['--stream']]:
+            with self.subTest(options):
+                arguments = build_argument_parser('.',',').parse_args(['./test.csv'] + options)
+                with patch('argparse.ArgumentParser.parse_args', return_value=arguments):
+                    with patch('builtins.open', new=mock_open(read_data=release_test_data)):
+                        with patch('json.dump') as mock_call:
+                            with patch('sys.stdout', new_callable=io.StringIO) as output:
+                                with self.assertRaises(SystemExit) as exit_info:
+                                    main()
+                            self.assertEqual(exit_info.exception.code,2)
+                            self.assertIn('In row 2: Cannot split 1 into 9 parts',output.getvalue())
+                            mock_call.assert_not_called()
+
 if __name__ == '__main__':
     unittest.main()
     
\ No newline at end of file